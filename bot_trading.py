@@ -1,4 +1,3 @@
-import asyncio
 import ccxt.async_support as ccxt
 from trade_executor_core import TradeExecutor
 from trade_executor_signals import execute_trade as execute_trade_signal
@@ -10,7 +9,7 @@ from global_objects import global_trade_pool
 from symbol_filter import filter_symbols
 from config_keys import API_KEYS, PREFERRED_EXCHANGES
 from bot_user_data import user_data, get_user_deposit, get_user_assets, add_user_trade
-from redis_client import get_trades_from_cache, add_trade_to_cache, add_to_problematic_symbols  # Импортируем функции напрямую
+from redis_client import get_trades_from_cache, add_to_problematic_symbols  # Импортируем функции напрямую
 from retraining_manager import retraining_manager
 from backtest_cycle import run_backtest as run_backtest_cycle
 
@@ -178,15 +177,8 @@ async def process_user_symbols(exchange, trade_executor, user_id, ex_name):
                         }
                         # Сохраняем сделку в user_data
                         add_user_trade(user_id, trade_log, signal, strategy_signals)
-                        # Сохраняем сделку в кэш Redis
-                        trade_info = {
-                            'trade': trade_log,
-                            'signal': signal,
-                            'strategies': strategy_signals,
-                            'timestamp': int(asyncio.get_event_loop().time())
-                        }
-                        await add_trade_to_cache(user_id, trade_info)  # Используем функцию напрямую
-                        await global_trade_pool.add_trade(trade_log)
+                        # Сохраняем сделку в общий пул вместе с сигналами для переобучения
+                        await global_trade_pool.add_trade({**trade_log, 'signal': signal, 'strategies': strategy_signals})
                         # Обновляем депозит после сделки
                         await trade_executor.risk_calculator.update_deposit(exchange)
                         logger_main.info(f"Deposit updated for user {user_id} after trade: {trade_executor.risk_calculator.total_deposit_usdt} USDT")
@@ -0,0 +1,234 @@
+import time
+import asyncio
+from collections import Counter
+from logging_setup import logger_main
+from utils import log_exception
+from redis_pool import redis_pool
+from config_settings import CACHE_NAMESPACE_SETTINGS
+
+# Accounts a value stored under a key in its namespace and drops sampled entries from the namespace's accounting
+# while it is over budget; returns the dropped keys. The caller stores the value and deletes the dropped entries:
+# a script only touches its KEYS, which share the namespace's hash tag, so it also runs on Redis Cluster.
+# KEYS: members (zset key -> expires_at), sizes (hash key -> bytes), stats (hash)
+# ARGV: key, size in bytes, expires_at, max_bytes (0: unlimited), eviction sample size, max evictions per write
+_SET_SCRIPT = """
+local size = tonumber(ARGV[2])
+local old_size = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+redis.call('HSET', KEYS[2], ARGV[1], size)
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+local total = redis.call('HINCRBY', KEYS[3], 'bytes', size - old_size)
+local max_bytes = tonumber(ARGV[4])
+local evicted = {}
+while max_bytes > 0 and total > max_bytes and #evicted < tonumber(ARGV[6]) do
+    -- Of a random sample, evict the entry closest to expiry
+    local sample = redis.call('ZRANDMEMBER', KEYS[1], ARGV[5], 'WITHSCORES')
+    local victim, victim_expires = nil, nil
+    for i = 1, #sample, 2 do
+        local expires = tonumber(sample[i + 1])
+        if sample[i] ~= ARGV[1] and (victim == nil or expires < victim_expires) then
+            victim, victim_expires = sample[i], expires
+        end
+    end
+    if victim == nil then
+        break
+    end
+    local victim_size = tonumber(redis.call('HGET', KEYS[2], victim) or '0')
+    redis.call('ZREM', KEYS[1], victim)
+    redis.call('HDEL', KEYS[2], victim)
+    total = redis.call('HINCRBY', KEYS[3], 'bytes', -victim_size)
+    evicted[#evicted + 1] = victim
+end
+if #evicted > 0 then
+    redis.call('HINCRBY', KEYS[3], 'evictions', #evicted)
+end
+return evicted
+"""
+
+# Drops entries from a namespace's accounting: the given keys (ARGV[1] == "keys") or up to ARGV[3] entries whose
+# expiry is at or before ARGV[2] (ARGV[1] == "expired"); returns the dropped keys, which the caller deletes.
+# KEYS: members, sizes, stats (one namespace, same hash tag)
+_REMOVE_SCRIPT = """
+local keys
+if ARGV[1] == 'expired' then
+    keys = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[2], 'LIMIT', 0, ARGV[3])
+else
+    keys = {}
+    for i = 2, #ARGV do
+        keys[#keys + 1] = ARGV[i]
+    end
+end
+local freed = 0
+for _, key in ipairs(keys) do
+    freed = freed + tonumber(redis.call('HGET', KEYS[2], key) or '0')
+    redis.call('ZREM', KEYS[1], key)
+    redis.call('HDEL', KEYS[2], key)
+end
+if freed > 0 then
+    redis.call('HINCRBY', KEYS[3], 'bytes', -freed)
+end
+if ARGV[1] == 'expired' and #keys > 0 then
+    redis.call('HINCRBY', KEYS[3], 'expired', #keys)
+end
+return keys
+"""
+
+class CacheManager:
+    """Redis cache split into namespaces by key prefix (ohlcv:..., ticker:...), each with its own memory budget.
+
+    Every namespace tracks its members (zset by expiry), their byte sizes and its total size incrementally on
+    write, so enforcing the budget (sampled eviction of the entries closest to expiry) and forgetting expired
+    entries cost O(entries touched), never a KEYS/DBSIZE scan. Hits and misses are counted per process."""
+
+    def __init__(self, settings, subsystem="cache"):
+        self.settings = settings
+        self.subsystem = subsystem
+        self._set_script = None
+        self._remove_script = None
+        self._hits = Counter()
+        self._misses = Counter()
+
+    def _client(self):
+        redis_client = redis_pool.get_client(self.subsystem)
+        if self._set_script is None:
+            self._set_script = redis_client.register_script(_SET_SCRIPT)
+            self._remove_script = redis_client.register_script(_REMOVE_SCRIPT)
+        return redis_client
+
+    def namespace(self, key):
+        """Namespace of a key: its prefix before the first ':' if configured, otherwise 'default'"""
+        prefix = key.split(":", 1)[0]
+        return prefix if prefix in self.settings['namespaces'] else "default"
+
+    def _namespace_settings(self, namespace):
+        return self.settings['namespaces'][namespace]
+
+    @staticmethod
+    def _keys(namespace):
+        """members, sizes and stats keys of a namespace; the {namespace} hash tag keeps them in one cluster slot"""
+        return f"cache_ns:{{{namespace}}}:members", f"cache_ns:{{{namespace}}}:sizes", f"cache_ns:{{{namespace}}}:stats"
+
+    @staticmethod
+    def _legacy_keys(namespace):
+        """Keys of the former layout without a hash tag"""
+        return f"cache_ns:{namespace}:members", f"cache_ns:{namespace}:sizes", f"cache_ns:{namespace}:stats"
+
+    async def _delete_entries(self, redis_client, keys, value_to_set=None):
+        """Deletes cache entries the scripts dropped from accounting (one key per DEL, as entries of a namespace
+        span cluster slots), delete_batch_size per round-trip; value_to_set = (key, value, ttl) is stored in the
+        first round-trip"""
+        batch_size = self.settings['delete_batch_size']
+        for i in range(0, max(len(keys), 1), batch_size):
+            async with redis_client.pipeline(transaction=False) as pipe:
+                if i == 0 and value_to_set is not None:
+                    key, value, ttl = value_to_set
+                    pipe.set(key, value, ex=ttl)
+                for key in keys[i:i + batch_size]:
+                    pipe.delete(key)
+                await pipe.execute()
+
+    async def get(self, key):
+        """Returns the cached value or None"""
+        value = await self._client().get(key)
+        namespace = self.namespace(key)
+        if value is None:
+            self._misses[namespace] += 1
+        else:
+            self._hits[namespace] += 1
+        return value
+
+    async def set(self, key, value, ttl=None):
+        """Stores a str value for ttl seconds (namespace default if None), returns the number of entries evicted"""
+        redis_client = self._client()
+        namespace = self.namespace(key)
+        namespace_settings = self._namespace_settings(namespace)
+        ttl = int(ttl or namespace_settings['ttl'])
+        size = len(value if isinstance(value, bytes) else str(value).encode())
+        evicted = await self._set_script(
+            keys=list(self._keys(namespace)),
+            args=[key, size, time.time() + ttl, namespace_settings['max_bytes'],
+                  self.settings['eviction_sample_size'], self.settings['max_evictions_per_write']],
+            client=redis_client)
+        # The value goes out with the first batch of evicted entries' deletes, in one round-trip
+        await self._delete_entries(redis_client, evicted, value_to_set=(key, value, ttl))
+        if evicted:
+            logger_main.debug(f"Cache namespace {namespace} over budget, evicted {len(evicted)} entries")
+        return len(evicted)
+
+    async def delete(self, *keys):
+        redis_client = self._client()
+        by_namespace = {}
+        for key in keys:
+            by_namespace.setdefault(self.namespace(key), []).append(key)
+        for namespace, namespace_keys in by_namespace.items():
+            await self._delete_entries(redis_client, namespace_keys)
+            await self._remove_script(keys=list(self._keys(namespace)), args=["keys", *namespace_keys], client=redis_client)
+
+    async def sweep_expired(self, namespace=None):
+        """Forgets entries Redis already expired (their membership and size), a bounded batch per call each
+        namespace; returns the number of entries forgotten"""
+        redis_client = self._client()
+        forgotten = 0
+        for name in ([namespace] if namespace else self.settings['namespaces']):
+            expired = await self._remove_script(
+                keys=list(self._keys(name)), args=["expired", time.time(), self.settings['sweep_batch_size']],
+                client=redis_client)
+            if expired:
+                # Redis has usually expired them already; this covers entries whose TTL outlived their score
+                await self._delete_entries(redis_client, expired)
+            forgotten += len(expired)
+        return forgotten
+
+    async def stats(self):
+        """Returns {namespace: {entries, bytes, max_bytes, hits, misses, evictions, expired}}"""
+        redis_client = self._client()
+        namespaces = list(self.settings['namespaces'])
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for namespace in namespaces:
+                members_key, _, stats_key = self._keys(namespace)
+                pipe.zcard(members_key)
+                pipe.hgetall(stats_key)
+            results = await pipe.execute()
+        stats = {}
+        for i, namespace in enumerate(namespaces):
+            entries, fields = results[2 * i], results[2 * i + 1]
+            stats[namespace] = {
+                "entries": entries,
+                "bytes": int(fields.get("bytes", 0)),
+                "max_bytes": self._namespace_settings(namespace)['max_bytes'],
+                "hits": self._hits[namespace],
+                "misses": self._misses[namespace],
+                "evictions": int(fields.get("evictions", 0)),
+                "expired": int(fields.get("expired", 0)),
+            }
+        return stats
+
+    async def drop_legacy_keys(self):
+        """Deletes the namespaces' accounting keys of the former layout without a hash tag (their entries expire
+        through their own TTLs)"""
+        redis_client = self._client()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for namespace in self.settings['namespaces']:
+                for key in self._legacy_keys(namespace):
+                    pipe.delete(key)
+            await pipe.execute()
+
+    async def run_sweeper(self):
+        """Forgets expired entries forever, every sweep_interval seconds (continuing at once while batches fill)"""
+        try:
+            await self.drop_legacy_keys()
+        except Exception as e:
+            logger_main.error(f"Error dropping legacy cache accounting keys: {str(e)}")
+            log_exception(f"Error dropping legacy cache accounting keys: {str(e)}", e)
+        while True:
+            try:
+                forgotten = await self.sweep_expired()
+                if forgotten >= self.settings['sweep_batch_size']:
+                    continue
+            except Exception as e:
+                logger_main.error(f"Error sweeping expired cache entries: {str(e)}")
+                log_exception(f"Error sweeping expired cache entries: {str(e)}", e)
+            await asyncio.sleep(self.settings['sweep_interval'])
+
+cache_manager = CacheManager(CACHE_NAMESPACE_SETTINGS)
+
+__all__ = ['CacheManager', 'cache_manager']
@@ -1,35 +1,25 @@
 import asyncio
 import json
-import time
-from redis_initializer import redis_client
+from cache_manager import cache_manager
 from logging_setup import logger_main
 from utils import log_exception
 
 CACHE_TTL = 300
-MAX_CACHE_SIZE = 10000
 
 local_ticker_cache = {}
 local_cache_timestamp = {}
 
 async def clear_expired_cache():
-    if redis_client is None:
-        logger_main.error("redis_client is not initialized")
-        raise ValueError("redis_client is not initialized")
+    """Forgets a bounded batch of expired entries per cache namespace (Redis expires the values themselves)"""
     try:
-        keys = await redis_client.client.keys("ohlcv:*")
-        current_time = time.time()
-        for key in keys:
-            ttl = await redis_client.client.ttl(key)
-            if ttl <= 0:
-                await redis_client.client.delete(key)
+        return await cache_manager.sweep_expired()
     except Exception as e:
         logger_main.error(f"Error clearing cache: {str(e)}")
         log_exception(f"Error clearing cache: {str(e)}", e)
+        return 0
 
 async def start_cache_cleanup():
-    while True:
-        await clear_expired_cache()
-        await asyncio.sleep(300)
+    await cache_manager.run_sweeper()
 
 def clean_ticker_for_serialization(ticker):
     if not isinstance(ticker, dict):
@@ -52,13 +42,10 @@ def clean_ticker_for_serialization(ticker):
         return {}
 
 async def get_cached_data(cache_key, retries=3, base_delay=2):
-    if redis_client is None:
-        logger_main.error("redis_client is not initialized")
-        raise ValueError("redis_client is not initialized")
     cached_data = None
     for attempt in range(retries):
         try:
-            cached_data = await redis_client.get(cache_key)
+            cached_data = await cache_manager.get(cache_key)
             break
         except Exception as e:
             logger_main.error(f"Error fetching cached data (attempt {attempt + 1}/{retries}): {str(e)}")
@@ -69,17 +56,16 @@ async def get_cached_data(cache_key, retries=3, base_delay=2):
                 cached_data = None
     return cached_data
 
+async def get_cache_stats():
+    """Returns entries, bytes, hits, misses, evictions and expired counts per cache namespace"""
+    return await cache_manager.stats()
+
 async def cache_data(cache_key, data, ttl=CACHE_TTL):
-    if redis_client is None:
-        logger_main.error("redis_client is not initialized")
-        raise ValueError("redis_client is not initialized")
     try:
-        cache_size = await redis_client.dbsize()
-        if cache_size > MAX_CACHE_SIZE:
-            await clear_expired_cache()
-        await redis_client.set(cache_key, json.dumps(data), ex=ttl)
+        # The key's namespace budget is enforced by the write itself, no DBSIZE/KEYS sweep needed
+        await cache_manager.set(cache_key, json.dumps(data), ttl)
     except Exception as e:
         logger_main.error(f"Error caching data: {str(e)}")
         log_exception(f"Error caching data: {str(e)}", e)
 
-__all__ = ['clear_expired_cache', 'start_cache_cleanup', 'clean_ticker_for_serialization', 'get_cached_data', 'cache_data']
+__all__ = ['clear_expired_cache', 'start_cache_cleanup', 'clean_ticker_for_serialization', 'get_cached_data', 'cache_data', 'get_cache_stats']
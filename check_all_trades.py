@@ -1,20 +1,11 @@
 import asyncio
-import redis.asyncio as redis
-from json_handler import loads
+from redis_pool import redis_pool
+from trade_pool_redis import iter_trades_from_redis
 
 async def check_all_trades():
-    redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+    redis_client = redis_pool.get_client("scripts")
     try:
-        trade_keys = await redis_client.keys("trade:*")
-        print(f"Найдено {len(trade_keys)} сделок в Redis")
-        
-        user1_trades = []
-        for key in trade_keys:
-            trade_data = await redis_client.get(key)
-            if trade_data:
-                trade = loads(trade_data)
-                if trade.get('user_id') == "USER1":
-                    user1_trades.append(trade)
+        user1_trades = [trade async for trade in iter_trades_from_redis(redis_client, "trade:", {'user_id': "USER1"})]
         
         if not user1_trades:
             print("Сделки для USER1 не найдены")
@@ -45,7 +36,7 @@ async def check_all_trades():
     except Exception as e:
         print(f"Ошибка: {str(e)}")
     finally:
-        await redis_client.close()
+        await redis_pool.close_all()
 
 if __name__ == "__main__":
     asyncio.run(check_all_trades())
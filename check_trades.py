@@ -1,11 +1,10 @@
 import asyncio
-from trade_pool_queries import get_all_trades as get_trade_pool
+from global_objects import global_trade_pool
 from logging_setup import logger_main
 
 async def check_trades_for_user(user_id):
     logger_main.info(f"Получение сделок для пользователя {user_id}")
-    trades = await get_trade_pool()
-    user_trades = [trade for trade in trades if trade.get('user_id') == user_id]
+    user_trades = await global_trade_pool.query_trades(user_id=user_id)
     if not user_trades:
         logger_main.info(f"Сделки для пользователя {user_id} не найдены")
     else:
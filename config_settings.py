@@ -49,6 +49,112 @@ EXCHANGE_MANAGER_CACHE_SETTINGS = {
     'ttl': 3600,  # Time-to-live for cache entries in seconds (1 hour)
 }
 
+# Trade file persistence settings (write-behind writer in trade_pool_file.py)
+TRADE_PERSISTENCE_SETTINGS = {
+    'queue_size': 10000,       # Maximum number of pending writes before producers wait
+    'batch_size': 500,         # Maximum number of writes committed as one group
+    'commit_interval': 0.5,    # Maximum time in seconds a write waits for its group
+    'fsync_policy': 'interval',  # always: fsync every group, interval: every fsync_interval seconds, never: leave to OS
+    'fsync_interval': 1.0,     # Seconds between fsyncs for the 'interval' policy
+}
+
+# Trade pool tiering settings (Redis -> compressed archive on the NVMe volume)
+TRADE_ARCHIVE_SETTINGS = {
+    'directory': '/mnt/nvme/trading_bot/trade_archive',
+    'age_threshold': 3 * 24 * 60 * 60,  # Trades older than this (seconds) move to the archive, below the 7-day Redis TTL
+    'interval': 60 * 60,                # Seconds between tiering runs
+    'batch_size': 1000,                 # Trades moved per Redis round-trip
+}
+
+# Process-local recent trades cache of the trade pool (recent_trades_cache.py)
+RECENT_TRADES_CACHE_SETTINGS = {
+    'channel': 'trade_pool:recent_invalidate',  # Pub/sub channel writers publish invalidated scopes on
+    'max_scopes': 1024,        # Cached scopes (all users + one per user), least recently used are evicted
+    'max_trades': 1000,        # Larger reads bypass the cache
+    'ttl': 60,                 # Seconds an entry is trusted even without an invalidation (pub/sub may drop messages)
+}
+
+# Retention in seconds of the trade pool's PnL rollup buckets per granularity (trade_pool_rollups.py)
+PNL_ROLLUP_RETENTION = {
+    'hour': 30 * 24 * 60 * 60,
+    'day': 2 * 365 * 24 * 60 * 60,
+}
+
+# Streaming trade statistics sketches per user and overall (trade_pool_sketches.py)
+TRADE_SKETCH_SETTINGS = {
+    'relative_accuracy': 0.01,      # Relative error of PnL / holding time quantiles
+    'tail_fraction': 0.05,          # Worst fraction of PnLs averaged into the tail loss
+    'ttl': 90 * 24 * 60 * 60,       # Sketches of users without trades for this long expire
+}
+
+# In-process columnar copy of the trade pool for analytics (trade_column_store.py)
+TRADE_COLUMN_STORE_SETTINGS = {
+    'max_rows': 1000000,       # Newest trades kept per process, older ones are evicted
+}
+
+# Trade event bus: Redis Stream the trade pool publishes every add/update to (trade_event_bus.py)
+TRADE_EVENT_STREAM_SETTINGS = {
+    'stream': 'trade_events',
+    'maxlen': 100000,          # Approximate cap of retained events (older ones are trimmed)
+    'batch_size': 100,         # Events per read
+    'block_ms': 5000,          # How long a read waits for new events
+    'claim_idle_ms': 60000,    # Unacknowledged events idle this long are offered again / taken from dead consumers
+}
+
+# Bulk export/restore of the trade pool (trade_pool_backup.py)
+TRADE_BACKUP_SETTINGS = {
+    'chunk_size': 50000,            # Trades per compressed chunk file
+    'scan_batch_size': 1000,        # Keys per SCAN/MGET round-trip on export
+    'compress_level': 6,            # gzip level of the chunk files
+    'restore_concurrency': 4,       # Chunks restored in parallel
+    'restore_batch_size': 1000,     # Trades per restore pipeline
+    'max_trades_per_second': 20000, # Restore throttle across all workers (0: unlimited)
+}
+
+# Redis connection pools shared by all subsystems (redis_pool.py)
+REDIS_CONNECTION_SETTINGS = {
+    'host': 'localhost',
+    'port': 6379,
+    'db': 0,
+    'max_connections': {       # Connection limit per subsystem; unlisted subsystems get 'default'
+        'default': 200,
+        'trade_pool': 100,
+        'cache': 50,
+        'scripts': 10,
+    },
+    'pool_timeout': 10,        # Seconds a caller waits for a free connection before failing
+    'socket_timeout': 30,
+    'socket_connect_timeout': 5,
+    'health_check_interval': 30,  # Idle connections are pinged before reuse after this many seconds
+}
+
+# Namespaced Redis cache (cache_manager.py): a key's namespace is its prefix before the first ':'
+CACHE_NAMESPACE_SETTINGS = {
+    'namespaces': {            # Memory budget in bytes (0: unlimited) and default TTL in seconds per namespace
+        'default': {'max_bytes': 64 * 1024 * 1024, 'ttl': 300},
+        'ohlcv': {'max_bytes': 512 * 1024 * 1024, 'ttl': 3600},
+        'ticker': {'max_bytes': 64 * 1024 * 1024, 'ttl': 300},
+    },
+    'eviction_sample_size': 16,       # Entries sampled per eviction (the one closest to expiry is evicted)
+    'max_evictions_per_write': 32,    # Upper bound of work a single write does to get under budget
+    'sweep_batch_size': 1000,         # Expired entries forgotten per namespace per sweep step
+    'sweep_interval': 300,            # Seconds between sweeps
+    'delete_batch_size': 500,         # Evicted/expired entry keys deleted per pipelined round-trip
+}
+
+# Single-flight cache fills (single_flight.py): one compute per key across concurrent callers and processes
+SINGLE_FLIGHT_SETTINGS = {
+    'channel': 'single_flight:filled',  # Pub/sub channel fill owners notify waiting processes on
+    'lock_ttl': 30,            # Seconds a process may hold a key's fill lock (longest expected compute)
+    'poll_interval': 0.5,      # Waiters re-read the cache this often in case a notification is missed
+}
+
+# Two-tier cache of indicator values per symbol, timeframe and last candle state (indicator_cache.py)
+INDICATOR_CACHE_SETTINGS = {
+    'max_entries': 10000,      # Candle states kept in the in-process LRU
+    'ttl': 5 * 60,             # Seconds a candle state's indicators stay in Redis (ticks supersede them quickly)
+}
+
 # Logging settings
 LOGGING_SETTINGS = {
     'level': 'DEBUG',        # Logging level: DEBUG, INFO, WARNING, ERROR
@@ -79,6 +185,18 @@ __all__ = [
     'get_backtest_settings',
     'EXCHANGE_CONNECTION_SETTINGS',
     'EXCHANGE_MANAGER_CACHE_SETTINGS',
+    'TRADE_PERSISTENCE_SETTINGS',
+    'TRADE_ARCHIVE_SETTINGS',
+    'RECENT_TRADES_CACHE_SETTINGS',
+    'TRADE_COLUMN_STORE_SETTINGS',
+    'PNL_ROLLUP_RETENTION',
+    'TRADE_SKETCH_SETTINGS',
+    'TRADE_EVENT_STREAM_SETTINGS',
+    'TRADE_BACKUP_SETTINGS',
+    'REDIS_CONNECTION_SETTINGS',
+    'CACHE_NAMESPACE_SETTINGS',
+    'SINGLE_FLIGHT_SETTINGS',
+    'INDICATOR_CACHE_SETTINGS',
     'LOGGING_SETTINGS',
     'validate_logging_settings',
 ]
@@ -2,44 +2,38 @@ from utils import logger_main, logger_debug, log_exception
 import asyncio
 import pandas as pd
 import ccxt.async_support as ccxt
-import redis.asyncio as redis
+from cache_manager import cache_manager
+from single_flight import single_flight
 import json
 import time
 
+async def _fetch_ohlcv_json(exchange, symbol, timeframe, limit):
+    """Загружает OHLCV с биржи в JSON для кэша, None если данных недостаточно"""
+    logger_main.debug(f"OHLCV загружен для {symbol} с {timeframe}, строк: {limit}")
+    ohlcv = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+    if not ohlcv or len(ohlcv) < limit:
+        logger_main.warning(f"Недостаточно данных OHLCV для {symbol}, получено {len(ohlcv) if ohlcv else 0} строк")
+        return None
+    df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    # Конвертируем timestamp в строку для JSON-сериализации
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms').astype(str)
+    return json.dumps(df.to_dict(orient='records'))
+
 async def fetch_and_prepare_ohlcv(exchange, symbol, timeframe="1h", limit=72):
     try:
-        # Подключение к Redis
-        redis_client = redis.Redis(host='localhost', port=6379, db=0)
-        
         # Ключ для хранения OHLCV в Redis
         cache_key = f"ohlcv:{exchange.id}:{symbol}:{timeframe}"
         
-        # Проверяем, есть ли данные в кэше
-        cached_data = await redis_client.get(cache_key)
-        if cached_data:
-            ohlcv_data = json.loads(cached_data)
-            df = pd.DataFrame(ohlcv_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            logger_main.debug(f"OHLCV для {symbol} загружен из кэша: строк={len(df)}")
-        else:
-            # Загружаем данные с биржи
-            logger_main.debug(f"OHLCV загружен для {symbol} с {timeframe}, строк: {limit}")
-            ohlcv = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-            if not ohlcv or len(ohlcv) < limit:
-                logger_main.warning(f"Недостаточно данных OHLCV для {symbol}, получено {len(ohlcv)} строк")
-                await redis_client.close()
-                return None
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            
-            # Конвертируем timestamp в строку для JSON-сериализации
-            df_for_cache = df.copy()
-            df_for_cache['timestamp'] = df_for_cache['timestamp'].astype(str)
-            
-            # Сохраняем в кэш с TTL 1 час
-            ohlcv_json = df_for_cache.to_dict(orient='records')
-            await redis_client.setex(cache_key, 3600, json.dumps(ohlcv_json))
-            logger_main.debug(f"OHLCV для {symbol} сохранён в кэш")
+        # При промахе кэша OHLCV с биржи загружает только один из одновременных вызовов
+        cached_data = await single_flight.get_or_compute(
+            cache_key, lambda: cache_manager.get(cache_key),
+            lambda: _fetch_ohlcv_json(exchange, symbol, timeframe, limit),
+            lambda ohlcv_json: cache_manager.set(cache_key, ohlcv_json, ttl=3600))  # TTL 1 час
+        if cached_data is None:
+            return None
+        df = pd.DataFrame(json.loads(cached_data), columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        logger_main.debug(f"OHLCV для {symbol} загружен: строк={len(df)}")
 
         # Добавляем технические индикаторы
         df['returns'] = df['close'].pct_change()
@@ -49,9 +43,7 @@ async def fetch_and_prepare_ohlcv(exchange, symbol, timeframe="1h", limit=72):
         df['bb_lower'] = df['close'].rolling(window=20).mean() - 2 * df['close'].rolling(window=20).std()
         logger_main.debug(f"OHLCV для {symbol}: строк={len(df)}, колонки={df.columns.tolist()}")
         
-        await redis_client.close()
         return df
     except Exception as e:
         log_exception(f"Ошибка загрузки OHLCV для {symbol}", e)
-        await redis_client.close()
         return None
@@ -2,7 +2,7 @@ import ccxt.async_support as ccxt
 import time
 from logging_setup import logger_main, logger_exceptions
 from redis_initializer import redis_client
-from redis_client import get_json, set_json  # Импортируем функции напрямую
+from redis_client import get_json, set_json, get_or_compute_json  # Импортируем функции напрямую
 
 class DepositCalculator:
     def __init__(self, user_id=None, max_drawdown=0.1):
@@ -28,19 +28,21 @@ class DepositCalculator:
     async def fetch_price(self, exchange, asset, target_currency="USDT"):
         """Получает цену актива в USDT, используя промежуточные пары, если нужно"""
         start_time = time.time()
-        # Проверяем кэш цены
-        price_cache_key = f"price:{asset}/{target_currency}"
-        cached_price = await get_json(price_cache_key)
-        if cached_price is not None:
-            logger_main.debug(f"Using cached price for {asset}/{target_currency}: {cached_price}")
-            return cached_price
+        try:
+            # При промахе кэша цену запрашивает с биржи только один из одновременных вызовов, кэшируем на 5 минут
+            return await get_or_compute_json(f"price:{asset}/{target_currency}",
+                                             lambda: self._fetch_price_from_exchange(exchange, asset, target_currency),
+                                             expire=300, should_cache=lambda price: price > 0)
+        finally:
+            logger_main.debug(f"fetch_price for {asset}/{target_currency} took {time.time() - start_time:.3f} seconds")
+
+    async def _fetch_price_from_exchange(self, exchange, asset, target_currency):
+        """Запрашивает цену актива с биржи (напрямую или через BTC/ETH), 0 если цену получить не удалось"""
         try:
             # Прямой тикер (например, BTC/USDT)
             ticker = await exchange.fetch_ticker(f"{asset}/{target_currency}")
             price = ticker['last'] if ticker and 'last' in ticker else 0
             logger_main.debug(f"Fetched price for {asset}/{target_currency}: {price}")
-            if price > 0:
-                await set_json(price_cache_key, price, expire=300)  # Кэшируем на 5 минут
             return price
         except Exception as e:
             logger_main.warning(f"Cannot fetch price for {asset}/{target_currency}: {str(e)}")
@@ -60,15 +62,10 @@ class DepositCalculator:
                     logger_main.debug(f"Fetched price for {intermediate}/{target_currency}: {price_intermediate_to_usdt}")
                     if price_intermediate_to_usdt == 0:
                         continue
-                    price = price_in_intermediate * price_intermediate_to_usdt
-                    if price > 0:
-                        await set_json(price_cache_key, price, expire=300)  # Кэшируем на 5 минут
-                    return price
+                    return price_in_intermediate * price_intermediate_to_usdt
                 except Exception as e:
                     logger_main.warning(f"Cannot fetch price for {asset} via {intermediate}: {str(e)}")
             return 0
-        finally:
-            logger_main.debug(f"fetch_price for {asset}/{target_currency} took {time.time() - start_time:.3f} seconds")
 
     async def calculate_total_deposit(self, exchange):
         """Рассчитывает общий депозит в USDT, кэширует его в Redis"""
@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from logging_setup import logger_main
+from utils import log_exception
+from redis_pool import redis_pool
+from config_settings import INDICATOR_CACHE_SETTINGS
+
+class IndicatorCache:
+    """Two-tier cache of indicator values: a bounded in-process LRU in front of Redis.
+
+    Values are grouped per (symbol, timeframe, last candle): all indicators of a candle live in one Redis hash, so
+    they are read with one HGETALL and written with one HSET. The last candle is identified by its open time and
+    current prices, so a tick on a forming candle or a new candle means a new key and cached values need no
+    invalidation; the TTL only cleans up keys of superseded data."""
+
+    def __init__(self, max_entries=10000, ttl=5 * 60, subsystem="cache"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.subsystem = subsystem
+        self._entries = OrderedDict()  # Redis key -> {indicator: value}, least recently used first
+
+    @staticmethod
+    def key(symbol, timeframe, last_candle):
+        return f"indicator:{symbol}:{timeframe}:{last_candle}"
+
+    def _remember(self, key, values):
+        self._entries[key] = values
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, symbol, timeframe, last_candle):
+        """Returns {indicator: value} cached for the candle (empty if none)"""
+        key = self.key(symbol, timeframe, last_candle)
+        values = self._entries.get(key)
+        if values is not None:
+            self._entries.move_to_end(key)
+            return dict(values)
+        try:
+            fields = await redis_pool.get_client(self.subsystem).hgetall(key)
+        except Exception as e:
+            logger_main.error(f"Error reading cached indicators for {symbol}: {str(e)}")
+            log_exception(f"Error reading cached indicators: {str(e)}", e)
+            return {}
+        values = {name: float(value) for name, value in fields.items()}
+        if values:
+            self._remember(key, values)
+        return dict(values)
+
+    async def put(self, symbol, timeframe, last_candle, values):
+        """Adds indicator values of the candle to both tiers in one Redis round-trip"""
+        if not values:
+            return
+        key = self.key(symbol, timeframe, last_candle)
+        values = {name: float(value) for name, value in values.items()}
+        self._remember(key, {**self._entries.get(key, {}), **values})
+        try:
+            async with redis_pool.get_client(self.subsystem).pipeline(transaction=False) as pipe:
+                pipe.hset(key, mapping=values)
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger_main.error(f"Error caching indicators for {symbol}: {str(e)}")
+            log_exception(f"Error caching indicators: {str(e)}", e)
+
+indicator_cache = IndicatorCache(**INDICATOR_CACHE_SETTINGS)
+
+__all__ = ['IndicatorCache', 'indicator_cache']
@@ -1,10 +1,14 @@
 import json
+import msgpack
 import pandas as pd
 import numpy as np
+from trade_record import Trade
 
 def custom_serializer(obj):
     """Кастомный сериализатор для обработки несериализуемых типов."""
-    if isinstance(obj, pd.Timestamp):
+    if isinstance(obj, Trade):
+        return obj.to_dict()  # Записи сделок сериализуем как обычные словари
+    elif isinstance(obj, pd.Timestamp):
         return obj.isoformat()  # Преобразуем Timestamp в строку ISO
     elif isinstance(obj, (np.integer, np.floating)):
         return obj.item()  # Преобразуем numpy числа в стандартные Python числа
@@ -28,4 +32,39 @@ def loads(data):
     except Exception as e:
         raise Exception(f"Ошибка при десериализации JSON: {str(e)}")
 
-__all__ = ['dumps', 'loads']
+# Binary trade records start with a marker byte that is never valid as the first byte of UTF-8 text (so never
+# valid JSON either), followed by the schema version and a msgpack body. Anything else is decoded as legacy JSON.
+# Version 1 bodies are maps of trade fields, version 2 bodies are Trade rows (positional, see trade_record).
+TRADE_CODEC_MARKER = 0xC1
+TRADE_CODEC_VERSION = 2
+_TRADE_CODEC_HEADER = bytes((TRADE_CODEC_MARKER, TRADE_CODEC_VERSION))
+# Redis clients with encoding_errors='surrogateescape' hand binary values back as str with the bytes escaped
+_ESCAPED_TRADE_CODEC_MARKER = chr(0xDC00 | TRADE_CODEC_MARKER)
+
+def encode_trade(trade_data):
+    """Кодирует сделку (Trade или словарь) в компактный бинарный формат с байтом версии схемы."""
+    try:
+        row = Trade.from_dict(trade_data).to_row()
+        return _TRADE_CODEC_HEADER + msgpack.packb(row, default=custom_serializer, use_bin_type=True)
+    except Exception as e:
+        raise Exception(f"Ошибка при кодировании сделки: {str(e)}")
+
+def decode_trade(data):
+    """Декодирует сделку (Trade) из бинарного формата любой версии или из устаревшего JSON."""
+    try:
+        if isinstance(data, str):
+            if not data.startswith(_ESCAPED_TRADE_CODEC_MARKER):
+                return Trade.from_dict(json.loads(data))
+            data = data.encode('utf-8', 'surrogateescape')
+        elif data[:1] != _TRADE_CODEC_HEADER[:1]:
+            return Trade.from_dict(json.loads(data))
+        body = msgpack.unpackb(data[2:], raw=False)
+        if data[1] == 2:
+            return Trade.from_row(body)
+        if data[1] == 1:
+            return Trade.from_dict(body)
+        raise ValueError(f"unsupported trade schema version {data[1]}")
+    except Exception as e:
+        raise Exception(f"Ошибка при декодировании сделки: {str(e)}")
+
+__all__ = ['dumps', 'loads', 'encode_trade', 'decode_trade', 'TRADE_CODEC_VERSION']
@@ -1,7 +1,7 @@
 from utils import logger_main, logger_debug, log_exception
 import asyncio
 import time
-from trade_pool import analyze_trade_pool
+from global_objects import global_trade_pool
 
 class LimitsManager:
     def __init__(self):
@@ -28,7 +28,7 @@ class LimitsManager:
             current_time = time.time()
             for user_id in self.limits:
                 if current_time - self.limits[user_id]['last_reset'] >= 86400:  # Сброс каждые 24 часа
-                    stats = await analyze_trade_pool(user_id)
+                    stats = await global_trade_pool.get_pnl_summary(user_id=user_id, granularity='hour', since=current_time - 86400)
                     success_rate = stats['success_rate']
                     if success_rate > 0.7:
                         self.limits[user_id]['daily_limit'] *= 1.1  # Увеличиваем на 10%
@@ -41,7 +41,7 @@ class LimitsManager:
                     self.limits[user_id]['last_reset'] = current_time
                     logger_main.info(f"Сброшены дневные лимиты для {user_id} (по времени)")
                 elif self.limits[user_id]['trade_volume'] >= self.limits[user_id]['daily_limit'] * 0.5:  # Сброс при 50% объёма
-                    stats = await analyze_trade_pool(user_id)
+                    stats = await global_trade_pool.get_pnl_summary(user_id=user_id, granularity='hour', since=current_time - 86400)
                     success_rate = stats['success_rate']
                     if success_rate > 0.7:
                         self.limits[user_id]['daily_limit'] *= 1.1
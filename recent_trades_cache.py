@@ -0,0 +1,116 @@
+import time
+import asyncio
+from collections import OrderedDict
+from logging_setup import logger_main
+from utils import log_exception
+from json_handler import dumps, loads
+
+class RecentTradesCache:
+    """Process-local, bounded cache of recent trades per scope (None for all users, otherwise a user_id).
+
+    Writers invalidate the scopes they touch locally and publish them on a Redis channel; every process listens
+    on that channel and drops the same scopes. Pub/sub delivery is at-most-once, so entries also expire after
+    ttl seconds, and the cache is bypassed entirely while the listener is not subscribed."""
+
+    def __init__(self, channel, max_scopes=1024, max_trades=1000, ttl=60):
+        self.channel = channel
+        self.max_scopes = max_scopes
+        self.max_trades = max_trades
+        self.ttl = ttl
+        self._entries = OrderedDict()  # scope -> (expires_at, limit, trades), least recently used first
+        self._generation = 0  # Bumped on every invalidation, so fills that raced one are discarded
+        self._listening = False
+        self._listener_task = None
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, scope, limit):
+        """Returns the newest limit trades of a scope, or None on a miss"""
+        if not self._listening:
+            return None
+        entry = self._entries.get(scope)
+        if entry is None:
+            return None
+        expires_at, cached_limit, trades = entry
+        if expires_at < time.monotonic():
+            del self._entries[scope]
+            return None
+        # A shorter list than was asked for holds every trade of the scope, so it answers any limit
+        if limit > cached_limit and len(trades) >= cached_limit:
+            return None
+        self._entries.move_to_end(scope)
+        return trades[:limit]
+
+    def put(self, scope, limit, trades, generation):
+        """Stores the result of a Redis read started at the given generation"""
+        if not self._listening or generation != self._generation or limit > self.max_trades:
+            return
+        self._entries[scope] = (time.monotonic() + self.ttl, limit, list(trades))
+        self._entries.move_to_end(scope)
+        while len(self._entries) > self.max_scopes:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        """Drops the global scope and the scopes of the given users"""
+        self._generation += 1
+        self._entries.pop(None, None)
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+    async def publish_invalidation(self, redis_client, user_ids):
+        """Invalidates locally and tells the other processes to do the same"""
+        user_ids = sorted({user_id for user_id in user_ids if user_id})
+        self.invalidate(user_ids)
+        try:
+            await redis_client.publish(self.channel, dumps(user_ids))
+        except Exception as e:
+            logger_main.error(f"Error publishing recent trades invalidation: {str(e)}")
+            log_exception(f"Error publishing recent trades invalidation: {str(e)}", e)
+
+    def start(self, redis_client):
+        """Starts the invalidation listener on the running event loop (once)"""
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen(redis_client))
+
+    async def _listen(self, redis_client):
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Anything cached before the subscription may have missed invalidations
+                self.clear()
+                self._listening = True
+                logger_main.info(f"Recent trades cache listening on {self.channel}")
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.invalidate(loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger_main.error(f"Recent trades cache listener failed, bypassing the cache: {str(e)}")
+                log_exception(f"Recent trades cache listener error: {str(e)}", e)
+            finally:
+                self._listening = False
+                self.clear()
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(1)
+
+    async def close(self):
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+__all__ = ['RecentTradesCache']
@@ -1,7 +1,14 @@
 import json
+import math
 import time
+import random
 from logging_setup import logger_main, logger_exceptions
 from redis_initializer import redis_client
+from single_flight import single_flight
+from trade_pool_redis import get_user_recent_trades_from_redis, trade_timestamp
+
+# Maximum number of trades get_trades_from_cache returns
+TRADES_CACHE_MAX_LENGTH = 100
 
 async def get_json(key):
     """Получает данные из Redis и десериализует их из JSON"""
@@ -33,13 +40,58 @@ async def set_json(key, value, expire=None):
     finally:
         logger_main.debug(f"set_json for key {key} took {time.time() - start_time:.3f} seconds")
 
+async def get_or_compute_json(key, compute, expire=None, should_cache=None):
+    """get_json, но при промахе значение вычисляется compute() один раз для всех одновременных вызовов
+    (в том числе из других процессов) и кэшируется через set_json"""
+    return await single_flight.get_or_compute(key, lambda: get_json(key), compute,
+                                              lambda value: set_json(key, value, expire), should_cache)
+
+async def get_or_refresh_json(key, compute, ttl, stale_ttl=None, beta=1.0, lock_ttl=None, should_cache=None):
+    """Кэш с stale-while-revalidate: значение свежо ttl секунд и ещё stale_ttl (по умолчанию ttl) отдаётся
+    устаревшим, пока compute() пересчитывает его в фоне. Пересчёт начинается и раньше, с вероятностью, растущей
+    к концу ttl пропорционально beta и времени прошлого пересчёта (probabilistic early expiration, XFetch), так что
+    вызывающие почти никогда не ждут холодного пересчёта; ждёт только самый первый промах (через single-flight)"""
+    stale_ttl = stale_ttl if stale_ttl is not None else ttl
+
+    async def load():
+        entry = await get_json(key)
+        # Values written before the key was served stale-while-revalidate count as a miss
+        return entry if isinstance(entry, dict) and "swr_value" in entry else None
+
+    async def compute_entry():
+        start_time = time.time()
+        value = await compute()
+        if value is None:
+            return None
+        return {"swr_value": value, "swr_created_at": time.time(), "swr_compute_time": time.time() - start_time}
+
+    def should_cache_entry(entry):
+        return should_cache is None or should_cache(entry["swr_value"])
+
+    async def store(entry):
+        await set_json(key, entry, expire=int(ttl + stale_ttl))
+
+    entry = await single_flight.get_or_compute(key, load, compute_entry, store, should_cache_entry, lock_ttl)
+    if entry is None:
+        return None
+    age = time.time() - entry["swr_created_at"]
+    # -log(u) is exponentially distributed: early refreshes spread out before expiry instead of piling up at it
+    if age - entry["swr_compute_time"] * beta * math.log(1.0 - random.random()) >= ttl:
+        single_flight.refresh_in_background(key, compute_entry, store, should_cache_entry, lock_ttl)
+    return entry["swr_value"]
+
 async def get_trades_from_cache(user_id):
-    """Получает сделки пользователя из кэша Redis"""
+    """Получает последние сделки пользователя из общего пула (по индексу сделок пользователя)"""
     start_time = time.time()
     try:
-        trades_key = f"trades:{user_id}"
-        trades = await redis_client.lrange(trades_key, 0, -1)
-        return [json.loads(trade) for trade in trades]
+        trades = await get_user_recent_trades_from_redis(redis_client, user_id, TRADES_CACHE_MAX_LENGTH)
+        # Same shape as the entries of the former trades:{user_id} list
+        return [{
+            'trade': trade,
+            'signal': trade.get('signal'),
+            'strategies': trade.get('strategies') or {},
+            'timestamp': trade_timestamp(trade)
+        } for trade in trades]
     except Exception as e:
         logger_main.error(f"Error getting trades from cache for user {user_id}: {str(e)}")
         logger_exceptions.error(f"Error getting trades: {str(e)}", exc_info=True)
@@ -47,23 +99,6 @@ async def get_trades_from_cache(user_id):
     finally:
         logger_main.debug(f"get_trades_from_cache for user {user_id} took {time.time() - start_time:.3f} seconds")
 
-async def add_trade_to_cache(user_id, trade_info):
-    """Добавляет сделку в кэш Redis"""
-    start_time = time.time()
-    try:
-        trades_key = f"trades:{user_id}"
-        serialized = json.dumps(trade_info)
-        await redis_client.lpush(trades_key, serialized)
-        # Ограничиваем длину списка до 100 сделок
-        await redis_client.ltrim(trades_key, 0, 99)
-        # Устанавливаем срок жизни ключа (например, 7 дней)
-        await redis_client.expire(trades_key, 7 * 24 * 60 * 60)
-    except Exception as e:
-        logger_main.error(f"Error adding trade to cache for user {user_id}: {str(e)}")
-        logger_exceptions.error(f"Error adding trade: {str(e)}", exc_info=True)
-    finally:
-        logger_main.debug(f"add_trade_to_cache for user {user_id} took {time.time() - start_time:.3f} seconds")
-
 async def add_to_problematic_symbols(symbol, exchange_name):
     """Добавляет проблемный символ в кэш Redis"""
     start_time = time.time()
@@ -93,4 +128,5 @@ async def get_problematic_symbols(exchange_name):
     finally:
         logger_main.debug(f"get_problematic_symbols for {exchange_name} took {time.time() - start_time:.3f} seconds")
 
-__all__ = ['get_json', 'set_json', 'get_trades_from_cache', 'add_trade_to_cache', 'add_to_problematic_symbols', 'get_problematic_symbols']
+__all__ = ['get_json', 'set_json', 'get_or_compute_json', 'get_or_refresh_json', 'get_trades_from_cache', 'add_to_problematic_symbols', 'get_problematic_symbols',
+           'TRADES_CACHE_MAX_LENGTH']
@@ -1,13 +1,9 @@
-import redis.asyncio as redis
 from logging_setup import logger_main, logger_exceptions
+from redis_pool import redis_pool
 
 # Создаём объект redis_client
 try:
-    redis_client = redis.Redis(
-        host='localhost',
-        port=6379,
-        decode_responses=True
-    )
+    redis_client = redis_pool.get_client("default")
     logger_main.info("Redis client initialized successfully")
 except Exception as e:
     logger_main.error(f"Failed to initialize Redis client: {str(e)}")
@@ -0,0 +1,89 @@
+import time
+import redis.asyncio as redis
+from logging_setup import logger_main
+from utils import log_exception
+from config_settings import REDIS_CONNECTION_SETTINGS
+
+class RedisPoolManager:
+    """Hands out Redis clients backed by one bounded connection pool per subsystem.
+
+    Clients of the same subsystem share its pool, so connections are reused instead of opened per call, and a
+    subsystem at its limit waits up to pool_timeout seconds for a free connection rather than opening more sockets.
+    Idle connections are pinged before reuse (health_check_interval); pool_stats() reports usage per subsystem."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._pools = {}
+        self._clients = {}
+
+    def _create_pool(self, subsystem):
+        limits = self.settings['max_connections']
+        max_connections = limits.get(subsystem, limits['default'])
+        logger_main.info(f"Creating Redis connection pool for {subsystem} (max {max_connections} connections)")
+        return redis.BlockingConnectionPool(
+            host=self.settings['host'],
+            port=self.settings['port'],
+            db=self.settings['db'],
+            max_connections=max_connections,
+            timeout=self.settings['pool_timeout'],
+            socket_timeout=self.settings['socket_timeout'],
+            socket_connect_timeout=self.settings['socket_connect_timeout'],
+            socket_keepalive=True,
+            health_check_interval=self.settings['health_check_interval'],
+            decode_responses=True,
+            # Binary values (trades encoded by json_handler.encode_trade) come back losslessly as escaped str
+            encoding_errors='surrogateescape',
+        )
+
+    def get_pool(self, subsystem="default"):
+        if subsystem not in self._pools:
+            self._pools[subsystem] = self._create_pool(subsystem)
+        return self._pools[subsystem]
+
+    def get_client(self, subsystem="default"):
+        """Returns the shared client of a subsystem; closing it does not close the pool"""
+        if subsystem not in self._clients:
+            self._clients[subsystem] = redis.Redis(connection_pool=self.get_pool(subsystem))
+        return self._clients[subsystem]
+
+    def pool_stats(self):
+        """Returns {subsystem: {max_connections, created, in_use, available}}"""
+        stats = {}
+        for subsystem, pool in self._pools.items():
+            in_use = len(getattr(pool, "_in_use_connections", ()))
+            available = len(getattr(pool, "_available_connections", ()))
+            stats[subsystem] = {
+                "max_connections": pool.max_connections,
+                "created": in_use + available,
+                "in_use": in_use,
+                "available": available,
+            }
+        return stats
+
+    async def health_check(self):
+        """Pings Redis through every pool, returns {subsystem: latency in seconds or None if unreachable}"""
+        results = {}
+        for subsystem, client in self._clients.items():
+            start_time = time.monotonic()
+            try:
+                await client.ping()
+                results[subsystem] = time.monotonic() - start_time
+            except Exception as e:
+                logger_main.error(f"Redis health check failed for {subsystem}: {str(e)}")
+                log_exception(f"Redis health check failed: {str(e)}", e)
+                results[subsystem] = None
+        return results
+
+    async def close_all(self):
+        """Disconnects every pool (at shutdown)"""
+        for subsystem, pool in self._pools.items():
+            try:
+                await pool.disconnect()
+            except Exception as e:
+                logger_main.error(f"Error closing Redis pool {subsystem}: {str(e)}")
+        self._pools.clear()
+        self._clients.clear()
+
+redis_pool = RedisPoolManager(REDIS_CONNECTION_SETTINGS)
+
+__all__ = ['RedisPoolManager', 'redis_pool']
@@ -69,8 +69,8 @@ class RetrainingManager:
         while True:
             try:
                 logger_main.info("Starting system retraining")
-                # Получаем реальные сделки из общего пула
-                real_trades = await global_trade_pool.get_all_trades()
+                # Получаем реальные сделки из общего пула (Redis и архив)
+                real_trades = await global_trade_pool.get_trade_history()
                 if not real_trades:
                     logger_main.warning("No real trades available for retraining")
                     await asyncio.sleep(RETRAINING_INTERVAL)
@@ -89,10 +89,10 @@ class RiskManager:
                     trade_percentage *= 0.75  # Reduce by 25%
                     logger_main.info(f"Moderate volatility ({avg_volatility:.4f}), reducing trade percentage to {trade_percentage:.2%}")
             # Account for trade success rate
-            trades = await global_trade_pool.get_all_trades()
-            if trades:
-                recent_trades = trades[-50:]  # Last 50 trades
-                success_rate = sum(1 for trade in recent_trades if trade.get('pnl', 0) > 0) / len(recent_trades)
+            trade_store = await global_trade_pool.get_column_store()
+            recent_stats = trade_store.summary(limit=50)  # Last 50 trades
+            if recent_stats["count"]:
+                success_rate = recent_stats["success_rate"]
                 if success_rate < 0.4:  # If success rate is below 40%
                     trade_percentage *= 0.5  # Reduce percentage
                     logger_main.info(f"Low trade success rate ({success_rate:.2%}), reducing trade percentage to {trade_percentage:.2%}")
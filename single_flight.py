@@ -0,0 +1,179 @@
+import time
+import uuid
+import asyncio
+from logging_setup import logger_main
+from utils import log_exception
+from redis_pool import redis_pool
+from config_settings import SINGLE_FLIGHT_SETTINGS
+
+# Deletes the fill lock only if this process still holds it, and tells waiting processes the key is filled
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+redis.call('PUBLISH', ARGV[2], ARGV[3])
+return 0
+"""
+
+class SingleFlight:
+    """Coalesces cache fills: concurrent misses on one key run the expensive compute once.
+
+    In-process, callers missing the same key await one shared task. Across processes, the task first takes a short
+    Redis lock (SET NX PX lock_ttl) on the key; processes that lose the race wait for the owner's notification on
+    a pub/sub channel (re-reading the cache every poll_interval in case it is missed) and compute the value
+    themselves only if the owner failed or the lock expired."""
+
+    def __init__(self, channel, lock_ttl=30, poll_interval=0.5, subsystem="default"):
+        self.channel = channel
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.subsystem = subsystem
+        self._inflight = {}  # key -> task filling it
+        self._waiters = {}  # key -> set of asyncio.Event of tasks waiting for another process
+        self._release_script = None
+        self._listener_task = None
+
+    def _client(self):
+        redis_client = redis_pool.get_client(self.subsystem)
+        if self._release_script is None:
+            self._release_script = redis_client.register_script(_RELEASE_SCRIPT)
+        return redis_client
+
+    async def get_or_compute(self, key, load, compute, store, should_cache=None, lock_ttl=None):
+        """Returns the cached value of key, computing and storing it once on a miss.
+
+        load() returns the cached value or None, compute() the fresh value and store(value) caches it; a computed
+        value is stored only if should_cache(value) (default: not None). lock_ttl overrides the lock lifetime for
+        computes slower than the default"""
+        value = await load()
+        if value is not None:
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(key, load, compute, store, should_cache, lock_ttl or self.lock_ttl))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # A cancelled caller must not cancel the fill the other callers wait for
+        return await asyncio.shield(task)
+
+    def refresh_in_background(self, key, compute, store, should_cache=None, lock_ttl=None):
+        """Recomputes and stores key off the caller's path, unless a fill or refresh of it already runs in this
+        process or, holding the key's lock, in another one"""
+        refresh_key = f"refresh:{key}"
+        if refresh_key in self._inflight or key in self._inflight:
+            return
+        task = asyncio.ensure_future(self._refresh(key, compute, store, should_cache, lock_ttl or self.lock_ttl))
+        self._inflight[refresh_key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(refresh_key, None))
+
+    async def _refresh(self, key, compute, store, should_cache, lock_ttl):
+        redis_client = self._client()
+        lock_key = f"single_flight:{key}"
+        token = uuid.uuid4().hex
+        locked = False
+        try:
+            locked = await redis_client.set(lock_key, token, nx=True, px=int(lock_ttl * 1000))
+            if not locked:
+                return
+            logger_main.debug(f"Refreshing cached {key} in the background")
+            value = await compute()
+            if value is not None and (should_cache is None or should_cache(value)):
+                await store(value)
+        except Exception as e:
+            # The cached value stays in use until the next refresh attempt
+            logger_main.error(f"Background refresh of {key} failed: {str(e)}")
+            log_exception(f"Background refresh failed: {str(e)}", e)
+        finally:
+            if locked:
+                await self._release(redis_client, key, lock_key, token)
+
+    async def _release(self, redis_client, key, lock_key, token):
+        try:
+            await self._release_script(keys=[lock_key], args=[token, self.channel, key], client=redis_client)
+        except Exception as e:
+            logger_main.error(f"Error releasing single-flight lock for {key}: {str(e)}")
+            log_exception(f"Error releasing single-flight lock: {str(e)}", e)
+
+    async def _fill(self, key, load, compute, store, should_cache, lock_ttl):
+        redis_client = self._client()
+        lock_key = f"single_flight:{key}"
+        token = uuid.uuid4().hex
+        locked = False
+        try:
+            locked = await redis_client.set(lock_key, token, nx=True, px=int(lock_ttl * 1000))
+            if not locked:
+                value = await self._wait_for_owner(redis_client, key, lock_key, load, lock_ttl)
+                if value is not None:
+                    return value
+            else:
+                # Filled by another process between our miss and the lock
+                value = await load()
+                if value is not None:
+                    return value
+        except Exception as e:
+            # Without Redis coordination, still coalesce within this process
+            logger_main.error(f"Single-flight lock failed for {key}, computing without it: {str(e)}")
+            log_exception(f"Single-flight lock error: {str(e)}", e)
+        try:
+            value = await compute()
+            if value is not None and (should_cache is None or should_cache(value)):
+                await store(value)
+            return value
+        finally:
+            if locked:
+                await self._release(redis_client, key, lock_key, token)
+
+    async def _wait_for_owner(self, redis_client, key, lock_key, load, lock_ttl):
+        """Waits while another process fills key; returns the value, or None if the owner gave up"""
+        self._ensure_listener()
+        event = asyncio.Event()
+        self._waiters.setdefault(key, set()).add(event)
+        deadline = time.monotonic() + lock_ttl
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                value = await load()
+                if value is not None:
+                    return value
+                if event.is_set() or not await redis_client.exists(lock_key):
+                    return None  # Owner finished without a cacheable value, or died
+            return None
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[key]
+
+    def _ensure_listener(self):
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            pubsub = self._client().pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        for event in self._waiters.get(message["data"], ()):
+                            event.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Waiters fall back to polling the cache until the listener is back
+                logger_main.error(f"Single-flight listener failed: {str(e)}")
+                log_exception(f"Single-flight listener error: {str(e)}", e)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(1)
+
+single_flight = SingleFlight(**SINGLE_FLIGHT_SETTINGS)
+
+__all__ = ['SingleFlight', 'single_flight']
@@ -4,7 +4,7 @@ from bot_trading import start_trading
 from config_keys import API_KEYS, PREFERRED_EXCHANGES
 from logging_setup import logger_main
 from redis_initializer import redis_client
-from redis_client import get_json, set_json  # Импортируем функции напрямую
+from redis_client import get_or_refresh_json  # Импортируем функции напрямую
 
 # Ограничиваем количество одновременных запросов к API
 MAX_CONCURRENT_REQUESTS = 5
@@ -13,23 +13,29 @@ CHECK_INTERVAL = 60  # Интервал проверки в секундах (1
 async def load_markets_for_exchange(exchange_name, exchange_config):
     """Загружает рынки для указанной биржи и кэширует их в Redis"""
     try:
-        markets_cache_key = f"markets:{exchange_name}"
-        logger_main.debug(f"Checking cached markets for {exchange_name}")
-        cached_markets = await get_json(markets_cache_key)  # Используем функцию get_json
-        if cached_markets:
-            if len(cached_markets) < 10:  # Проверка на минимальное количество символов
-                logger_main.warning(f"Cached markets for {exchange_name} are outdated or incomplete: {len(cached_markets)} symbols")
-            else:
-                logger_main.info(f"Using cached markets for {exchange_name} with {len(cached_markets)} symbols")
-                return cached_markets
-        logger_main.debug(f"Creating exchange instance for {exchange_name}")
-        exchange_class = getattr(ccxt, exchange_name)
-        exchange = exchange_class({
-            'apiKey': exchange_config['api_key'],
-            'secret': exchange_config['api_secret'],
-            'enableRateLimit': True,
-            'timeout': 30000,  # Тайм-аут на уровне CCXT
-        })
+        # Рынки обновляются в фоне до истечения кэша, цикл торговли всегда получает готовое значение
+        markets = await get_or_refresh_json(f"markets:{exchange_name}",
+                                            lambda: fetch_markets_from_exchange(exchange_name, exchange_config),
+                                            ttl=86400, lock_ttl=60,
+                                            should_cache=lambda markets: len(markets) >= 10)  # Проверка на минимальное количество символов
+        if markets:
+            logger_main.info(f"Using markets for {exchange_name} with {len(markets)} symbols")
+        return markets
+    except Exception as e:
+        logger_main.error(f"Failed to load markets for {exchange_name}: {str(e)}")
+        return None
+
+async def fetch_markets_from_exchange(exchange_name, exchange_config):
+    """Загружает рынки биржи через CCXT, None при ошибке или тайм-ауте"""
+    logger_main.debug(f"Creating exchange instance for {exchange_name}")
+    exchange_class = getattr(ccxt, exchange_name)
+    exchange = exchange_class({
+        'apiKey': exchange_config['api_key'],
+        'secret': exchange_config['api_secret'],
+        'enableRateLimit': True,
+        'timeout': 30000,  # Тайм-аут на уровне CCXT
+    })
+    try:
         logger_main.debug(f"Starting to load markets for {exchange_name}")
         # Используем низкоуровневый тайм-аут
         task = asyncio.create_task(exchange.load_markets())
@@ -38,17 +44,13 @@ async def load_markets_for_exchange(exchange_name, exchange_config):
         except asyncio.TimeoutError:
             logger_main.error(f"Timeout while loading markets for {exchange_name} after 30 seconds")
             task.cancel()  # Отменяем задачу
-            await exchange.close()
             return None
-        logger_main.debug(f"Markets loaded for {exchange_name}: {len(markets)} symbols")
-        await set_json(markets_cache_key, markets, expire=86400)  # Используем функцию set_json
+        if len(markets) < 10:
+            logger_main.warning(f"Markets for {exchange_name} are incomplete: {len(markets)} symbols")
         logger_main.info(f"Loaded markets for {exchange_name}: {len(markets)} symbols")
-        await exchange.close()
         return markets
-    except Exception as e:
-        logger_main.error(f"Failed to load markets for {exchange_name}: {str(e)}")
+    finally:
         await exchange.close()
-        return None
 
 async def start_trading_with_semaphore(semaphore, user_id):
     """Обёртка для start_trading с использованием семафора"""
@@ -3,18 +3,24 @@ import ccxt.async_support as ccxt
 from utils import logger_main, log_exception
 from exchange_utils import unavailable_symbols, filtered_symbols_cache, symbol_check_cache
 from async_exchange_fetcher import async_exchange_fetcher
-from redis_client import redis_client
+from redis_client import get_or_refresh_json
 from exchange_factory import create_exchange
 
 async def filter_symbols_for_exchange(preferred_exchange, exchange_data, loop=None):
-    """Filters symbols for a given exchange using a single user's API key"""
+    """Filters symbols for a given exchange using a single user's API key.
+    Served from Redis for 24 hours; the filtering reruns in the background before that, never on the caller's path
+    once a result is cached"""
     logger_main.debug(f"Filtering symbols for {preferred_exchange}")
-    cache_key = f"filtered_symbols:{preferred_exchange}"
-    cached_symbols = await redis_client.get_json(cache_key)
-    if cached_symbols is not None:
-        filtered_symbols_cache[preferred_exchange] = cached_symbols
-        logger_main.debug(f"Loaded {len(cached_symbols)} cached symbols for {preferred_exchange} from Redis")
-        return cached_symbols
+    filtered_symbols = await get_or_refresh_json(f"filtered_symbols:{preferred_exchange}",
+                                                 lambda: check_symbols_for_exchange(preferred_exchange, exchange_data, loop),
+                                                 ttl=86400, lock_ttl=1800, should_cache=lambda symbols: len(symbols) > 0)
+    if not filtered_symbols:
+        return []
+    filtered_symbols_cache[preferred_exchange] = filtered_symbols
+    return filtered_symbols
+
+async def check_symbols_for_exchange(preferred_exchange, exchange_data, loop=None):
+    """Checks which USDT spot symbols of an exchange are tradable with a user's API key, [] on failure"""
     exchange = await create_exchange(preferred_exchange, exchange_data, loop)
     if exchange is None:
         logger_main.error(f"Failed to create exchange for symbol filtering for {preferred_exchange}")
@@ -100,10 +106,7 @@ async def filter_symbols_for_exchange(preferred_exchange, exchange_data, loop=No
             logger_main.warning(f"Symbol {symbol} unavailable for trading on {preferred_exchange}: {str(e)}")
             unavailable_symbols[preferred_exchange].add(symbol)
             symbol_check_cache[cache_key] = "unavailable"
-    filtered_symbols_cache[preferred_exchange] = filtered_symbols
-    # Cache in Redis for 24 hours
-    await redis_client.set_json(cache_key, filtered_symbols, expire=86400)
-    logger_main.debug(f"Cached {len(filtered_symbols)} available symbols for {preferred_exchange}: {filtered_symbols[:10]}...")
+    logger_main.debug(f"Found {len(filtered_symbols)} available symbols for {preferred_exchange}: {filtered_symbols[:10]}...")
     await async_exchange_fetcher.close(exchange)
     return filtered_symbols
 
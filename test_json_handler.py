@@ -0,0 +1,54 @@
+import json
+import msgpack
+import pytest
+from json_handler import encode_trade, decode_trade, TRADE_CODEC_VERSION, TRADE_CODEC_MARKER
+from trade_record import Trade
+
+TRADE = {
+    "trade_id": "trade:0lz3x9k2a000001",
+    "user_id": "42",
+    "symbol": "BTC/USDT",
+    "side": "buy",
+    "amount": 0.5,
+    "price": 65000.0,
+    "timestamp": "2024-05-01T12:00:00",
+    "status": "closed",
+    "pnl": -12.5,
+    "signals": {"signal_generator": 1, "strategy_signals": {"rsi": 1}, "combined_signal": 1},
+    "source": "real",
+}
+
+def test_round_trip_keeps_every_field():
+    decoded = decode_trade(encode_trade(TRADE))
+    assert isinstance(decoded, Trade)
+    assert decoded.to_dict() == TRADE
+
+def test_round_trip_keeps_unknown_keys_and_unset_fields():
+    trade = dict(TRADE, strategies=["rsi", "macd"], signal="buy")
+    del trade["pnl"]
+    decoded = decode_trade(encode_trade(trade))
+    assert decoded.to_dict() == trade
+    assert "pnl" not in decoded
+
+def test_encoded_trade_carries_marker_and_version():
+    data = encode_trade(Trade.from_dict(TRADE))
+    assert data[0] == TRADE_CODEC_MARKER
+    assert data[1] == TRADE_CODEC_VERSION
+
+def test_decodes_version_1_bodies():
+    data = bytes((TRADE_CODEC_MARKER, 1)) + msgpack.packb(TRADE, use_bin_type=True)
+    assert decode_trade(data).to_dict() == TRADE
+
+def test_decodes_legacy_json():
+    assert decode_trade(json.dumps(TRADE)).to_dict() == TRADE
+    assert decode_trade(json.dumps(TRADE).encode()).to_dict() == TRADE
+
+def test_decodes_surrogate_escaped_str():
+    # Redis clients with encoding_errors='surrogateescape' return binary values as str
+    data = encode_trade(TRADE).decode("utf-8", "surrogateescape")
+    assert decode_trade(data).to_dict() == TRADE
+
+def test_rejects_unknown_version():
+    data = bytes((TRADE_CODEC_MARKER, TRADE_CODEC_VERSION + 1)) + msgpack.packb([], use_bin_type=True)
+    with pytest.raises(Exception, match="unsupported trade schema version"):
+        decode_trade(data)
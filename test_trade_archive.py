@@ -0,0 +1,37 @@
+import os
+import gzip
+import json
+from trade_archive import TradeArchive
+
+DAY = 1_704_100_000  # 2024-01-01 UTC
+
+def _trade(trade_id, **fields):
+    return dict({"trade_id": trade_id, "timestamp": DAY, "pnl": 0.0, "status": "filled"}, **fields)
+
+def _archive_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".jsonl.gz"))
+
+def test_runs_merge_into_one_file_per_day(tmp_path):
+    archive = TradeArchive(str(tmp_path))
+    archive.append([(DAY, _trade("trade:a"))])
+    archive.append([(DAY, _trade("trade:b")), (DAY + 86400, _trade("trade:c", timestamp=DAY + 86400))])
+    assert _archive_files(tmp_path) == ["trades-2024-01-01.jsonl.gz", "trades-2024-01-02.jsonl.gz"]
+    assert sorted(trade["trade_id"] for trade in archive.read()) == ["trade:a", "trade:b", "trade:c"]
+
+def test_former_per_run_files_are_folded_into_the_day_file(tmp_path):
+    with gzip.open(tmp_path / "trades-2024-01-01-1.jsonl.gz", "wb") as f:
+        f.write((json.dumps(_trade("trade:a")) + "\n").encode())
+    archive = TradeArchive(str(tmp_path))
+    archive.append([(DAY, _trade("trade:b"))])
+    assert _archive_files(tmp_path) == ["trades-2024-01-01.jsonl.gz"]
+    assert sorted(trade["trade_id"] for trade in archive.read()) == ["trade:a", "trade:b"]
+
+def test_update_changes_the_archived_trade(tmp_path):
+    archive = TradeArchive(str(tmp_path))
+    archive.append([(DAY, _trade("trade:a")), (DAY, _trade("trade:b"))])
+    old_trade, trade = archive.update("trade:a", {"pnl": 4.5, "status": "completed"}, DAY)
+    assert old_trade["pnl"] == 0.0 and trade["pnl"] == 4.5
+    assert {item["trade_id"]: item["status"] for item in archive.read()} == {"trade:a": "completed", "trade:b": "filled"}
+    # Without a timestamp every day is searched
+    assert archive.update("trade:b", {"pnl": 1.0})[1]["pnl"] == 1.0
+    assert archive.update("trade:missing", {"pnl": 1.0}) is None
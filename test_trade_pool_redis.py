@@ -0,0 +1,152 @@
+import asyncio
+from json_handler import encode_trade
+from trade_record import Trade
+from trade_pool_redis import (
+    TradeIdGenerator, encode_trade_id, trade_id_timestamp, trade_ids_after_cursor, page_trades_from_redis,
+    trade_dedupe_key, watch_trade_claims
+)
+
+class _TimeIndexClient:
+    """Just the sorted set reads and MGET page_trades_from_redis needs, over trade_id -> score"""
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    async def zscore(self, key, member):
+        return self.scores.get(member)
+
+    async def zrangebyscore(self, key, min_score, max_score, start=0, num=None, withscores=False):
+        low = float(min_score)
+        entries = sorted(((score, trade_id) for trade_id, score in self.scores.items() if score >= low))
+        entries = entries[start:start + num]
+        return [(trade_id, score) for score, trade_id in entries]
+
+    async def mget(self, keys):
+        return [encode_trade({"trade_id": key}) if key in self.scores else None for key in keys]
+
+def test_trade_ids_sort_by_time_then_shard_then_sequence():
+    ids = [
+        encode_trade_id(1_700_000_000_000, 1, 5),
+        encode_trade_id(1_700_000_000_000, 2, 1),
+        encode_trade_id(1_700_000_000_001, 0, 0),
+        encode_trade_id(1_800_000_000_000, 1023, (1 << 22) - 1),
+    ]
+    assert sorted(ids) == ids
+    assert len(set(len(trade_id) for trade_id in ids)) == 1
+
+def test_generated_ids_increase_and_encode_their_time():
+    generator = TradeIdGenerator(shard=3)
+    ids = [generator.next_id(1_700_000_000.123) for _ in range(100)]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert trade_id_timestamp(ids[0]) == 1_700_000_000.123
+
+def test_concurrent_shards_never_collide():
+    first, second = TradeIdGenerator(shard=1), TradeIdGenerator(shard=2)
+    assert first.next_id(1_700_000_000) != second.next_id(1_700_000_000)
+
+def test_legacy_ids_have_no_timestamp():
+    assert trade_id_timestamp("trade:6f1c2a1e-8d0b-4c57-9d3e-2b1c6e7f9a10") is None
+    assert trade_id_timestamp(None) is None
+
+def test_trade_ids_after_cursor_breaks_ties_by_id():
+    entries = [("trade:a", 10.0), ("trade:b", 10.0), ("trade:c", 10.0), ("trade:d", 11.0)]
+    assert trade_ids_after_cursor(entries, None) == ["trade:a", "trade:b", "trade:c", "trade:d"]
+    assert trade_ids_after_cursor(entries, (10.0, "trade:b")) == ["trade:c", "trade:d"]
+    assert trade_ids_after_cursor(entries, (11.0, "trade:d")) == []
+
+def test_pages_neither_repeat_nor_skip_trades_sharing_a_timestamp():
+    # Ids that do not encode their time, so order among equal scores comes from the cursor alone
+    scores = {f"trade:{i:03d}": float(i // 7) for i in range(57)}
+    client = _TimeIndexClient(scores)
+
+    async def read_all(limit):
+        seen = []
+        cursor = None
+        while True:
+            trades, cursor = await page_trades_from_redis(client, after=cursor, limit=limit)
+            seen.extend(trade["trade_id"] for trade in trades)
+            if cursor is None:
+                return seen
+
+    for limit in (1, 5, 7, 10, 57, 100):
+        assert asyncio.run(read_all(limit)) == sorted(scores, key=lambda trade_id: (scores[trade_id], trade_id))
+
+class _ClaimPipe:
+    """WATCH and MGET over stored dedupe claims, as watch_trade_claims uses them"""
+
+    def __init__(self, claims):
+        self.claims = claims
+
+    async def watch(self, *keys):
+        pass
+
+    async def mget(self, keys):
+        return [self.claims.get(key) for key in keys]
+
+def test_trades_without_timestamp_are_deduplicated():
+    trade = Trade(user_id="42", symbol="BTC/USDT", side="buy", amount=0.5, price=65000.0).fill_defaults()
+    again = trade.copy()
+    again["trade_id"] = "trade:second"
+    trade["trade_id"] = "trade:first"
+    assert trade_dedupe_key(trade) == trade_dedupe_key(again)
+    assert trade_dedupe_key(trade) != trade_dedupe_key(dict(again, amount=0.6))
+    # Re-added in the same batch, and again once the first one is stored
+    assert asyncio.run(watch_trade_claims(_ClaimPipe({}), [trade, again])) == [None, "trade:first"]
+    claims = {trade_dedupe_key(trade): "trade:first"}
+    assert asyncio.run(watch_trade_claims(_ClaimPipe(claims), [again])) == ["trade:first"]
+
+def test_order_id_identifies_trades_without_timestamp():
+    trade = {"user_id": "42", "symbol": "BTC/USDT", "side": "buy", "order_id": "123", "amount": 0.5}
+    assert trade_dedupe_key(trade) == trade_dedupe_key(dict(trade, amount=0.4))
+    assert trade_dedupe_key(trade) != trade_dedupe_key(dict(trade, order_id="124"))
+    assert trade_dedupe_key(trade) != trade_dedupe_key(dict(trade, timestamp=1_700_000_000))
+
+class _LeaseClient:
+    """INCR, SET NX EX and the lease scripts over a dict, without expiry"""
+
+    def __init__(self, counter=0):
+        self.values = {"trade_id:shard_counter": counter}
+
+    async def incr(self, key):
+        self.values[key] += 1
+        return self.values[key]
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def register_script(self, script):
+        async def run(keys, args, client=None):
+            if self.values.get(keys[0]) != args[0]:
+                return 0
+            if "DEL" in script:
+                del self.values[keys[0]]
+            return 1
+        return run
+
+def test_live_shards_are_never_shared():
+    client = _LeaseClient()
+    first = asyncio.run(TradeIdGenerator.create(client))
+    # 1024 restarts later the counter points at the first process' shard again
+    client.values["trade_id:shard_counter"] += 1023
+    second = asyncio.run(TradeIdGenerator.create(client))
+    assert first.shard != second.shard
+    assert first.next_id(1_700_000_000) != second.next_id(1_700_000_000)
+
+def test_lost_lease_moves_to_a_free_shard():
+    client = _LeaseClient()
+    generator = asyncio.run(TradeIdGenerator.create(client))
+    shard = generator.shard
+    assert asyncio.run(generator.renew_lease(client)) == shard
+    # The lease expired and another process took the shard
+    client.values[f"trade_id:shard:{shard}"] = "other"
+    assert asyncio.run(generator.renew_lease(client)) != shard
+    assert client.values[f"trade_id:shard:{shard}"] == "other"
+
+def test_released_shard_can_be_leased_again():
+    client = _LeaseClient()
+    generator = asyncio.run(TradeIdGenerator.create(client))
+    asyncio.run(generator.release_lease(client))
+    assert f"trade_id:shard:{generator.shard}" not in client.values
@@ -0,0 +1,50 @@
+import random
+from trade_pool_sketches import QuantileSketch, sketch_key
+
+def _exact_quantile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+def test_quantiles_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(0, 2) * rng.choice((-1, 1)) for _ in range(5000)]
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+    assert sketch.count == len(values)
+    for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+        exact = _exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * abs(exact) + 1e-9
+
+def test_empty_sketch_has_no_quantiles():
+    sketch = QuantileSketch()
+    assert sketch.quantile(0.5) is None
+    assert sketch.mean() is None
+    assert sketch.tail_mean(0.05) is None
+
+def test_merge_equals_sketch_of_all_values():
+    first, second, combined = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for i in range(1, 200):
+        (first if i % 2 else second).add(i * 0.37)
+        combined.add(i * 0.37)
+    assert first.merge(second).buckets == combined.buckets
+
+def test_remove_undoes_add():
+    sketch = QuantileSketch()
+    for value in (-3.0, 0.0, 2.5, 10.0):
+        sketch.add(value)
+    sketch.add(2.5, count=-1)
+    sketch.add(0.0, count=-1)
+    expected = QuantileSketch()
+    for value in (-3.0, 10.0):
+        expected.add(value)
+    assert sketch.buckets == expected.buckets
+
+def test_from_fields_drops_empty_buckets():
+    sketch = QuantileSketch.from_fields({"+10": "3", "-2": "0", "0": "1"})
+    assert sketch.buckets == {"+10": 3, "0": 1}
+    assert sketch.count == 4
+
+def test_global_and_user_sketch_keys_never_collide():
+    assert sketch_key("pnl") != sketch_key("pnl", "_global")
+    assert sketch_key("pnl", "all") != sketch_key("pnl")
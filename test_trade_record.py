@@ -0,0 +1,47 @@
+import pytest
+from trade_record import Trade, TRADE_FIELDS
+
+def test_behaves_like_a_dict():
+    trade = Trade(symbol="ETH/USDT", pnl=1.5, note="manual")
+    assert trade["symbol"] == "ETH/USDT"
+    assert trade.get("status") is None
+    assert trade.get("note") == "manual"
+    assert "pnl" in trade and "status" not in trade
+    assert dict(trade) == {"symbol": "ETH/USDT", "pnl": 1.5, "note": "manual"}
+    assert trade == {"symbol": "ETH/USDT", "pnl": 1.5, "note": "manual"}
+    with pytest.raises(KeyError):
+        trade["status"]
+
+def test_delete_unsets_fields_and_extra_keys():
+    trade = Trade(symbol="ETH/USDT", note="manual")
+    del trade["symbol"]
+    del trade["note"]
+    assert len(trade) == 0
+    with pytest.raises(KeyError):
+        del trade["symbol"]
+
+def test_row_round_trip_keeps_unset_fields_unset():
+    trade = Trade.from_dict({"trade_id": "trade:1", "pnl": None, "strategies": ["rsi"]})
+    row = trade.to_row()
+    assert len(row) == len(TRADE_FIELDS) + 2
+    restored = Trade.from_row(row)
+    assert restored.to_dict() == {"trade_id": "trade:1", "pnl": None, "strategies": ["rsi"]}
+    assert "status" not in restored
+
+def test_from_dict_returns_trades_as_is():
+    trade = Trade(symbol="ETH/USDT")
+    assert Trade.from_dict(trade) is trade
+
+def test_fill_defaults_does_not_share_mutable_values():
+    first = Trade(symbol="ETH/USDT").fill_defaults()
+    second = Trade(symbol="BTC/USDT", status="closed").fill_defaults()
+    assert first["status"] == "pending" and second["status"] == "closed"
+    first["signals"]["strategy_signals"]["rsi"] = 1
+    assert second["signals"]["strategy_signals"] == {}
+
+def test_copy_is_shallow_and_independent():
+    trade = Trade(symbol="ETH/USDT", note="manual")
+    copy = trade.copy()
+    copy["symbol"] = "BTC/USDT"
+    copy["note"] = "auto"
+    assert trade["symbol"] == "ETH/USDT" and trade["note"] == "manual"
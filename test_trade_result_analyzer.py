@@ -0,0 +1,75 @@
+import time
+import asyncio
+import trade_result_analyzer
+from trade_result_analyzer import TradeResultAnalyzer
+
+class _Events:
+    """The consumer group reads and acks analyze_trades makes, over a fixed list of events"""
+
+    def __init__(self, events):
+        self.pending = list(events)
+        self.acked = []
+
+    async def read_pending(self, redis_client):
+        return [event for event in self.pending if event[0] not in self.acked]
+
+    async def read_new(self, redis_client, block=True):
+        return []
+
+    async def ack(self, redis_client, event_ids):
+        self.acked.extend(event_ids)
+
+class _TradePool:
+    def __init__(self, fail_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.updates = []
+
+    async def _ensure_redis_client(self):
+        return None
+
+    async def update_trade_pnl(self, trade_id, pnl, status="completed", fields=None):
+        if trade_id in self.fail_ids:
+            return False
+        self.updates.append((trade_id, pnl, status, fields))
+        return True
+
+class _RetrainEngine:
+    async def retrain(self, training_data):
+        pass
+
+def _event(event_id, trade_id, price=100.0):
+    trade = {
+        "trade_id": trade_id, "symbol": "BTC/USDT", "side": "buy", "price": price, "amount": 2.0,
+        "status": "filled", "timestamp": time.time() - 5 * 3600,
+        "signals": {}, "signal_metrics": {}, "market_conditions": {},
+    }
+    return event_id, {"type": "add", "trade_id": trade_id, "trade": trade}
+
+def _analyzer(monkeypatch, trade_pool, events):
+    async def fetch_ticker_cached(exchange, symbol):
+        return {"last": 110.0}
+    monkeypatch.setattr(trade_result_analyzer, "fetch_ticker_cached", fetch_ticker_cached)
+    analyzer = TradeResultAnalyzer(trade_pool, _RetrainEngine())
+    analyzer.events = events
+    return analyzer
+
+def test_labeled_trade_is_saved_then_acked(monkeypatch):
+    trade_pool = _TradePool()
+    events = _Events([_event("1-0", "trade:a")])
+    analyzer = _analyzer(monkeypatch, trade_pool, events)
+    asyncio.run(analyzer.analyze_trades(exchange=None))
+    assert trade_pool.updates == [("trade:a", 20.0, "filled", {"success_label": 1})]
+    assert events.acked == ["1-0"]
+    assert analyzer.training_data[0]["status"] == "successful"
+    # Acked events are not read again
+    asyncio.run(analyzer.analyze_trades(exchange=None))
+    assert len(trade_pool.updates) == 1
+
+def test_failed_write_stays_pending_without_blocking_other_trades(monkeypatch):
+    trade_pool = _TradePool(fail_ids={"trade:a"})
+    events = _Events([_event("1-0", "trade:a"), _event("2-0", "trade:b")])
+    analyzer = _analyzer(monkeypatch, trade_pool, events)
+    asyncio.run(analyzer.analyze_trades(exchange=None))
+    assert [update[0] for update in trade_pool.updates] == ["trade:b"]
+    assert events.acked == ["2-0"]
+    assert len(analyzer.training_data) == 1
@@ -1,4 +1,3 @@
-import pandas as pd
 import numpy as np
 from logging_setup import logger_main, logger_exceptions
 from trade_pool import global_trade_pool
@@ -13,40 +12,6 @@ class TradeAnalyzer:
         self.cache_key_prefix = "trade_analyzer:stats:"
         logger_main.info("Initializing TradeAnalyzer")
 
-    async def fetch_trades(self):
-        """Fetches the latest trades"""
-        logger_main.debug("Fetching the latest trades")
-        trades = await global_trade_pool.get_all_trades()
-        # Limit to 1000 trades
-        trades = trades[-1000:] if len(trades) > 1000 else trades
-        logger_main.debug(f"Fetched {len(trades)} trades")
-        return trades
-
-    def prepare_trades(self, trades):
-        """Prepares trades for analysis"""
-        logger_main.debug("Converting trades to DataFrame")
-        try:
-            df = pd.DataFrame(trades)
-            if df.empty:
-                logger_main.warning("Trade DataFrame is empty")
-                return None
-            # Convert timestamp to datetime
-            if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                logger_main.debug(f"After timestamp conversion: {df['timestamp'].head()}")
-                if df['timestamp'].isnull().all():
-                    logger_main.warning("All timestamp values are invalid, skipping analysis")
-                    return None
-            else:
-                logger_main.warning("Field 'timestamp' is missing in trade data, skipping analysis")
-                return None
-            logger_main.debug(f"Trades in DataFrame: {df.head().to_dict()}")
-            return df
-        except Exception as e:
-            logger_main.error(f"Error preparing trades: {str(e)}")
-            logger_exceptions.error(f"Error preparing trades: {str(e)}", exc_info=True)
-            return None
-
     async def analyze_trade_success(self, user_id=None):
         """Analyzes trade success and market conditions"""
         logger_main.debug("Analyzing trade success")
@@ -58,56 +23,54 @@ class TradeAnalyzer:
             logger_main.debug(f"Using cached trade analysis for {user_id if user_id else 'all users'}")
             return cached_analysis
         try:
-            trades = await self.fetch_trades()
-            df = self.prepare_trades(trades)
-            if df is None or len(df) < self.min_trades_for_analysis:
-                logger_main.warning(f"Insufficient trades for analysis: {len(df) if df is not None else 0} trades, required {self.min_trades_for_analysis}")
+            # Aggregates run directly on the pool's columnar store over the last 1000 trades
+            trade_store = await global_trade_pool.get_column_store()
+            available_trades = trade_store.summary(limit=1000)["count"]
+            if available_trades < self.min_trades_for_analysis:
+                logger_main.warning(f"Insufficient trades for analysis: {available_trades} trades, required {self.min_trades_for_analysis}")
                 return {}
             # Filter by user_id if provided
-            if user_id:
-                df = df[df['user_id'] == user_id]
-                if df.empty:
-                    logger_main.warning(f"No trades found for user {user_id}")
-                    return {}
+            filters = {"user_id": user_id} if user_id else {}
+            stats = trade_store.summary(limit=1000, **filters)
+            if not stats["count"]:
+                logger_main.warning(f"No trades found for user {user_id}")
+                return {}
             analysis = {}
             # General trade statistics
-            total_trades = len(df)
-            successful_trades = len(df[df['pnl'] > 0])
-            success_rate = successful_trades / total_trades if total_trades > 0 else 0
-            avg_pnl = df['pnl'].mean() if not df['pnl'].empty else 0
-            analysis["total_trades"] = total_trades
-            analysis["successful_trades"] = successful_trades
-            analysis["success_rate"] = success_rate
-            analysis["average_pnl"] = avg_pnl
+            analysis["total_trades"] = stats["count"]
+            analysis["successful_trades"] = stats["wins"]
+            analysis["success_rate"] = stats["success_rate"]
+            analysis["average_pnl"] = stats["mean_pnl"]
             # Analysis by user (if user_id is not specified)
             if not user_id:
-                user_stats = df.groupby('user_id').agg({
-                    'pnl': ['mean', 'sum']
-                }).to_dict()
-                user_trade_counts = df['user_id'].value_counts().to_dict()
+                user_stats = trade_store.group_by("user_id", limit=1000)
                 # Получаем депозиты пользователей из bot_user_data
-                user_deposits = {user: get_user_deposit(user) for user in user_trade_counts.keys()}
+                user_deposits = {user: get_user_deposit(user) for user in user_stats.keys()}
                 analysis["user_stats"] = {
                     user: {
-                        "avg_pnl": user_stats.get(('pnl', 'mean'), {}).get(user, 0),
-                        "total_pnl": user_stats.get(('pnl', 'sum'), {}).get(user, 0),
-                        "trade_count": user_trade_counts.get(user, 0),
+                        "avg_pnl": stats_by_user["mean_pnl"],
+                        "total_pnl": stats_by_user["total_pnl"],
+                        "trade_count": stats_by_user["count"],
                         "deposit": user_deposits.get(user, 0),
-                        "commission": monetization.calculate_commission(user_deposits.get(user, 0), user_stats.get(('pnl', 'sum'), {}).get(user, 0))
+                        "commission": monetization.calculate_commission(user_deposits.get(user, 0), stats_by_user["total_pnl"])
                     }
-                    for user in user_trade_counts.keys()
+                    for user, stats_by_user in user_stats.items()
                 }
             # Market conditions analysis
-            market_conditions = df['market_conditions'].dropna()
-            if not market_conditions.empty:
-                market_df = pd.DataFrame(market_conditions.tolist())
-                if 'avg_drop' in market_df and 'avg_volatility' in market_df:
-                    avg_drop = market_df['avg_drop'].mean()
-                    avg_volatility = market_df['avg_volatility'].mean()
-                    analysis["market_conditions"] = {
-                        "avg_drop": avg_drop,
-                        "avg_volatility": avg_volatility
-                    }
+            market_columns = trade_store.columns(["avg_drop", "avg_volatility"], limit=1000, **filters)
+            if np.isfinite(market_columns["avg_drop"]).any() and np.isfinite(market_columns["avg_volatility"]).any():
+                analysis["market_conditions"] = {
+                    "avg_drop": float(np.nanmean(market_columns["avg_drop"])),
+                    "avg_volatility": float(np.nanmean(market_columns["avg_volatility"]))
+                }
+            # PnL percentiles, tail loss and symbol diversity from the pool's streaming sketches
+            sketch_stats = await global_trade_pool.get_trade_statistics(user_id)
+            if sketch_stats.get("closed_trades"):
+                analysis["pnl_percentiles"] = sketch_stats["pnl_quantiles"]
+                analysis["tail_loss"] = sketch_stats["tail_loss"]
+                analysis["holding_time_percentiles"] = sketch_stats["holding_time_quantiles"]
+            if sketch_stats:
+                analysis["distinct_symbols"] = sketch_stats["distinct_symbols"]
             # Cache the result in Redis for 10 minutes
             await redis_client.setex(cache_key, 600, analysis)
             logger_main.info(f"Trade analysis completed for {user_id if user_id else 'all users'}: {analysis}")
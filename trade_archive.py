@@ -0,0 +1,145 @@
+import os
+import gzip
+import fcntl
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging_setup import logger_main
+from json_handler import dumps, loads
+from trade_record import Trade
+
+class TradeArchive:
+    """Cold tier of the trade pool: gzip-compressed JSONL files partitioned by trade day (UTC).
+
+    Each trade day is one file, trades-YYYY-MM-DD.jsonl.gz. Archiving or updating trades merges them into their
+    day's file via a tmp file and an atomic rename, under a lock file shared by every process using the directory,
+    so a crash never leaves a partial file behind and concurrent writers never drop each other's trades. Files of
+    the former per-run layout (trades-YYYY-MM-DD-<run>.jsonl.gz) are folded into their day's file on its next
+    write. A trade archived twice is kept once, the later copy winning."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            for name in os.listdir(directory):
+                if name.endswith(".tmp"):
+                    os.remove(os.path.join(directory, name))
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock over the archive files, across threads and processes"""
+        with open(os.path.join(self.directory, ".lock"), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _day(timestamp):
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+    def _day_path(self, day):
+        return os.path.join(self.directory, f"trades-{day}.jsonl.gz")
+
+    @staticmethod
+    def _read_file(path):
+        """{trade_id: Trade} of one archive file, empty if it is gone (merged away meanwhile)"""
+        trades = {}
+        try:
+            with gzip.open(path, 'rb') as f:
+                for line in f:
+                    trade = Trade.from_dict(loads(line))
+                    trades[trade.get("trade_id")] = trade
+        except FileNotFoundError:
+            pass
+        return trades
+
+    def _read_day(self, day):
+        """(trades of a day by trade_id, the files holding them); must be called under the lock"""
+        paths = self._files_of_days(day, day)
+        trades = {}
+        for path in paths:
+            trades.update(self._read_file(path))
+        return trades, paths
+
+    def _write_day(self, day, trades, old_paths):
+        """Replaces a day's files with one file of trades; must be called under the lock"""
+        path = self._day_path(day)
+        with open(path + ".tmp", 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write("".join(f"{dumps(trade)}\n" for trade in trades).encode())
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(path + ".tmp", path)
+        # Only duplicates of what the day's file now holds; a crash before removing them is harmless
+        for old_path in old_paths:
+            if old_path != path:
+                os.remove(old_path)
+
+    def append(self, timed_trades):
+        """Archives (timestamp, trade) pairs, merging them into their days' files"""
+        by_day = {}
+        for timestamp, trade in timed_trades:
+            by_day.setdefault(self._day(timestamp), []).append(trade)
+        with self._locked():
+            for day, trades in by_day.items():
+                merged, paths = self._read_day(day)
+                merged.update((trade.get("trade_id"), trade) for trade in trades)
+                self._write_day(day, merged.values(), paths)
+        return len(timed_trades)
+
+    def update(self, trade_id, changes, timestamp=None):
+        """Applies changes (field -> value) to an archived trade, returns (old trade, updated trade) or None if it
+        is not archived. timestamp (epoch seconds) locates the trade's day; without it every day is searched"""
+        with self._locked():
+            if timestamp is not None:
+                days = [self._day(timestamp)]
+            else:
+                days = sorted({self._file_day(os.path.basename(path)) for path in self._files()})
+            for day in days:
+                trades, paths = self._read_day(day)
+                old_trade = trades.get(trade_id)
+                if old_trade is None:
+                    continue
+                trade = old_trade.copy()
+                trade.update(changes)
+                trades[trade_id] = trade
+                self._write_day(day, trades.values(), paths)
+                return old_trade, trade
+        return None
+
+    @staticmethod
+    def _file_day(name):
+        return name[len("trades-"):len("trades-YYYY-MM-DD")]
+
+    def _files_of_days(self, first=None, last=None):
+        files = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("trades-") and name.endswith(".jsonl.gz")):
+                continue
+            day = self._file_day(name)
+            if (first is None or day >= first) and (last is None or day <= last):
+                files.append(os.path.join(self.directory, name))
+        return files
+
+    def _files(self, since=None, until=None):
+        """Archive files whose trade day overlaps [since, until], oldest day first"""
+        first = self._day(since) if since is not None else None
+        last = self._day(until) if until is not None else None
+        return self._files_of_days(first, last)
+
+    def read(self, since=None, until=None, trade_filter=None, timestamp_of=None):
+        """Returns archived trades within [since, until] (epoch seconds) that pass trade_filter"""
+        trades = {}
+        for path in self._files(since, until):
+            for trade_id, trade in self._read_file(path).items():
+                if timestamp_of is not None:
+                    timestamp = timestamp_of(trade)
+                    if (since is not None and timestamp < since) or (until is not None and timestamp > until):
+                        continue
+                if trade_filter is None or trade_filter(trade):
+                    trades[trade_id] = trade
+        logger_main.debug(f"Read {len(trades)} archived trades from {self.directory}")
+        return list(trades.values())
+
+__all__ = ['TradeArchive']
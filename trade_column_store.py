@@ -0,0 +1,191 @@
+import numpy as np
+from trade_pool_redis import trade_timestamp
+
+NUMERIC_COLUMNS = ("timestamp", "pnl", "amount", "price", "avg_drop", "avg_volatility")
+CATEGORY_COLUMNS = ("user_id", "symbol", "source", "status", "side")
+
+class TradeColumnStore:
+    """In-process columnar copy of the trade pool for analytics.
+
+    Numeric fields live in growable float64 buffers and string fields in int32 code buffers with a
+    per-column dictionary, so filters and group-by aggregates run as numpy operations over the columns
+    instead of rebuilding DataFrames from lists of dicts. At most max_rows trades are kept: appending beyond
+    that evicts the oldest rows (in append order) in blocks of a tenth of max_rows."""
+
+    def __init__(self, capacity=4096, max_rows=None):
+        self._size = 0
+        self._capacity = capacity
+        self.max_rows = max_rows
+        self._trade_ids = []  # row -> trade_id
+        self._numeric = {name: np.full(capacity, np.nan) for name in NUMERIC_COLUMNS}
+        self._codes = {name: np.zeros(capacity, dtype=np.int32) for name in CATEGORY_COLUMNS}
+        self._categories = {name: [] for name in CATEGORY_COLUMNS}  # code -> value
+        self._category_codes = {name: {} for name in CATEGORY_COLUMNS}  # value -> code
+        self._rows = {}  # trade_id -> row
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, needed):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        for name, column in self._numeric.items():
+            grown = np.full(capacity, np.nan)
+            grown[:self._size] = column[:self._size]
+            self._numeric[name] = grown
+        for name, column in self._codes.items():
+            grown = np.zeros(capacity, dtype=np.int32)
+            grown[:self._size] = column[:self._size]
+            self._codes[name] = grown
+        self._capacity = capacity
+
+    def _evict(self, count):
+        """Drops the oldest count rows, shifting the others down"""
+        count = min(count, self._size)
+        remaining = self._size - count
+        for column in list(self._numeric.values()) + list(self._codes.values()):
+            column[:remaining] = column[count:self._size]
+        for trade_id in self._trade_ids[:count]:
+            del self._rows[trade_id]
+        self._trade_ids = self._trade_ids[count:]
+        for row, trade_id in enumerate(self._trade_ids):
+            self._rows[trade_id] = row
+        self._size = remaining
+
+    def _code(self, name, value):
+        value = "" if value is None else str(value)
+        codes = self._category_codes[name]
+        if value not in codes:
+            codes[value] = len(self._categories[name])
+            self._categories[name].append(value)
+        return codes[value]
+
+    @staticmethod
+    def _float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    def append(self, trades):
+        """Appends trades; trades already in the store (same trade_id) are skipped"""
+        trades = [trade for trade in trades if trade.get("trade_id") not in self._rows]
+        if not trades:
+            return 0
+        if self.max_rows is not None:
+            trades = trades[-self.max_rows:]
+            excess = self._size + len(trades) - self.max_rows
+            if excess > 0:
+                self._evict(max(excess, self.max_rows // 10))
+        self._grow(self._size + len(trades))
+        for trade in trades:
+            row = self._size
+            market_conditions = trade.get("market_conditions") or {}
+            numeric = self._numeric
+            numeric["timestamp"][row] = trade_timestamp(trade)
+            numeric["pnl"][row] = self._float(trade.get("pnl", 0.0))
+            numeric["amount"][row] = self._float(trade.get("amount"))
+            numeric["price"][row] = self._float(trade.get("price"))
+            numeric["avg_drop"][row] = self._float(market_conditions.get("avg_drop"))
+            numeric["avg_volatility"][row] = self._float(market_conditions.get("avg_volatility"))
+            for name in CATEGORY_COLUMNS:
+                self._codes[name][row] = self._code(name, trade.get(name))
+            self._rows[trade.get("trade_id")] = row
+            self._trade_ids.append(trade.get("trade_id"))
+            self._size += 1
+        return len(trades)
+
+    def update(self, trade_id, pnl, status):
+        """Applies a PnL/status update to a stored trade"""
+        row = self._rows.get(trade_id)
+        if row is None:
+            return False
+        self._numeric["pnl"][row] = float(pnl)
+        self._codes["status"][row] = self._code("status", status)
+        return True
+
+    def mask(self, user_id=None, symbol=None, source=None, status=None, side=None, since=None, until=None):
+        """Boolean mask over the stored rows for the given filters (since/until in epoch seconds)"""
+        size = self._size
+        mask = np.ones(size, dtype=bool)
+        for name, value in (("user_id", user_id), ("symbol", symbol), ("source", source), ("status", status), ("side", side)):
+            if value is None:
+                continue
+            code = self._category_codes[name].get(str(value))
+            if code is None:
+                return np.zeros(size, dtype=bool)
+            mask &= self._codes[name][:size] == code
+        timestamps = self._numeric["timestamp"][:size]
+        if since is not None:
+            mask &= timestamps >= since
+        if until is not None:
+            mask &= timestamps <= until
+        return mask
+
+    def rows(self, limit=None, **filters):
+        """Matching row numbers ordered by timestamp; with limit only the last N"""
+        rows = np.flatnonzero(self.mask(**filters))
+        timestamps = self._numeric["timestamp"][rows]
+        if limit is not None and len(rows) > limit:
+            newest = np.argpartition(timestamps, len(rows) - limit)[len(rows) - limit:]
+            rows, timestamps = rows[newest], timestamps[newest]
+        return rows[np.argsort(timestamps, kind="stable")]
+
+    def columns(self, names=None, limit=None, **filters):
+        """Returns {column: ndarray} for matching rows; string columns are decoded to object arrays"""
+        rows = self.rows(limit=limit, **filters)
+        result = {}
+        for name in names or NUMERIC_COLUMNS + CATEGORY_COLUMNS:
+            if name in self._numeric:
+                result[name] = self._numeric[name][rows]
+            else:
+                result[name] = np.array(self._categories[name], dtype=object)[self._codes[name][rows]] \
+                    if self._categories[name] else np.empty(0, dtype=object)
+        return result
+
+    def summary(self, limit=None, **filters):
+        """Count, wins, success rate, PnL and volume totals of the matching trades"""
+        rows = self.rows(limit=limit, **filters)
+        pnl = self._numeric["pnl"][rows]
+        count = len(rows)
+        wins = int(np.count_nonzero(pnl > 0))
+        volume = np.nansum(self._numeric["amount"][rows] * self._numeric["price"][rows])
+        return {
+            "count": count,
+            "wins": wins,
+            "success_rate": wins / count if count else 0.0,
+            "total_pnl": float(np.nansum(pnl)),
+            "mean_pnl": float(np.nanmean(pnl)) if count else 0.0,
+            "volume": float(volume),
+            "max_loss": float(min(np.nanmin(pnl), 0.0)) if count else 0.0,
+        }
+
+    def group_by(self, key, limit=None, **filters):
+        """Per-value aggregates of a string column: count, wins, total_pnl, mean_pnl, volume, max_loss"""
+        rows = self.rows(limit=limit, **filters)
+        codes = self._codes[key][rows]
+        pnl = np.nan_to_num(self._numeric["pnl"][rows])
+        volume = np.nan_to_num(self._numeric["amount"][rows] * self._numeric["price"][rows])
+        groups = len(self._categories[key])
+        counts = np.bincount(codes, minlength=groups)
+        wins = np.bincount(codes, weights=pnl > 0, minlength=groups)
+        totals = np.bincount(codes, weights=pnl, minlength=groups)
+        volumes = np.bincount(codes, weights=volume, minlength=groups)
+        max_losses = np.zeros(groups)
+        np.minimum.at(max_losses, codes, pnl)
+        return {
+            self._categories[key][code]: {
+                "count": int(counts[code]),
+                "wins": int(wins[code]),
+                "total_pnl": float(totals[code]),
+                "mean_pnl": float(totals[code] / counts[code]),
+                "volume": float(volumes[code]),
+                "max_loss": float(max_losses[code]),
+            }
+            for code in np.flatnonzero(counts)
+        }
+
+__all__ = ['TradeColumnStore', 'NUMERIC_COLUMNS', 'CATEGORY_COLUMNS']
@@ -0,0 +1,135 @@
+import os
+import time
+import socket
+import asyncio
+from redis.exceptions import ResponseError
+from logging_setup import logger_main
+from utils import log_exception
+from json_handler import encode_trade, decode_trade
+from config_settings import TRADE_EVENT_STREAM_SETTINGS
+
+TRADE_EVENTS_STREAM = TRADE_EVENT_STREAM_SETTINGS['stream']
+TRADE_EVENT_TYPES = ("add", "update")
+
+def queue_trade_event(pipe, event_type, trade_data):
+    """Queues a trade event on an open pipeline, so it is published in the same MULTI as the write itself.
+    The stream is capped (approximate MAXLEN) at TRADE_EVENT_STREAM_SETTINGS['maxlen'] events"""
+    pipe.xadd(TRADE_EVENTS_STREAM, {
+        "type": event_type,
+        "trade_id": trade_data["trade_id"],
+        "user_id": trade_data.get("user_id") or "",
+        "trade": encode_trade(trade_data),
+    }, maxlen=TRADE_EVENT_STREAM_SETTINGS['maxlen'], approximate=True)
+
+def _decode_event(event_id, fields):
+    return event_id, {
+        "type": fields.get("type"),
+        "trade_id": fields.get("trade_id"),
+        "user_id": fields.get("user_id") or None,
+        "trade": decode_trade(fields["trade"]),
+    }
+
+async def latest_trade_event_id(redis_client):
+    """Id of the newest retained event ("0-0" for an empty stream): reading after it yields only later events"""
+    entries = await redis_client.xrevrange(TRADE_EVENTS_STREAM, count=1)
+    return entries[0][0] if entries else "0-0"
+
+async def read_trade_events(redis_client, last_id, count=None, block_ms=None):
+    """Returns [(event_id, event)] published after last_id, without a consumer group: every reader sees every
+    event and nothing is acknowledged, for process-local views that follow the stream"""
+    response = await redis_client.xread({TRADE_EVENTS_STREAM: last_id}, count=count or TRADE_EVENT_STREAM_SETTINGS['batch_size'],
+                                        block=block_ms)
+    return [_decode_event(event_id, fields) for _, entries in response or [] for event_id, fields in entries if fields]
+
+class TradeEventConsumer:
+    """Reads the trade event stream through a consumer group.
+
+    Every consumer of trade events uses its own group, so each sees every event; several processes in one group
+    share the work. Events stay pending until acknowledged: read_pending() redelivers this consumer's unacked
+    events (after a restart, or events the handler chose not to ack yet) and stale ones of dead consumers."""
+
+    def __init__(self, group, consumer=None, start_id="0", batch_size=None, block_ms=None, claim_idle_ms=None):
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.start_id = start_id  # Where a new group starts: "0" replays the retained stream, "$" only new events
+        self.batch_size = batch_size or TRADE_EVENT_STREAM_SETTINGS['batch_size']
+        self.block_ms = block_ms if block_ms is not None else TRADE_EVENT_STREAM_SETTINGS['block_ms']
+        self.claim_idle_ms = claim_idle_ms or TRADE_EVENT_STREAM_SETTINGS['claim_idle_ms']
+        self._group_ready = False
+
+    async def ensure_group(self, redis_client):
+        if self._group_ready:
+            return
+        try:
+            await redis_client.xgroup_create(TRADE_EVENTS_STREAM, self.group, id=self.start_id, mkstream=True)
+            logger_main.info(f"Created trade event consumer group {self.group} at {self.start_id}")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def replay_from(self, redis_client, event_id):
+        """Moves the group's offset, e.g. "0" to reprocess every retained event or an event id to resume after it"""
+        await self.ensure_group(redis_client)
+        await redis_client.xgroup_setid(TRADE_EVENTS_STREAM, self.group, event_id)
+        logger_main.info(f"Trade event consumer group {self.group} replaying from {event_id}")
+
+    async def read_new(self, redis_client, block=True):
+        """Returns [(event_id, event)] not yet delivered to the group, waiting up to block_ms for the first one"""
+        await self.ensure_group(redis_client)
+        response = await redis_client.xreadgroup(self.group, self.consumer, {TRADE_EVENTS_STREAM: ">"},
+                                                 count=self.batch_size, block=self.block_ms if block else None)
+        return [_decode_event(event_id, fields) for _, entries in response or [] for event_id, fields in entries]
+
+    async def read_pending(self, redis_client):
+        """Returns [(event_id, event)] delivered but not acknowledged: this consumer's own, then stale ones claimed
+        from consumers idle for claim_idle_ms"""
+        await self.ensure_group(redis_client)
+        events = []
+        last_id = "0"
+        while True:
+            response = await redis_client.xreadgroup(self.group, self.consumer, {TRADE_EVENTS_STREAM: last_id},
+                                                     count=self.batch_size)
+            entries = [(event_id, fields) for _, stream_entries in response or [] for event_id, fields in stream_entries]
+            if not entries:
+                break
+            events.extend(_decode_event(event_id, fields) for event_id, fields in entries if fields)
+            # Entries trimmed from the stream while pending come back without fields, nothing left to process
+            await self.ack(redis_client, [event_id for event_id, fields in entries if not fields])
+            last_id = entries[-1][0]
+        claimed = await redis_client.xautoclaim(TRADE_EVENTS_STREAM, self.group, self.consumer, self.claim_idle_ms,
+                                                start_id="0-0", count=self.batch_size)
+        # Own events idle long enough are "claimed" again too, keep each event once
+        seen = {event_id for event_id, _ in events}
+        events.extend(_decode_event(event_id, fields) for event_id, fields in claimed[1] if fields and event_id not in seen)
+        return events
+
+    async def ack(self, redis_client, event_ids):
+        if event_ids:
+            await redis_client.xack(TRADE_EVENTS_STREAM, self.group, *event_ids)
+
+    async def run(self, redis_client, handler):
+        """Feeds batches of events to handler(events) forever; handler returns the event ids to acknowledge
+        (None acknowledges the whole batch). Unacknowledged events are offered again every claim_idle_ms"""
+        last_pending_check = None
+        while True:
+            try:
+                events = []
+                now = time.monotonic()
+                if last_pending_check is None or now - last_pending_check >= self.claim_idle_ms / 1000:
+                    events = await self.read_pending(redis_client)
+                    last_pending_check = now
+                if not events:
+                    events = await self.read_new(redis_client)
+                if not events:
+                    continue
+                acked = await handler(events)
+                await self.ack(redis_client, [event_id for event_id, _ in events] if acked is None else acked)
+            except Exception as e:
+                logger_main.error(f"Error consuming trade events in group {self.group}: {str(e)}")
+                log_exception(f"Error consuming trade events: {str(e)}", e)
+                self._group_ready = False
+                await asyncio.sleep(1)
+
+__all__ = ['TRADE_EVENTS_STREAM', 'TRADE_EVENT_TYPES', 'queue_trade_event', 'latest_trade_event_id', 'read_trade_events',
+           'TradeEventConsumer']
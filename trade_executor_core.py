@@ -41,8 +41,7 @@ class TradeExecutor:
         """Загружаем открытые позиции из Redis"""
         logger_main.info("Загрузка открытых позиций из Redis")
         try:
-            trades = await global_trade_pool.get_all_trades()
-            for trade in trades:
+            async for trade in global_trade_pool.iter_trades():
                 if trade['side'] == 'buy' and trade['status'] in ['executed', 'filled']:
                     symbol = trade['symbol']
                     base_asset = symbol.split('/')[0]
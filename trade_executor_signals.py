@@ -6,40 +6,15 @@ from signal_generator_indicators import calculate_indicators_and_signal
 from global_objects import global_trade_pool
 from config_settings import get_backtest_settings
 from redis_initializer import redis_client
-from redis_client import get_json, set_json  # Импортируем функции напрямую
+from redis_client import get_or_compute_json  # Импортируем функции напрямую
 from bot_user_data import get_user_deposit, get_user_assets, add_user_trade
 
 async def fetch_user_balance(exchange, user_id):
     """Запрашивает баланс пользователя и кэширует его в Redis"""
-    balance_cache_key = f"balance:{user_id}"
-    cached_balance = await get_json(balance_cache_key)  # Используем функцию get_json
-    if cached_balance:
-        logger_main.debug(f"Using cached balance for user {user_id}: {cached_balance}")
-        return cached_balance
     try:
-        balance = await exchange.fetch_balance()
-        logger_main.debug(f"Fetched balance from exchange for user {user_id}: {balance}")
-        total_deposit_usdt = 0.0
-        assets = {}
-        for asset, data in balance.items():
-            if isinstance(data, dict) and 'free' in data and 'locked' in data:
-                free = float(data['free']) if data['free'] else 0.0
-                locked = float(data['locked']) if data['locked'] else 0.0
-                total = free + locked
-                assets[asset] = {'free': free, 'locked': locked, 'total': total}
-                if asset == 'USDT':
-                    total_deposit_usdt = total
-                elif total > 0:
-                    try:
-                        ticker = await exchange.fetch_ticker(f"{asset}/USDT")
-                        price = ticker['last'] if ticker and 'last' in ticker else 0
-                        total_deposit_usdt += total * price
-                    except Exception as e:
-                        logger_main.warning(f"Cannot fetch price for {asset}/USDT: {str(e)}")
-        balance_data = {'total_deposit_usdt': total_deposit_usdt, 'assets': assets}
-        await set_json(balance_cache_key, balance_data, expire=300)  # Используем функцию set_json
-        logger_main.info(f"Fetched balance for user {user_id}: {total_deposit_usdt} USDT")
-        return balance_data
+        # При промахе кэша баланс запрашивает с биржи только один из одновременных вызовов
+        return await get_or_compute_json(f"balance:{user_id}", lambda: _fetch_user_balance_from_exchange(exchange, user_id),
+                                         expire=300)
     except Exception as e:
         logger_main.error(f"Error fetching balance for user {user_id} from exchange: {str(e)}")
         # Используем депозит из bot_user_data.py как запасной вариант
@@ -49,6 +24,31 @@ async def fetch_user_balance(exchange, user_id):
         logger_main.warning(f"Using fallback deposit from bot_user_data for user {user_id}: {total_deposit_usdt} USDT")
         return balance_data
 
+async def _fetch_user_balance_from_exchange(exchange, user_id):
+    """Запрашивает баланс пользователя с биржи"""
+    balance = await exchange.fetch_balance()
+    logger_main.debug(f"Fetched balance from exchange for user {user_id}: {balance}")
+    total_deposit_usdt = 0.0
+    assets = {}
+    for asset, data in balance.items():
+        if isinstance(data, dict) and 'free' in data and 'locked' in data:
+            free = float(data['free']) if data['free'] else 0.0
+            locked = float(data['locked']) if data['locked'] else 0.0
+            total = free + locked
+            assets[asset] = {'free': free, 'locked': locked, 'total': total}
+            if asset == 'USDT':
+                total_deposit_usdt = total
+            elif total > 0:
+                try:
+                    ticker = await exchange.fetch_ticker(f"{asset}/USDT")
+                    price = ticker['last'] if ticker and 'last' in ticker else 0
+                    total_deposit_usdt += total * price
+                except Exception as e:
+                    logger_main.warning(f"Cannot fetch price for {asset}/USDT: {str(e)}")
+    balance_data = {'total_deposit_usdt': total_deposit_usdt, 'assets': assets}
+    logger_main.info(f"Fetched balance for user {user_id}: {total_deposit_usdt} USDT")
+    return balance_data
+
 async def execute_trade(exchange, symbol, side, user_id, trade_executor, confidence=0.5, market_conditions=None):
     """Выполняет торговую операцию на основе сигнала"""
     logger_main.info(f"Executing trade: {side} {symbol} for user {user_id} with confidence {confidence}")
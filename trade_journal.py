@@ -0,0 +1,351 @@
+import os
+import asyncio
+import threading
+from logging_setup import logger_main
+from utils import log_exception
+from json_handler import dumps, loads
+from trade_record import Trade
+
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024  # Rotate the active segment at 64 MB
+COMPACTION_INTERVAL = 60 * 60  # Fold PnL updates into closed segments every hour
+COMPACTED_MARKER = "compacted"  # Holds the number of the newest segment produced by compaction
+
+class TradeJournal:
+    """Segmented append-only JSONL journal of trades.
+
+    Every segment-NNNNNN.jsonl has a sidecar segment-NNNNNN.idx with one "trade_id<TAB>offset" line per record,
+    closed by a "#size N" footer once the segment is sealed. Records are either
+    {"op": "add", "trade": {...}} or {"op": "update", "trade_id": ..., "pnl": ..., "status": ...};
+    replaying them in order (adds replace, updates patch) gives the current state of every trade."""
+
+    def __init__(self, directory, segment_max_bytes=SEGMENT_MAX_BYTES, legacy_json_file=None):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.legacy_json_file = legacy_json_file
+        self.segments = []  # Segment numbers in replay order, the last one is active
+        self.offsets = {}  # trade_id -> [(segment, offset), ...] in replay order
+        self.compacted_through = 0  # Segments up to this number are compaction output, never folded again
+        self._active_file = None
+        self._active_index_file = None
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._compaction_task = None
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:06d}.jsonl")
+
+    def _index_path(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:06d}.idx")
+
+    def _marker_path(self):
+        return os.path.join(self.directory, COMPACTED_MARKER)
+
+    def _add_offset(self, trade_id, segment, offset):
+        self.offsets.setdefault(trade_id, []).append((segment, offset))
+
+    @staticmethod
+    def _record_trade_id(record):
+        return record["trade"]["trade_id"] if record.get("op") == "add" else record.get("trade_id")
+
+    @staticmethod
+    def _apply_record(trades, record):
+        """Folds one journal record into a dict of trades"""
+        if record.get("op") == "add":
+            trades[record["trade"]["trade_id"]] = Trade.from_dict(record["trade"])
+        elif record.get("op") == "update" and record.get("trade_id") in trades:
+            trade = trades[record["trade_id"]]
+            if record.get("fields"):
+                trade.update(record["fields"])
+            trade["pnl"] = record["pnl"]
+            trade["status"] = record["status"]
+
+    def _read_records(self, segment):
+        """Yields (offset, record) for every complete record of a segment"""
+        with open(self._segment_path(segment), 'rb') as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                yield offset, loads(line)
+                offset += len(line)
+
+    def _scan_segment(self, segment):
+        """Rebuilds a segment's index by scanning it, truncating a torn or corrupt tail"""
+        path = self._segment_path(segment)
+        entries = []
+        valid_size = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    trade_id = self._record_trade_id(loads(line))
+                except Exception:
+                    break
+                entries.append((trade_id, valid_size))
+                valid_size += len(line)
+        if valid_size != os.path.getsize(path):
+            logger_main.warning(f"Truncating torn tail of trade journal segment {path} at {valid_size} bytes")
+            with open(path, 'r+b') as f:
+                f.truncate(valid_size)
+        return entries, valid_size
+
+    def _load_index(self, segment):
+        """Returns the index entries of a sealed segment, or None if the index does not match the data"""
+        try:
+            with open(self._index_path(segment), 'r') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None
+        if not lines or not lines[-1].startswith("#size "):
+            return None
+        if int(lines[-1][len("#size "):]) != os.path.getsize(self._segment_path(segment)):
+            return None
+        entries = []
+        for line in lines[:-1]:
+            trade_id, offset = line.rsplit("\t", 1)
+            entries.append((trade_id, int(offset)))
+        return entries
+
+    def _write_index(self, path, entries, size=None):
+        with open(path, 'w') as f:
+            f.write("".join(f"{trade_id}\t{offset}\n" for trade_id, offset in entries))
+            if size is not None:
+                f.write(f"#size {size}\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _recover(self):
+        """Loads the offset index, truncates a torn active segment and drops unfinished compaction output"""
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))
+        self.segments = sorted(int(name[len("segment-"):-len(".jsonl")]) for name in os.listdir(self.directory)
+                               if name.startswith("segment-") and name.endswith(".jsonl"))
+        if os.path.exists(self._marker_path()):
+            with open(self._marker_path(), 'r') as f:
+                self.compacted_through = int(f.read().strip() or 0)
+        for segment in self.segments[:-1]:
+            entries = self._load_index(segment)
+            if entries is None:
+                entries, size = self._scan_segment(segment)
+                self._write_index(self._index_path(segment), entries, size)
+            for trade_id, offset in entries:
+                self._add_offset(trade_id, segment, offset)
+        if self.segments:
+            # The active segment may have been cut mid-write, so it is always rescanned
+            active = self.segments[-1]
+            entries, _ = self._scan_segment(active)
+            self._write_index(self._index_path(active), entries)
+            for trade_id, offset in entries:
+                self._add_offset(trade_id, active, offset)
+            self._open_active(active)
+        else:
+            self.segments.append(1)
+            self._open_active(1)
+            self._import_legacy_json()
+        logger_main.info(f"Trade journal recovered: {len(self.segments)} segments, {len(self.offsets)} trades")
+
+    def _import_legacy_json(self):
+        """Seeds an empty journal from the old trades.json file"""
+        if not self.legacy_json_file or not os.path.exists(self.legacy_json_file):
+            return
+        try:
+            with open(self.legacy_json_file, 'r') as f:
+                trades = loads(f.read())
+            self.append_trades([trade for trade in trades if trade.get("trade_id")])
+            logger_main.info(f"Imported {len(trades)} trades from {self.legacy_json_file} into the trade journal")
+        except Exception as e:
+            logger_main.error(f"Error importing {self.legacy_json_file} into the trade journal: {str(e)}")
+            log_exception(f"Error importing legacy trades.json: {str(e)}", e)
+
+    def _open_active(self, segment):
+        self._active_file = open(self._segment_path(segment), 'ab')
+        self._active_index_file = open(self._index_path(segment), 'a')
+
+    def _seal_active(self):
+        """Fsyncs the active segment and writes its index footer"""
+        size = self._active_file.tell()
+        self._active_file.flush()
+        os.fsync(self._active_file.fileno())
+        self._active_file.close()
+        self._active_index_file.write(f"#size {size}\n")
+        self._active_index_file.flush()
+        os.fsync(self._active_index_file.fileno())
+        self._active_index_file.close()
+
+    @staticmethod
+    def add_record(trade):
+        return {"op": "add", "trade": trade}
+
+    @staticmethod
+    def update_record(trade_id, pnl, status, fields=None):
+        record = {"op": "update", "trade_id": trade_id, "pnl": float(pnl), "status": status}
+        if fields:
+            record["fields"] = fields
+        return record
+
+    def append_records(self, records):
+        """Appends a group of add/update records with one flush of the segment and its index"""
+        with self._lock:
+            segment = self.segments[-1]
+            index_lines = []
+            for record in records:
+                offset = self._active_file.tell()
+                self._active_file.write((dumps(record) + "\n").encode())
+                trade_id = self._record_trade_id(record)
+                self._add_offset(trade_id, segment, offset)
+                index_lines.append(f"{trade_id}\t{offset}\n")
+            # Data goes out before its index, so recovery never sees an index entry without a record
+            self._active_file.flush()
+            self._active_index_file.write("".join(index_lines))
+            self._active_index_file.flush()
+            if self._active_file.tell() >= self.segment_max_bytes:
+                self._seal_active()
+                self.segments.append(segment + 1)
+                self._open_active(segment + 1)
+
+    def append_trades(self, trades):
+        """Appends new trades; cost is O(1) per trade regardless of history size"""
+        self.append_records([self.add_record(trade) for trade in trades])
+
+    def append_update(self, trade_id, pnl, status, fields=None):
+        """Appends a PnL/status update for a trade"""
+        self.append_records([self.update_record(trade_id, pnl, status, fields)])
+
+    def sync(self):
+        """Forces the active segment and its index to disk"""
+        with self._lock:
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+            self._active_index_file.flush()
+            os.fsync(self._active_index_file.fileno())
+
+    def get_trade(self, trade_id):
+        """Returns the current state of one trade using the offset index, or None"""
+        trades = {}
+        with self._lock:
+            self._active_file.flush()
+            for segment, offset in self.offsets.get(trade_id, ()):
+                with open(self._segment_path(segment), 'rb') as f:
+                    f.seek(offset)
+                    self._apply_record(trades, loads(f.readline()))
+        return trades.get(trade_id)
+
+    def iter_trades(self):
+        """Replays the whole journal and yields the current state of every trade"""
+        trades = {}
+        # Compaction must not delete segments mid-replay
+        with self._compaction_lock:
+            with self._lock:
+                segments = list(self.segments)
+                self._active_file.flush()
+            for segment in segments:
+                for _, record in self._read_records(segment):
+                    self._apply_record(trades, record)
+        yield from trades.values()
+
+    def _has_superseded(self, segments):
+        """Whether any trade has more than one record in the given segments, i.e. compacting them saves space"""
+        segment_set = set(segments)
+        with self._lock:
+            return any(sum(1 for segment, _ in positions if segment in segment_set) > 1
+                       for positions in self.offsets.values())
+
+    def _write_marker(self, segment):
+        marker_tmp = self._marker_path() + ".tmp"
+        with open(marker_tmp, 'w') as f:
+            f.write(f"{segment}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(marker_tmp, self._marker_path())
+
+    def compact(self):
+        """Folds the segments sealed since the last compaction into one segment with updates applied to their
+        trades. Skipped while they hold no superseded records, so each run costs O(new segments), not O(history)"""
+        with self._compaction_lock:
+            with self._lock:
+                sealed = [segment for segment in self.segments[:-1] if segment > self.compacted_through]
+            if not sealed or not self._has_superseded(sealed):
+                return
+            trades = {}
+            # Updates of trades added in older segments; the last one per trade matters, with the fields of all
+            orphan_updates = {}
+            for segment in sealed:
+                for _, record in self._read_records(segment):
+                    if record.get("op") == "update" and record.get("trade_id") not in trades:
+                        previous = orphan_updates.get(record["trade_id"])
+                        if previous is not None and previous.get("fields"):
+                            record = dict(record, fields={**previous["fields"], **record.get("fields", {})})
+                        orphan_updates[record["trade_id"]] = record
+                    else:
+                        self._apply_record(trades, record)
+            target = sealed[-1]
+            data_tmp = self._segment_path(target) + ".tmp"
+            index_tmp = self._index_path(target) + ".tmp"
+            entries = []
+            with open(data_tmp, 'wb') as f:
+                for record in [self.add_record(trade) for trade in trades.values()] + list(orphan_updates.values()):
+                    entries.append((self._record_trade_id(record), f.tell()))
+                    f.write((dumps(record) + "\n").encode())
+                size = f.tell()
+                f.flush()
+                os.fsync(f.fileno())
+            self._write_index(index_tmp, entries, size)
+            # The index footer is checked against the data size, so a crash between the two renames
+            # just makes recovery rescan the compacted segment
+            with self._lock:
+                os.replace(data_tmp, self._segment_path(target))
+                os.replace(index_tmp, self._index_path(target))
+                # Older sealed segments only duplicate what is now folded into the target, so replaying
+                # them after a crash here is harmless
+                for segment in sealed[:-1]:
+                    os.remove(self._segment_path(segment))
+                    os.remove(self._index_path(segment))
+                sealed_set = set(sealed)
+                for trade_id in list(self.offsets):
+                    remaining = [position for position in self.offsets[trade_id] if position[0] not in sealed_set]
+                    if remaining:
+                        self.offsets[trade_id] = remaining
+                    else:
+                        del self.offsets[trade_id]
+                # The target keeps its place in replay order: after earlier compaction output, before newer segments
+                for trade_id, offset in entries:
+                    positions = self.offsets.setdefault(trade_id, [])
+                    index = sum(1 for segment, _ in positions if segment < target)
+                    positions.insert(index, (target, offset))
+                self.segments = [segment for segment in self.segments if segment not in sealed_set or segment == target]
+                self._write_marker(target)
+                self.compacted_through = target
+            logger_main.info(f"Compacted {len(sealed)} trade journal segments into segment {target} "
+                             f"({len(trades)} trades)")
+
+    async def _compaction_loop(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.compact)
+            except Exception as e:
+                logger_main.error(f"Error compacting trade journal: {str(e)}")
+                log_exception(f"Error compacting trade journal: {str(e)}", e)
+
+    def start_compaction(self, interval=COMPACTION_INTERVAL):
+        """Starts background compaction on the running event loop (once)"""
+        if self._compaction_task is None:
+            self._compaction_task = asyncio.create_task(self._compaction_loop(interval))
+
+    def close(self):
+        """Stops compaction and flushes the active segment to disk"""
+        if self._compaction_task is not None:
+            self._compaction_task.cancel()
+            self._compaction_task = None
+        with self._lock:
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+            self._active_file.close()
+            self._active_index_file.close()
+
+__all__ = ['TradeJournal', 'SEGMENT_MAX_BYTES', 'COMPACTION_INTERVAL']
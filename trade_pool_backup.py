@@ -0,0 +1,188 @@
+import os
+import gzip
+import time
+import asyncio
+import argparse
+from logging_setup import logger_main
+from json_handler import dumps, loads, decode_trade
+from trade_record import Trade
+from trade_pool_redis import queue_trade_to_redis, trade_dedupe_key
+from config_settings import TRADE_BACKUP_SETTINGS
+
+MANIFEST_NAME = "manifest.json"
+BACKUP_FORMAT = 1
+
+def _chunk_name(index):
+    return f"trades-{index:06d}.jsonl.gz"
+
+def _write_atomic(path, data, compress):
+    """Writes data to path via a tmp file and rename, so a backup never contains a partial file"""
+    with open(path + ".tmp", 'wb') as raw:
+        if compress:
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=TRADE_BACKUP_SETTINGS['compress_level']) as f:
+                f.write(data)
+        else:
+            raw.write(data)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(path + ".tmp", path)
+
+def _read_chunk(path):
+    with gzip.open(path, 'rb') as f:
+        return [loads(line) for line in f]
+
+async def export_trades(redis_client, directory, key_prefix="trade:", chunk_size=None, scan_batch_size=None):
+    """Streams every trade in Redis into gzip-compressed JSONL chunks plus a manifest, in bounded memory.
+
+    Keys are read with SCAN and one pipelined MGET + PTTL per batch; each line is {"ttl_ms": ..., "trade": {...}},
+    so a restore keeps the remaining TTLs (ttl_ms -1: the key had none). Compression of a full chunk overlaps with reading the next one"""
+    chunk_size = chunk_size or TRADE_BACKUP_SETTINGS['chunk_size']
+    scan_batch_size = scan_batch_size or TRADE_BACKUP_SETTINGS['scan_batch_size']
+    os.makedirs(directory, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    start_time = time.time()
+    chunks = []
+    lines = []
+    pending_write = None
+
+    async def flush(chunk_lines):
+        nonlocal pending_write
+        if pending_write is not None:
+            await pending_write
+        name = _chunk_name(len(chunks) + 1)
+        chunks.append({"file": name, "trades": len(chunk_lines)})
+        pending_write = loop.run_in_executor(None, _write_atomic, os.path.join(directory, name),
+                                             "".join(chunk_lines).encode(), True)
+
+    cursor = 0
+    while True:
+        cursor, keys = await redis_client.scan(cursor=cursor, match=f"{key_prefix}*", count=scan_batch_size)
+        if keys:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.mget(keys)
+                for key in keys:
+                    pipe.pttl(key)
+                results = await pipe.execute()
+            for trade_value, ttl_ms in zip(results[0], results[1:]):
+                if not trade_value or ttl_ms == -2:
+                    continue  # Expired between SCAN and MGET / PTTL
+                lines.append(f"{dumps({'ttl_ms': ttl_ms, 'trade': decode_trade(trade_value)})}\n")
+            while len(lines) >= chunk_size:
+                await flush(lines[:chunk_size])
+                lines = lines[chunk_size:]
+        if int(cursor) == 0:
+            break
+    if lines:
+        await flush(lines)
+    if pending_write is not None:
+        await pending_write
+    total = sum(chunk["trades"] for chunk in chunks)
+    manifest = {"format": BACKUP_FORMAT, "created_at": start_time, "trades": total, "chunks": chunks}
+    # The manifest goes last: a backup without one is incomplete
+    await loop.run_in_executor(None, _write_atomic, os.path.join(directory, MANIFEST_NAME),
+                               dumps(manifest).encode(), False)
+    logger_main.info(f"Exported {total} trades in {len(chunks)} chunks to {directory} "
+                     f"in {time.time() - start_time:.2f} seconds")
+    return total
+
+class _Throttle:
+    """Spaces out batches so the restore stays under max_per_second trades (0 disables it)"""
+
+    def __init__(self, max_per_second):
+        self.max_per_second = max_per_second
+        self._next_start = time.monotonic()
+
+    async def wait(self, count):
+        if not self.max_per_second:
+            return
+        now = time.monotonic()
+        start = max(self._next_start, now)
+        self._next_start = start + count / self.max_per_second
+        if start > now:
+            await asyncio.sleep(start - now)
+
+async def import_trades(redis_client, directory, ttl_seconds, max_recent_trades, concurrency=None,
+                        batch_size=None, max_trades_per_second=None):
+    """Restores a backup written by export_trades: chunks are decoded in worker threads and written by
+    concurrency parallel pipelines of batch_size trades, throttled to max_trades_per_second.
+
+    Trade keys (with their remaining TTL), the secondary/recent indexes and the dedupe claims are restored;
+    user summaries and PnL rollups are not part of a backup. Returns (restored count, user_ids touched)"""
+    concurrency = concurrency or TRADE_BACKUP_SETTINGS['restore_concurrency']
+    batch_size = batch_size or TRADE_BACKUP_SETTINGS['restore_batch_size']
+    max_trades_per_second = max_trades_per_second if max_trades_per_second is not None \
+        else TRADE_BACKUP_SETTINGS['max_trades_per_second']
+    loop = asyncio.get_running_loop()
+    with open(os.path.join(directory, MANIFEST_NAME), 'r') as f:
+        manifest = loads(f.read())
+    if manifest.get("format") != BACKUP_FORMAT:
+        raise ValueError(f"Unsupported trade backup format: {manifest.get('format')}")
+    start_time = time.time()
+    # Trades already past their TTL at export time minus the time since then are not restored
+    elapsed_ms = int((start_time - manifest["created_at"]) * 1000)
+    throttle = _Throttle(max_trades_per_second)
+    chunk_queue = asyncio.Queue()
+    for chunk in manifest["chunks"]:
+        chunk_queue.put_nowait(os.path.join(directory, chunk["file"]))
+    restored = 0
+    user_ids = set()
+
+    async def worker():
+        nonlocal restored
+        while not chunk_queue.empty():
+            path = chunk_queue.get_nowait()
+            records = await loop.run_in_executor(None, _read_chunk, path)
+            for i in range(0, len(records), batch_size):
+                batch = records[i:i + batch_size]
+                await throttle.wait(len(batch))
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    written = 0
+                    for record in batch:
+                        ttl_ms = record["ttl_ms"]
+                        if ttl_ms == -1:
+                            trade_ttl = ttl_seconds  # Key without a TTL: restored with the pool's usual one
+                        elif ttl_ms < 0:
+                            continue  # Key already gone at export time (-2)
+                        else:
+                            trade_ttl = (ttl_ms - elapsed_ms) // 1000
+                        if trade_ttl <= 0:
+                            continue
+                        trade = Trade.from_dict(record["trade"])
+                        queue_trade_to_redis(pipe, trade, trade["trade_id"], trade_ttl, max_recent_trades)
+                        dedupe_key = trade_dedupe_key(trade)
+                        if dedupe_key:
+                            pipe.set(dedupe_key, trade["trade_id"], nx=True, ex=ttl_seconds)
+                        user_ids.add(trade.get("user_id"))
+                        written += 1
+                    await pipe.execute()
+                restored += written
+            logger_main.debug(f"Restored trade backup chunk {path}")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    logger_main.info(f"Imported {restored} of {manifest['trades']} trades from {directory} "
+                     f"in {time.time() - start_time:.2f} seconds")
+    return restored, user_ids
+
+async def _main():
+    from trade_pool_core import TradePool
+    parser = argparse.ArgumentParser(description="Export or restore the trade pool")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("directory")
+    parser.add_argument("--concurrency", type=int, default=None, help="Parallel restore pipelines")
+    parser.add_argument("--rate", type=int, default=None, help="Maximum restored trades per second (0: unlimited)")
+    args = parser.parse_args()
+    trade_pool = TradePool()
+    try:
+        if args.command == "export":
+            count = await trade_pool.export_trades(args.directory)
+        else:
+            count = await trade_pool.import_trades(args.directory, concurrency=args.concurrency,
+                                                   max_trades_per_second=args.rate)
+        print(f"{args.command}: {count} trades")
+    finally:
+        await trade_pool.close()
+
+__all__ = ['export_trades', 'import_trades', 'MANIFEST_NAME']
+
+if __name__ == "__main__":
+    asyncio.run(_main())
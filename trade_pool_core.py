@@ -1,11 +1,32 @@
-import redis.asyncio as redis
-import uuid
-import json
+import time
+import asyncio
+from redis.exceptions import WatchError
 from logging_setup import logger_main
 from logging_setup import logger_exceptions
-from trade_pool_redis import add_trade_to_redis, update_trade_pnl_in_redis
-from trade_pool_file import add_trade_to_files, update_trade_pnl_in_files
+from logging_setup import logger_trade_pool
+from trade_pool_redis import queue_trade_to_redis, update_trade_pnl_in_redis, get_recent_trades_from_redis
+from trade_pool_redis import query_trades_from_redis, rebuild_trade_indexes, iter_trades_from_redis, matches_trade_filter
+from trade_pool_redis import TradeIdGenerator, watch_trade_claims, queue_trade_claim, page_trades_from_redis
+from trade_pool_redis import TRADE_ID_SHARD_LEASE_TTL
+from trade_pool_redis import trade_timestamp, trade_id_timestamp, fetch_aged_trades_from_redis, prune_trades_from_redis
+from trade_pool_redis import get_user_recent_trades_from_redis, trade_indexes_ready, ensure_trade_indexes
+from trade_pool_redis import migrate_legacy_recent_trades
+from trade_pool_file import TradeFileWriter
 from user_trade_cache import UserTradeCache
+from trade_record import Trade
+from trade_journal import TradeJournal
+from trade_archive import TradeArchive
+from trade_column_store import TradeColumnStore
+from recent_trades_cache import RecentTradesCache
+from trade_event_bus import queue_trade_event, latest_trade_event_id, read_trade_events
+from trade_pool_backup import export_trades, import_trades
+from trade_pool_rollups import queue_rollup_add, queue_rollup_pnl_change, get_rollups_from_redis, summarize_rollups
+from redis_pool import redis_pool
+from config_settings import TRADE_PERSISTENCE_SETTINGS, TRADE_ARCHIVE_SETTINGS, RECENT_TRADES_CACHE_SETTINGS
+from trade_pool_sketches import queue_sketch_add, queue_sketch_update, get_sketch_stats_from_redis
+from trade_pool_sketches import migrate_legacy_sketch_keys
+from config_settings import PNL_ROLLUP_RETENTION, TRADE_SKETCH_SETTINGS
+from config_settings import TRADE_COLUMN_STORE_SETTINGS, TRADE_EVENT_STREAM_SETTINGS
 
 # Определяем настройки логирования прямо здесь
 LOGGING_SETTINGS = {
@@ -18,7 +39,21 @@ class TradePool:
         self.trade_key_prefix = "trade:"
         self.available_tokens_key_prefix = "available_tokens:"
         self.log_file = LOGGING_SETTINGS['trade_pool_log_file']
-        self.json_file = "/root/trading_bot/trades.json"
+        self.json_file = "/root/trading_bot/trades.json"  # Legacy file, imported into the journal once
+        self.journal_dir = "/root/trading_bot/trade_journal"
+        self._journal = None  # Lazy initialization
+        self._file_writer = None  # Lazy initialization
+        self.archive_settings = TRADE_ARCHIVE_SETTINGS
+        self._archive = None  # Lazy initialization
+        self._tiering_task = None
+        self._index_task = None  # Startup backfill of the secondary indexes
+        self._indexes_ready = False
+        self._column_store = None  # Built from the newest trades on first use, then fed by the trade event stream
+        self._column_store_lock = asyncio.Lock()
+        self._column_store_task = None
+        self._id_generator = None  # Lazy initialization (needs a shard from Redis)
+        self._shard_lease_task = None
+        self._recent_cache = RecentTradesCache(**RECENT_TRADES_CACHE_SETTINGS)
         self.max_recent_trades = 10000
         self.ttl_seconds = 604800  # 7 days in seconds
         self.user_caches = {}  # Dictionary to store UserTradeCache instances for each user
@@ -27,7 +62,7 @@ class TradePool:
         """Initializes Redis client if not already created"""
         if self._redis_client is None:
             logger_main.info("Creating Redis client in trade_pool.py")
-            self._redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+            self._redis_client = redis_pool.get_client("trade_pool")
             logger_main.info("Checking Redis connection")
             try:
                 ping_result = await self._redis_client.ping()
@@ -39,38 +74,242 @@ class TradePool:
                 logger_main.error(f"Error initializing Redis client: {str(e)}")
                 logger_exceptions.error(f"Error initializing Redis: {str(e)}", exc_info=True)
                 raise
+            await self._migrate_legacy_layouts()
+            self._index_task = asyncio.create_task(self._build_indexes())
         return self._redis_client
 
-    async def _get_user_cache(self, user_id):
-        """Returns the UserTradeCache instance for the given user"""
+    async def _migrate_legacy_layouts(self):
+        """Moves data kept in former Redis layouts to the current keys (once, before first use): the recent_trades
+        list into the recent trade id index, and the trade sketches to their current key shapes"""
+        try:
+            await migrate_legacy_recent_trades(self._redis_client, self.max_recent_trades)
+        except Exception as e:
+            logger_main.error(f"Error migrating legacy recent trades: {str(e)}")
+            logger_exceptions.error(f"Error migrating legacy recent trades: {str(e)}", exc_info=True)
+        try:
+            await migrate_legacy_sketch_keys(self._redis_client, TRADE_SKETCH_SETTINGS)
+        except Exception as e:
+            logger_main.error(f"Error migrating legacy trade sketches: {str(e)}")
+            logger_exceptions.error(f"Error migrating legacy trade sketches: {str(e)}", exc_info=True)
+
+    async def _build_indexes(self):
+        """Backfills the secondary indexes for trades written before them (once per index version)"""
+        try:
+            self._indexes_ready = await ensure_trade_indexes(self._redis_client, self.trade_key_prefix)
+        except Exception as e:
+            logger_main.error(f"Error backfilling trade indexes: {str(e)}")
+            logger_exceptions.error(f"Error backfilling trade indexes: {str(e)}", exc_info=True)
+
+    async def _indexes_complete(self, redis_client):
+        """Whether index reads see every trade; until the backfill is done (here or in another process)
+        reads fall back to scanning"""
+        if not self._indexes_ready:
+            self._indexes_ready = await trade_indexes_ready(redis_client)
+        return self._indexes_ready
+
+    def _ensure_file_writer(self):
+        """Opens the trade journal (recovering it if needed) and starts compaction and the write-behind writer"""
+        if self._file_writer is None:
+            logger_main.info(f"Opening trade journal in {self.journal_dir}")
+            self._journal = TradeJournal(self.journal_dir, legacy_json_file=self.json_file)
+            self._journal.start_compaction()
+            self._file_writer = TradeFileWriter(self.log_file, self._journal, **TRADE_PERSISTENCE_SETTINGS)
+            self._file_writer.start()
+        return self._file_writer
+
+    def _ensure_archive(self):
+        """Opens the cold-tier trade archive"""
+        if self._archive is None:
+            self._archive = TradeArchive(self.archive_settings['directory'])
+        return self._archive
+
+    def _ensure_tiering(self):
+        """Starts the background job moving aged trades from Redis to the archive (once)"""
+        if self._tiering_task is None:
+            self._tiering_task = asyncio.create_task(self._tiering_loop())
+
+    async def _tiering_loop(self):
+        while True:
+            await asyncio.sleep(self.archive_settings['interval'])
+            try:
+                await self.tier_aged_trades()
+            except Exception as e:
+                logger_main.error(f"Error moving aged trades to the archive: {str(e)}")
+                logger_exceptions.error(f"Error tiering trades: {str(e)}", exc_info=True)
+
+    async def tier_aged_trades(self, age_threshold=None):
+        """Moves trades older than age_threshold seconds from Redis into the archive, returns the number moved"""
+        age_threshold = age_threshold if age_threshold is not None else self.archive_settings['age_threshold']
+        cutoff = time.time() - age_threshold
+        redis_client = await self._ensure_redis_client()
+        archive = self._ensure_archive()
+        loop = asyncio.get_running_loop()
+        moved = 0
+        while True:
+            trade_ids, trades = await fetch_aged_trades_from_redis(redis_client, cutoff, self.archive_settings['batch_size'])
+            if not trade_ids:
+                break
+            # Archive first: a crash before pruning only re-archives the batch, reads deduplicate it
+            await loop.run_in_executor(None, archive.append, [(trade_timestamp(trade), trade) for trade in trades])
+            await prune_trades_from_redis(redis_client, trade_ids, trades)
+            await self._recent_cache.publish_invalidation(redis_client, [trade.get("user_id") for trade in trades])
+            moved += len(trades)
+        if moved:
+            logger_main.info(f"Moved {moved} trades older than {age_threshold} seconds to the archive")
+        return moved
+
+    async def _update_archived_trade(self, redis_client, trade_id, pnl, status, fields=None):
+        """Applies a PnL/status update to a trade already moved to the archive, with the same summary, rollup,
+        sketch and event changes as an update in Redis; returns the updated trade or None if it is not archived"""
+        changes = dict(fields or {}, pnl=float(pnl), status=status)
+        archive = self._ensure_archive()
+        result = await asyncio.get_running_loop().run_in_executor(None, archive.update, trade_id, changes,
+                                                                  trade_id_timestamp(trade_id))
+        if result is None:
+            logger_main.error(f"Trade {trade_id} not found in Redis or the archive")
+            return None
+        old_trade, trade = result
+        async with redis_client.pipeline(transaction=True) as pipe:
+            self._queue_pnl_change(pipe, old_trade, trade)
+            await pipe.execute()
+        logger_trade_pool.info(f"Archived trade updated: {trade_id} - PNL={pnl}, status={status}")
+        return trade
+
+    async def get_trade_history(self, since=None, until=None, trade_filter=None):
+        """Returns trades from both the Redis (hot) and archive (cold) tiers, oldest first.
+        since/until are epoch seconds; trade_filter is a predicate or a dict of field values"""
+        try:
+            archive = self._ensure_archive()
+            loop = asyncio.get_running_loop()
+            predicate = None if trade_filter is None else lambda trade: matches_trade_filter(trade, trade_filter)
+            cold = await loop.run_in_executor(None, archive.read, since, until, predicate, trade_timestamp)
+            if since is None and until is None:
+                hot = [trade async for trade in self.iter_trades(trade_filter)]
+            else:
+                hot = [trade for trade in await self.query_trades(since=since, until=until)
+                       if matches_trade_filter(trade, trade_filter)]
+            trades = {trade.get("trade_id"): trade for trade in cold}
+            trades.update((trade.get("trade_id"), trade) for trade in hot)
+            return sorted(trades.values(), key=trade_timestamp)
+        except Exception as e:
+            logger_main.error(f"Error retrieving trade history: {str(e)}")
+            logger_exceptions.error(f"Error retrieving trade history: {str(e)}", exc_info=True)
+            return []
+
+    async def get_column_store(self):
+        """Returns the in-process columnar trade store, loading the newest max_rows trades in Redis into it on first
+        use; afterwards it follows the trade event stream, so writes of every process reach it"""
+        if self._column_store is None:
+            async with self._column_store_lock:
+                if self._column_store is None:
+                    redis_client = await self._ensure_redis_client()
+                    # Taken before loading so no write made meanwhile is missed; adds already loaded are skipped
+                    # by trade_id when the stream is caught up
+                    last_event_id = await latest_trade_event_id(redis_client)
+                    max_rows = TRADE_COLUMN_STORE_SETTINGS['max_rows']
+                    column_store = TradeColumnStore(max_rows=max_rows)
+                    # Oldest first, so eviction in row order drops the oldest trades
+                    column_store.append(list(reversed(await self.query_trades(limit=max_rows))))
+                    # Published only once filled: concurrent callers wait on the lock instead of seeing a partial store
+                    self._column_store = column_store
+                    self._column_store_task = asyncio.create_task(self._follow_trade_events(last_event_id))
+                    logger_main.info(f"Trade column store loaded with {len(column_store)} trades")
+        return self._column_store
+
+    async def _follow_trade_events(self, last_event_id):
+        """Applies the trade adds and updates of every process to the column store"""
+        redis_client = await self._ensure_redis_client()
+        while True:
+            try:
+                events = await read_trade_events(redis_client, last_event_id, block_ms=TRADE_EVENT_STREAM_SETTINGS['block_ms'])
+                for event_id, event in events:
+                    trade = event["trade"]
+                    if event["type"] == "add":
+                        self._column_store.append([trade])
+                    else:
+                        self._column_store.update(event["trade_id"], trade.get("pnl", 0.0), trade.get("status"))
+                    last_event_id = event_id
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger_main.error(f"Error applying trade events to the column store: {str(e)}")
+                logger_exceptions.error(f"Error applying trade events to the column store: {str(e)}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def close(self):
+        """Flushes queued file writes, closes the journal and the Redis connection"""
+        if self._tiering_task is not None:
+            self._tiering_task.cancel()
+            self._tiering_task = None
+        if self._index_task is not None:
+            self._index_task.cancel()
+            self._index_task = None
+        if self._column_store_task is not None:
+            self._column_store_task.cancel()
+            self._column_store_task = None
+        if self._shard_lease_task is not None:
+            self._shard_lease_task.cancel()
+            self._shard_lease_task = None
+            try:
+                await self._id_generator.release_lease(self._redis_client)
+            except Exception as e:
+                logger_main.error(f"Error releasing the trade id shard lease: {str(e)}")
+            self._id_generator = None
+        if self._file_writer is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._file_writer.close)
+            self._journal.close()
+            self._file_writer = None
+            self._journal = None
+        await self._recent_cache.close()
+        if self._redis_client is not None:
+            await self._redis_client.close()
+            self._redis_client = None
+
+    def _user_cache(self, user_id):
+        """Returns the UserTradeCache instance for the given user (usable while queuing a pipeline)"""
         if user_id not in self.user_caches:
             self.user_caches[user_id] = UserTradeCache(user_id, max_trades=self.max_recent_trades, ttl_seconds=self.ttl_seconds)
         return self.user_caches[user_id]
 
-    async def add_trade(self, trade_data):
-        """Adds a trade to the pool and user's cache"""
-        logger_main.info("Starting TradePool add_trade")
-        if not isinstance(trade_data, dict):
-            logger_main.error("trade_data must be a dictionary")
-            return
-
-        # Add additional fields with default values
-        trade_data["user_id"] = trade_data.get("user_id", "")
-        trade_data["signals"] = trade_data.get("signals", {
-            "signal_generator": 0,
-            "strategy_signals": {},
-            "combined_signal": 0
-        })
-        trade_data["signal_metrics"] = trade_data.get("signal_metrics", {})
-        trade_data["market_conditions"] = trade_data.get("market_conditions", {})
-        trade_data["pnl"] = trade_data.get("pnl", 0.0)
-        trade_data["status"] = trade_data.get("status", "pending")
-        trade_data["related_trade_id"] = trade_data.get("related_trade_id", None)
-        trade_data["source"] = trade_data.get("source", "real")
-
-        # Create trade_id using UUID for uniqueness
-        trade_id = f"trade:{uuid.uuid4()}"
-        trade_data["trade_id"] = trade_id
+    async def _get_user_cache(self, user_id):
+        """Returns the UserTradeCache instance for the given user"""
+        return self._user_cache(user_id)
+
+    def _queue_pnl_change(self, pipe, old_trade, trade):
+        """Queues the user's summary, PnL rollup and sketch adjustments and the update event into the update pipeline"""
+        if trade.get("user_id"):
+            self._user_cache(trade["user_id"]).queue_pnl_change(pipe, old_trade.get("pnl", 0.0), trade["pnl"])
+        queue_rollup_pnl_change(pipe, old_trade, trade, PNL_ROLLUP_RETENTION)
+        queue_sketch_update(pipe, old_trade, trade, TRADE_SKETCH_SETTINGS)
+        queue_trade_event(pipe, "update", trade)
+
+    async def _ensure_id_generator(self):
+        """Creates the trade id generator, taking a shard number from Redis once per process"""
+        if self._id_generator is None:
+            redis_client = await self._ensure_redis_client()
+            self._id_generator = await TradeIdGenerator.create(redis_client)
+            self._shard_lease_task = asyncio.create_task(self._renew_shard_lease())
+            logger_main.info(f"Trade id generator initialized with shard {self._id_generator.shard}")
+        return self._id_generator
+
+    async def _renew_shard_lease(self):
+        """Keeps this process' trade id shard leased while it runs"""
+        while True:
+            await asyncio.sleep(TRADE_ID_SHARD_LEASE_TTL / 3)
+            try:
+                await self._id_generator.renew_lease(await self._ensure_redis_client())
+            except Exception as e:
+                logger_main.error(f"Error renewing the trade id shard lease: {str(e)}")
+                logger_exceptions.error(f"Error renewing the trade id shard lease: {str(e)}", exc_info=True)
+
+    def _prepare_trade(self, trade_data, id_generator):
+        """Converts trade_data to a new Trade with default fields filled in and a time-sortable trade_id.
+        The caller's object is left as it is; a trade that already has a pool trade_id keeps it"""
+        trade_data = Trade.from_dict(trade_data).copy().fill_defaults()
+
+        # Compact id ordered by trade time; duplicates are caught by the content-addressed dedupe claim
+        if not str(trade_data.get("trade_id") or "").startswith(self.trade_key_prefix):
+            trade_data["trade_id"] = id_generator.next_id(trade_timestamp(trade_data))
 
         # Log added fields at INFO level
         logger_main.info(f"Added fields to trade_data: user_id={trade_data['user_id']}, "
@@ -82,59 +321,227 @@ class TradePool:
                          f"related_trade_id={trade_data['related_trade_id']}, "
                          f"trade_id={trade_data['trade_id']}, "
                          f"source={trade_data['source']}")
+        return trade_data
+
+    async def add_trades(self, batch):
+        """Adds a batch of trades to the pool and users' caches in one Redis pipeline.
+        Idempotent: trades already in the pool (same user, symbol, side, source and timestamp, or for trades without
+        a timestamp the same order id or amount and price) are skipped"""
+        logger_main.info(f"Starting TradePool add_trades for {len(batch)} trades")
+        trades = []
+        for trade_data in batch:
+            if not isinstance(trade_data, (dict, Trade)):
+                logger_main.error("trade_data must be a dictionary or Trade")
+                continue
+            trades.append(trade_data)
+        if not trades:
+            return []
 
         try:
             redis_client = await self._ensure_redis_client()
-            # Add to Redis (global pool)
-            add_trade_to_redis(redis_client, trade_data, trade_id, self.ttl_seconds, self.max_recent_trades)
-            # Add to files
-            add_trade_to_files(trade_data, trade_id, self.log_file, self.json_file)
-            # Add to user's cache
-            if trade_data["user_id"]:
-                user_cache = await self._get_user_cache(trade_data["user_id"])
-                await user_cache.add_trade(trade_data)
+            id_generator = await self._ensure_id_generator()
+            trades = [self._prepare_trade(trade_data, id_generator) for trade_data in trades]
+            async with redis_client.pipeline(transaction=True) as pipe:
+                while True:
+                    try:
+                        # Dedupe check: the claims of new trades commit in the same MULTI as the trades themselves,
+                        # so a crash can never leave a claim without its trade
+                        existing_ids = await watch_trade_claims(pipe, trades)
+                        new_trades = [trade_data for trade_data, existing_id in zip(trades, existing_ids) if existing_id is None]
+                        if not new_trades:
+                            await pipe.reset()
+                            break
+                        pipe.multi()
+                        for trade_data in new_trades:
+                            queue_trade_claim(pipe, trade_data, self.ttl_seconds)
+                            # Add to Redis (global pool)
+                            queue_trade_to_redis(pipe, trade_data, trade_data["trade_id"], self.ttl_seconds, self.max_recent_trades)
+                            # Add to user's cache and summary
+                            if trade_data["user_id"]:
+                                self._user_cache(trade_data["user_id"]).queue_add_trade(pipe, trade_data)
+                            # Hourly/daily PnL rollups per user and symbol
+                            queue_rollup_add(pipe, trade_data, PNL_ROLLUP_RETENTION)
+                            # PnL / holding time quantile sketches and distinct symbols
+                            queue_sketch_add(pipe, trade_data, TRADE_SKETCH_SETTINGS)
+                            # Trade event for downstream consumers, published atomically with the write
+                            queue_trade_event(pipe, "add", trade_data)
+                        await pipe.execute()
+                        break
+                    except WatchError:
+                        logger_main.debug("Dedupe claims changed during add_trades, retrying")
+            # Trades already ingested keep their stored id
+            trade_ids = [existing_id or trade_data["trade_id"] for trade_data, existing_id in zip(trades, existing_ids)]
+            if len(new_trades) < len(trades):
+                logger_main.info(f"Skipped {len(trades) - len(new_trades)} already ingested trades")
+            trades = new_trades
+            if not trades:
+                return trade_ids
         except Exception as e:
-            logger_main.error(f"Error adding trade to pool: {str(e)}")
-            logger_exceptions.error(f"Error adding trade: {str(e)}", exc_info=True)
+            logger_main.error(f"Error adding trades to pool: {str(e)}")
+            logger_exceptions.error(f"Error adding trades: {str(e)}", exc_info=True)
+            return []
 
-    async def get_all_trades(self):
-        """Retrieves all trades from Redis"""
         try:
-            redis_client = await self._ensure_redis_client()
-            keys = await redis_client.keys(f"{self.trade_key_prefix}*")
-            trades = []
-            for key in keys:
-                trade_data = await redis_client.get(key)
-                if trade_data:
-                    trade = json.loads(trade_data)
-                    trades.append(trade)
-            return trades
+            for trade_data in trades:
+                logger_trade_pool.info(f"Trade added to Redis: {trade_data['trade_id']} - {trade_data}")
+            await self._recent_cache.publish_invalidation(redis_client, [trade_data["user_id"] for trade_data in trades])
+            if self._column_store is not None:
+                self._column_store.append(trades)
+            # Add to files (write-behind, never waits on disk)
+            await self._ensure_file_writer().submit_trades(trades)
+            self._ensure_tiering()
+        except Exception as e:
+            logger_main.error(f"Error adding trades to files: {str(e)}")
+            logger_exceptions.error(f"Error adding trades to files: {str(e)}", exc_info=True)
+        return trade_ids
+
+    async def add_trade(self, trade_data):
+        """Adds a trade to the pool and user's cache"""
+        logger_main.info("Starting TradePool add_trade")
+        if not isinstance(trade_data, (dict, Trade)):
+            logger_main.error("trade_data must be a dictionary or Trade")
+            return None
+        trade_ids = await self.add_trades([trade_data])
+        return trade_ids[0] if trade_ids else None
+
+    async def get_all_trades(self, source=None):
+        """Retrieves all trades from Redis, optionally only from one source"""
+        try:
+            if source is not None:
+                return await self.query_trades(source=source)
+            return [trade async for trade in self.iter_trades()]
         except Exception as e:
             logger_main.error(f"Error retrieving trades: {str(e)}")
             logger_exceptions.error(f"Error retrieving trades: {str(e)}", exc_info=True)
             return []
 
-    async def update_trade_pnl(self, trade_id, pnl, status="completed"):
-        """Updates PNL and status of a trade"""
+    async def iter_trades(self, trade_filter=None, batch_size=500):
+        """Streams trades from Redis in SCAN/MGET batches with bounded memory.
+        trade_filter is either a predicate or a dict of field values a trade must match"""
+        redis_client = await self._ensure_redis_client()
+        async for trade in iter_trades_from_redis(redis_client, self.trade_key_prefix, trade_filter, batch_size):
+            yield trade
+
+    async def page_trades(self, after=None, limit=100):
+        """Returns (trades, next_cursor) for the next page of trades in time order after the cursor trade id"""
+        try:
+            redis_client = await self._ensure_redis_client()
+            return await page_trades_from_redis(redis_client, after, limit)
+        except Exception as e:
+            logger_main.error(f"Error paginating trades: {str(e)}")
+            logger_exceptions.error(f"Error paginating trades: {str(e)}", exc_info=True)
+            return [], None
+
+    async def query_trades(self, user_id=None, symbol=None, source=None, status=None, since=None, until=None, limit=None):
+        """Returns trades matching all given filters via the secondary indexes, newest first.
+        since/until are epoch seconds; without field filters every trade in the time range is returned"""
+        try:
+            redis_client = await self._ensure_redis_client()
+            if not await self._indexes_complete(redis_client):
+                return await self._scan_trades(user_id=user_id, symbol=symbol, source=source, status=status,
+                                               since=since, until=until, limit=limit)
+            return await query_trades_from_redis(redis_client, user_id=user_id, symbol=symbol, source=source,
+                                                 status=status, since=since, until=until, limit=limit)
+        except Exception as e:
+            logger_main.error(f"Error querying trades: {str(e)}")
+            logger_exceptions.error(f"Error querying trades: {str(e)}", exc_info=True)
+            return []
+
+    async def _scan_trades(self, since=None, until=None, limit=None, **filters):
+        """query_trades without the indexes: scans every trade, for use until the index backfill is done"""
+        trade_filter = {field: value for field, value in filters.items() if value}
+        trades = [trade async for trade in self.iter_trades(trade_filter or None)
+                  if (since is None or trade_timestamp(trade) >= since) and (until is None or trade_timestamp(trade) <= until)]
+        trades.sort(key=trade_timestamp, reverse=True)
+        return trades[:limit] if limit else trades
+
+    async def get_trades_by_symbol(self, symbol, source=None):
+        """Returns all trades for a symbol, optionally only from one source"""
+        return await self.query_trades(symbol=symbol, source=source)
+
+    async def rebuild_indexes(self):
+        """Re-indexes every trade in Redis on demand (the startup backfill runs once per index version)"""
+        redis_client = await self._ensure_redis_client()
+        return await rebuild_trade_indexes(redis_client, self.trade_key_prefix)
+
+    async def export_trades(self, directory):
+        """Writes every trade in Redis to compressed chunk files in directory, returns the number exported"""
+        redis_client = await self._ensure_redis_client()
+        return await export_trades(redis_client, directory, self.trade_key_prefix)
+
+    async def import_trades(self, directory, concurrency=None, max_trades_per_second=None):
+        """Restores a backup written by export_trades, returns the number of trades restored"""
+        redis_client = await self._ensure_redis_client()
+        restored, user_ids = await import_trades(redis_client, directory, self.ttl_seconds, self.max_recent_trades,
+                                                 concurrency=concurrency, max_trades_per_second=max_trades_per_second)
+        await self._recent_cache.publish_invalidation(redis_client, user_ids)
+        return restored
+
+    async def get_recent_trades(self, limit=1000, user_id=None):
+        """Returns the most recent trades, newest first, optionally only for one user.
+        Served from the process-local cache when possible; the returned trades must be treated as read-only"""
+        try:
+            redis_client = await self._ensure_redis_client()
+            self._recent_cache.start(redis_client)
+            scope = user_id or None
+            trades = self._recent_cache.get(scope, limit)
+            if trades is not None:
+                return trades
+            generation = self._recent_cache.generation
+            if user_id and not await self._indexes_complete(redis_client):
+                trades = await self._scan_trades(user_id=user_id, limit=limit)
+            elif user_id:
+                trades = await get_user_recent_trades_from_redis(redis_client, user_id, limit)
+            else:
+                trades = await get_recent_trades_from_redis(redis_client, self.max_recent_trades, limit)
+            self._recent_cache.put(scope, limit, trades, generation)
+            return list(trades)
+        except Exception as e:
+            logger_main.error(f"Error retrieving recent trades: {str(e)}")
+            logger_exceptions.error(f"Error retrieving recent trades: {str(e)}", exc_info=True)
+            return []
+
+    async def get_pnl_rollups(self, user_id=None, symbol=None, granularity="day", since=None, until=None):
+        """Returns the hourly or daily PnL rollup buckets of a user or a symbol, oldest first.
+        Each bucket has count, wins, profit, volume and max_loss; cost is O(buckets), not O(trades)"""
+        if bool(user_id) == bool(symbol):
+            raise ValueError("Exactly one of user_id or symbol must be given")
+        dimension, value = ("user_id", user_id) if user_id else ("symbol", symbol)
+        until = until if until is not None else time.time()
+        since = since if since is not None else until - 24 * 60 * 60
+        redis_client = await self._ensure_redis_client()
+        return await get_rollups_from_redis(redis_client, dimension, value, granularity, since, until)
+
+    async def get_pnl_summary(self, user_id=None, symbol=None, granularity="day", since=None, until=None):
+        """Totals of get_pnl_rollups: count, wins, success_rate, profit, volume, max_loss"""
+        return summarize_rollups(await self.get_pnl_rollups(user_id, symbol, granularity, since, until))
+
+    async def get_trade_statistics(self, user_id=None):
+        """Streaming statistics of a user's (or all) trades: PnL and holding time quantiles, tail loss and
+        distinct symbols, answered from sketches in constant memory and time"""
+        redis_client = await self._ensure_redis_client()
+        return await get_sketch_stats_from_redis(redis_client, TRADE_SKETCH_SETTINGS, user_id)
+
+    async def update_trade_pnl(self, trade_id, pnl, status="completed", fields=None):
+        """Updates PNL and status of a trade, plus any other fields given (e.g. {"success_label": 1})"""
         logger_main.info(f"Updating PNL for trade {trade_id}: PNL={pnl}, status={status}")
         try:
             redis_client = await self._ensure_redis_client()
             # Update in Redis (global pool)
-            success = await update_trade_pnl_in_redis(redis_client, trade_id, pnl, status, self.ttl_seconds, self.max_recent_trades)
-            if not success:
+            # The user's summary and the PnL rollups are adjusted by the PNL delta in the same MULTI
+            trade = await update_trade_pnl_in_redis(redis_client, trade_id, pnl, status, self.ttl_seconds,
+                                                    self.max_recent_trades, queue_extra=self._queue_pnl_change,
+                                                    fields=fields)
+            if trade is None:
+                # Trades older than the hot window live in the archive
+                trade = await self._update_archived_trade(redis_client, trade_id, pnl, status, fields)
+            if trade is None:
                 return False
+            await self._recent_cache.publish_invalidation(redis_client, [trade.get("user_id")])
+            if self._column_store is not None:
+                self._column_store.update(trade_id, pnl, status)
             # Update in files
-            update_trade_pnl_in_files(trade_id, pnl, status, self.log_file, self.json_file)
-            # Update in user's cache (if applicable)
-            trade_data = await redis_client.get(trade_id)
-            if trade_data:
-                trade = json.loads(trade_data)
-                user_id = trade.get("user_id")
-                if user_id:
-                    user_cache = await self._get_user_cache(user_id)
-                    trade["pnl"] = float(pnl)
-                    trade["status"] = status
-                    await user_cache.update_summary(trade)
+            await self._ensure_file_writer().submit_update(trade_id, pnl, status, fields)
             return True
         except Exception as e:
             logger_main.error(f"Error updating PNL for trade {trade_id}: {str(e)}")
@@ -1,52 +1,124 @@
-import json
+import os
+import time
+import queue
+import atexit
+import asyncio
+import threading
 from logging_setup import logger_main, logger_trade_pool
 from utils import log_exception
 from json_handler import dumps
 
-def add_trade_to_files(trade_data, trade_id, log_file, json_file):
-    """Adds a trade to trade_pool.log and trades.json"""
-    try:
-        # Save to trade_pool.log file
-        trade_json = dumps(trade_data)
-        with open(log_file, 'a') as f:
-            f.write(f"{trade_json}\n")
-        logger_trade_pool.info(f"Trade added to trade_pool.log file: {trade_id} - {trade_data}")
-        # Save to trades.json
-        try:
-            with open(json_file, 'r') as f:
-                existing_trades = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            existing_trades = []
-        existing_trades.append(trade_data)
-        with open(json_file, 'w') as f:
-            json.dump(existing_trades, f, indent=2)
-        logger_main.info(f"Trade added to trades.json: {trade_id}")
-    except Exception as e:
-        logger_main.error(f"Error adding trade to files: {str(e)}")
-        log_exception(f"Error adding trade to files: {str(e)}", e)
-
-def update_trade_pnl_in_files(trade_id, pnl, status, log_file, json_file):
-    """Updates PNL and status of a trade in trade_pool.log and trades.json"""
-    try:
-        # Update in trade_pool.log file
-        with open(log_file, 'a') as f:
-            f.write(f"Update: {trade_id} - PNL={pnl}, status={status}\n")
-        # Update in trades.json
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+class TradeFileWriter:
+    """Write-behind persistence of trades to trade_pool.log and the trade journal.
+
+    Producers on the event loop only enqueue; a dedicated thread drains the bounded queue and
+    group-commits up to batch_size writes (or whatever arrived within commit_interval) at once."""
+
+    def __init__(self, log_file, journal, queue_size=10000, batch_size=500, commit_interval=0.5,
+                 fsync_policy='interval', fsync_interval=1.0):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Invalid fsync_policy: {fsync_policy}. Must be one of {FSYNC_POLICIES}")
+        self.log_file = log_file
+        self.journal = journal
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._last_fsync = time.monotonic()
+
+    @property
+    def queue_depth(self):
+        """Number of writes waiting for the writer thread"""
+        return self._queue.qsize()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trade-file-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+            logger_main.info(f"Trade file writer started (fsync_policy={self.fsync_policy})")
+
+    async def _put(self, item):
         try:
-            with open(json_file, 'r') as f:
-                existing_trades = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            existing_trades = []
-        for i, trade_entry in enumerate(existing_trades):
-            if trade_entry["trade_id"] == trade_id:
-                existing_trades[i]["pnl"] = float(pnl)
-                existing_trades[i]["status"] = status
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Backpressure: wait for room off the event loop instead of blocking it
+            logger_main.warning(f"Trade file writer queue is full ({self.queue_depth} pending), waiting")
+            await asyncio.get_running_loop().run_in_executor(None, self._queue.put, item)
+
+    async def submit_trades(self, trades):
+        """Queues new trades for persistence (shallow copies, callers may keep mutating theirs)"""
+        await self._put(("add", [trade_data.copy() for trade_data in trades]))
+
+    async def submit_update(self, trade_id, pnl, status, fields=None):
+        """Queues a PnL/status update (and other updated fields) for persistence"""
+        await self._put(("update", (trade_id, pnl, status, dict(fields) if fields else None)))
+
+    def _next_group(self):
+        """Blocks for the first write, then collects more until batch_size or commit_interval is reached"""
+        group = [self._queue.get()]
+        deadline = time.monotonic() + self.commit_interval
+        while len(group) < self.batch_size and group[-1] is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
                 break
-        with open(json_file, 'w') as f:
-            json.dump(existing_trades, f, indent=2)
-        logger_main.info(f"Trade {trade_id} updated in trades.json")
-    except Exception as e:
-        logger_main.error(f"Error updating trade in files: {str(e)}")
-        log_exception(f"Error updating trade in files: {str(e)}", e)
-
-__all__ = ['add_trade_to_files', 'update_trade_pnl_in_files']
+            try:
+                group.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return group
+
+    def _commit(self, group, log):
+        log_lines = []
+        records = []
+        for kind, payload in group:
+            if kind == "add":
+                for trade_data in payload:
+                    log_lines.append(f"{dumps(trade_data)}\n")
+                    records.append(self.journal.add_record(trade_data))
+                    logger_trade_pool.info(f"Trade added to trade_pool.log file: {trade_data['trade_id']} - {trade_data}")
+            else:
+                trade_id, pnl, status, fields = payload
+                log_lines.append(f"Update: {trade_id} - PNL={pnl}, status={status}{f', {fields}' if fields else ''}\n")
+                records.append(self.journal.update_record(trade_id, pnl, status, fields))
+        log.write("".join(log_lines))
+        log.flush()
+        self.journal.append_records(records)
+        now = time.monotonic()
+        if self.fsync_policy == 'always' or (self.fsync_policy == 'interval' and now - self._last_fsync >= self.fsync_interval):
+            os.fsync(log.fileno())
+            self.journal.sync()
+            self._last_fsync = now
+        logger_main.debug(f"Group-committed {len(records)} trade writes, {self.queue_depth} still queued")
+
+    def _run(self):
+        with open(self.log_file, 'a') as log:
+            while True:
+                group = self._next_group()
+                stop = group[-1] is None
+                if stop:
+                    group.pop()
+                if group:
+                    try:
+                        self._commit(group, log)
+                    except Exception as e:
+                        logger_main.error(f"Error writing trades to files: {str(e)}")
+                        log_exception(f"Error writing trades to files: {str(e)}", e)
+                if stop:
+                    os.fsync(log.fileno())
+                    self.journal.sync()
+                    return
+
+    def close(self):
+        """Flushes every queued write to disk and stops the writer thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+            logger_main.info("Trade file writer flushed and stopped")
+        self._thread = None
+
+__all__ = ['TradeFileWriter', 'FSYNC_POLICIES']
@@ -1,6 +1,6 @@
 from logging_setup import logger_main
 from utils import log_exception
-from trade_pool_redis import get_all_trades_from_redis, get_recent_trades_from_redis
+from trade_pool_redis import get_all_trades_from_redis, get_recent_trades_from_redis, query_trades_from_redis
 from trade_pool_tokens import update_available_tokens, get_available_tokens
 from redis_initializer import redis_client
 
@@ -51,8 +51,8 @@ async def get_trades_by_symbol(self, symbol, source=None):
         logger_main.error("redis_client is not initialized")
         raise ValueError("redis_client is not initialized")
     try:
-        trades = await self.get_all_trades(source=source)
-        return [trade for trade in trades if trade.get('symbol') == symbol]
+        pool_client = await self._ensure_redis_client()
+        return await query_trades_from_redis(pool_client, symbol=symbol, source=source)
     except Exception as e:
         logger_main.error(f"Error fetching trades for symbol {symbol}: {str(e)}")
         log_exception(f"Error fetching symbol trades: {str(e)}", e)
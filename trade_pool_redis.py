@@ -1,74 +1,448 @@
 import redis.asyncio as redis
+from redis.exceptions import WatchError
 import uuid
+import time
+import hashlib
 import asyncio
+from datetime import datetime
 from logging_setup import logger_main, logger_trade_pool
 from utils import log_exception
-from json_handler import dumps, loads
+from json_handler import encode_trade, decode_trade
 
-async def add_trade_to_redis(redis_client, trade_data, trade_id, ttl_seconds, max_recent_trades):
-    """Adds a trade to Redis"""
-    start_time = asyncio.get_event_loop().time()
-    logger_main.info(f"Saving trade to Redis: key {trade_id}")
-    await redis_client.setex(trade_id, ttl_seconds, dumps(trade_data))  # Store for 7 days
-    logger_trade_pool.info(f"Trade added to Redis: {trade_id} - {trade_data}")
-    # Save to buffer for online learning
-    recent_trades_key = "recent_trades"
-    trade_index_key = f"trade_index:{trade_id}"  # Index for quick lookup
-    await redis_client.hset("trade_indices", trade_id, recent_trades_key)  # Store index
-    await redis_client.lpush(recent_trades_key, dumps(trade_data))
+# Sorted set of trade ids scored by trade timestamp (seconds)
+RECENT_TRADES_KEY = "recent_trades:ids"
+# Former list of full JSON trades (newest first) and its id -> list hash, migrated into RECENT_TRADES_KEY
+LEGACY_RECENT_TRADES_KEY = "recent_trades"
+LEGACY_RECENT_TRADES_INDEX_KEY = "trade_indices"
+# Trade fields with a secondary index (sorted set of trade ids scored by timestamp)
+TRADE_INDEX_FIELDS = ("user_id", "symbol", "source", "status")
+# Sorted set of every trade id in Redis scored by timestamp (time-range reads and tiering)
+TRADES_BY_TIME_KEY = "trades_by_time"
+# Layout version of the indexes above; when the stored version differs, the pool backfills them once
+TRADE_INDEX_VERSION = 1
+TRADE_INDEX_VERSION_KEY = "trade_indexes:version"
+TRADE_INDEX_BUILD_LOCK_KEY = "trade_indexes:build_lock"
+
+# Trade ids are "trade:" + 15 base36 digits of (milliseconds << 32 | shard << 22 | sequence):
+# fixed width, so they sort lexicographically by trade time
+TRADE_ID_PREFIX = "trade:"
+TRADE_ID_WIDTH = 15
+TRADE_ID_SHARD_BITS = 10
+TRADE_ID_SEQUENCE_BITS = 22
+TRADE_ID_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def encode_trade_id(milliseconds, shard, sequence):
+    value = (milliseconds << (TRADE_ID_SHARD_BITS + TRADE_ID_SEQUENCE_BITS)) | (shard << TRADE_ID_SEQUENCE_BITS) | sequence
+    digits = []
+    while value:
+        value, digit = divmod(value, 36)
+        digits.append(TRADE_ID_DIGITS[digit])
+    return TRADE_ID_PREFIX + "".join(reversed(digits)).rjust(TRADE_ID_WIDTH, "0")
+
+def trade_id_timestamp(trade_id):
+    """Returns the epoch seconds encoded in a time-sortable trade id, or None for legacy ids"""
+    body = trade_id[len(TRADE_ID_PREFIX):] if trade_id and trade_id.startswith(TRADE_ID_PREFIX) else ""
+    if len(body) != TRADE_ID_WIDTH:
+        return None
+    try:
+        value = int(body, 36)
+    except ValueError:
+        return None
+    return (value >> (TRADE_ID_SHARD_BITS + TRADE_ID_SEQUENCE_BITS)) / 1000.0
+
+# Shard leases: a process owns shard n while trade_id:shard:n holds its token, renewed well before it expires
+TRADE_ID_SHARD_COUNTER_KEY = "trade_id:shard_counter"
+TRADE_ID_SHARD_KEY_PREFIX = "trade_id:shard:"
+TRADE_ID_SHARD_LEASE_TTL = 60
+
+_RENEW_SHARD_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SHARD_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class TradeIdGenerator:
+    """Snowflake-style generator of compact, time-sortable trade ids.
+    Each process leases its shard from Redis (SET NX with a TTL, renewed while it runs), so no two live processes
+    ever share a shard, however many have started before"""
+
+    def __init__(self, shard, lease_token=None):
+        self.shard = shard % (1 << TRADE_ID_SHARD_BITS)
+        self.lease_token = lease_token
+        self._sequence = 0
+        self._renew_script = None
+        self._release_script = None
+
+    @classmethod
+    async def create(cls, redis_client, lease_ttl=TRADE_ID_SHARD_LEASE_TTL):
+        generator = cls(0, uuid.uuid4().hex)
+        await generator.acquire_shard(redis_client, lease_ttl)
+        return generator
+
+    def _lease_key(self):
+        return f"{TRADE_ID_SHARD_KEY_PREFIX}{self.shard}"
+
+    async def acquire_shard(self, redis_client, lease_ttl=TRADE_ID_SHARD_LEASE_TTL):
+        """Leases the first free shard, starting after the one handed out last so restarts spread over shards"""
+        start = await redis_client.incr(TRADE_ID_SHARD_COUNTER_KEY)
+        shard_count = 1 << TRADE_ID_SHARD_BITS
+        for offset in range(shard_count):
+            shard = (start + offset) % shard_count
+            if await redis_client.set(f"{TRADE_ID_SHARD_KEY_PREFIX}{shard}", self.lease_token, nx=True, ex=lease_ttl):
+                self.shard = shard
+                return shard
+        raise Exception(f"All {shard_count} trade id shards are leased by live processes")
+
+    async def renew_lease(self, redis_client, lease_ttl=TRADE_ID_SHARD_LEASE_TTL):
+        """Extends the shard lease; a lease lost meanwhile (expired, e.g. while the process was stalled) is replaced
+        by a new shard. Returns the shard in use"""
+        if self._renew_script is None:
+            self._renew_script = redis_client.register_script(_RENEW_SHARD_LEASE_SCRIPT)
+        if not await self._renew_script(keys=[self._lease_key()], args=[self.lease_token, lease_ttl], client=redis_client):
+            old_shard = self.shard
+            await self.acquire_shard(redis_client, lease_ttl)
+            logger_main.warning(f"Trade id shard {old_shard} lease was lost, moved to shard {self.shard}")
+        return self.shard
+
+    async def release_lease(self, redis_client):
+        """Frees the shard for other processes (only if this process still holds it)"""
+        if self._release_script is None:
+            self._release_script = redis_client.register_script(_RELEASE_SHARD_LEASE_SCRIPT)
+        await self._release_script(keys=[self._lease_key()], args=[self.lease_token], client=redis_client)
+
+    def next_id(self, timestamp):
+        self._sequence = (self._sequence + 1) % (1 << TRADE_ID_SEQUENCE_BITS)
+        return encode_trade_id(int(round(timestamp * 1000)), self.shard, self._sequence)
+
+def trade_timestamp(trade_data):
+    """Returns the trade timestamp in epoch seconds (accepts seconds, milliseconds or ISO strings).
+    Without a usable timestamp the time encoded in the trade id is used, then the current time"""
+    value = trade_data.get("timestamp")
+    try:
+        if isinstance(value, (int, float)):
+            return value / 1000.0 if value > 1e11 else float(value)
+        if isinstance(value, str) and value:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (ValueError, TypeError):
+        pass
+    id_timestamp = trade_id_timestamp(trade_data.get("trade_id"))
+    return id_timestamp if id_timestamp is not None else time.time()
+
+def trade_score(trade_data):
+    """Index score of a trade: its timestamp at millisecond precision, matching the trade id"""
+    return round(trade_timestamp(trade_data), 3)
+
+# Fields identifying a trade that has no timestamp: its exchange order, otherwise its size and price
+TRADE_IDENTITY_FALLBACKS = (("order_id",), ("amount", "price"))
+
+def trade_content_key(trade_data):
+    """Deterministic digest of the fields that identify a trade: user, symbol, side, source and timestamp,
+    or without a timestamp the first fallback in TRADE_IDENTITY_FALLBACKS the trade has"""
+    fields = ("user_id", "symbol", "side", "timestamp", "source")
+    prefix = ""
+    if trade_data.get("timestamp") in (None, ""):
+        fallback = next((fallback for fallback in TRADE_IDENTITY_FALLBACKS
+                         if all(trade_data.get(field) not in (None, "") for field in fallback)), ())
+        fields = ("user_id", "symbol", "side", "source") + fallback
+        # Kept apart from timestamped identities, whose digests predate the fallbacks
+        prefix = "|".join(fallback) + ":"
+    identity = prefix + "|".join(str(trade_data.get(field, "")) for field in fields)
+    return hashlib.blake2b(identity.encode(), digest_size=12).hexdigest()
+
+def trade_dedupe_key(trade_data):
+    """Returns the dedupe claim key of a trade"""
+    return f"trade_dedupe:{trade_content_key(trade_data)}"
+
+async def watch_trade_claims(pipe, trades):
+    """WATCHes the trades' dedupe keys on a pipeline in immediate mode and returns, per trade, the trade_id it
+    was already ingested under (stored claim, or an earlier trade of the same batch) or None for new trades.
+    Claims queued with queue_trade_claim after pipe.multi() commit together with the trade writes: EXEC fails
+    with WatchError if another writer claimed one of the keys meanwhile, and nothing is written"""
+    dedupe_keys = [trade_dedupe_key(trade_data) for trade_data in trades]
+    keys = list(dict.fromkeys(dedupe_key for dedupe_key in dedupe_keys if dedupe_key))
+    if not keys:
+        return [None] * len(trades)
+    await pipe.watch(*keys)
+    claimed = dict(zip(keys, await pipe.mget(keys)))
+    existing_ids = []
+    for trade_data, dedupe_key in zip(trades, dedupe_keys):
+        if not dedupe_key:
+            existing_ids.append(None)
+        elif claimed[dedupe_key]:
+            existing_ids.append(claimed[dedupe_key])
+        else:
+            claimed[dedupe_key] = trade_data["trade_id"]
+            existing_ids.append(None)
+    return existing_ids
+
+def queue_trade_claim(pipe, trade_data, ttl_seconds):
+    """Queues the dedupe claim of a trade (value = trade_id); refreshing it keeps the claim as long as the trade"""
+    dedupe_key = trade_dedupe_key(trade_data)
+    if dedupe_key:
+        pipe.set(dedupe_key, trade_data["trade_id"], ex=ttl_seconds)
+
+def trade_index_key(field, value):
+    """Returns the secondary index key for a trade field value"""
+    return f"trades_by_{field}:{value}"
+
+def queue_trade_indexes(pipe, trade_data, trade_id, score):
+    """Queues adding a trade to the time index and its user/symbol/source/status indexes"""
+    pipe.zadd(TRADES_BY_TIME_KEY, {trade_id: score})
+    for field in TRADE_INDEX_FIELDS:
+        value = trade_data.get(field)
+        if value:
+            pipe.zadd(trade_index_key(field, value), {trade_id: score})
+
+def queue_trade_to_redis(pipe, trade_data, trade_id, ttl_seconds, max_recent_trades):
+    """Queues the commands that store a trade in Redis on an open pipeline"""
+    score = trade_score(trade_data)
+    pipe.setex(trade_id, ttl_seconds, encode_trade(trade_data))  # Store for 7 days
+    queue_trade_indexes(pipe, trade_data, trade_id, score)
+    # Save id to buffer for online learning
+    pipe.zadd(RECENT_TRADES_KEY, {trade_id: score})
     # Limit buffer size
-    await redis_client.ltrim(recent_trades_key, 0, max_recent_trades - 1)
-    logger_main.info(f"Trade added to recent_trades buffer: {trade_id}")
-    duration = asyncio.get_event_loop().time() - start_time
-    logger_main.info(f"Trade {trade_id} added to Redis in {duration:.2f} seconds")
+    pipe.zremrangebyrank(RECENT_TRADES_KEY, 0, -max_recent_trades - 1)
 
-async def update_trade_pnl_in_redis(redis_client, trade_id, pnl, status, ttl_seconds, max_recent_trades):
-    """Updates PNL and status of a trade in Redis"""
+async def update_trade_pnl_in_redis(redis_client, trade_id, pnl, status, ttl_seconds, max_recent_trades, queue_extra=None,
+                                    fields=None):
+    """Updates PNL and status (and any other fields given, e.g. success_label) of a trade in Redis, returns the
+    updated trade or None. queue_extra(pipe, old_trade, trade) may queue more commands into the same MULTI"""
     start_time = asyncio.get_event_loop().time()
-    trade_data = await redis_client.get(trade_id)
-    if not trade_data:
-        logger_main.error(f"Trade {trade_id} not found in Redis")
-        return False
-    trade = loads(trade_data)
-    trade["pnl"] = float(pnl)
-    trade["status"] = status
-    # Update in Redis (main pool)
-    await redis_client.setex(trade_id, ttl_seconds, dumps(trade))
-    logger_trade_pool.info(f"Trade updated in Redis: {trade_id} - PNL={pnl}, status={status}")
-    # Update in recent_trades buffer using index
-    recent_trades_key = "recent_trades"
-    trade_index = await redis_client.hget("trade_indices", trade_id)
-    if trade_index:
-        trades = await redis_client.lrange(recent_trades_key, 0, max_recent_trades - 1)
-        for i, trade_json in enumerate(trades):
-            recent_trade = loads(trade_json)
-            if recent_trade["trade_id"] == trade_id:
-                recent_trade["pnl"] = float(pnl)
-                recent_trade["status"] = status
-                await redis_client.lset(recent_trades_key, i, dumps(recent_trade))
+    async with redis_client.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                # WATCH makes the read-modify-write exact under concurrent writers
+                await pipe.watch(trade_id)
+                trade_data = await pipe.get(trade_id)
+                if not trade_data:
+                    logger_main.error(f"Trade {trade_id} not found in Redis")
+                    await pipe.reset()
+                    return None
+                old_trade = decode_trade(trade_data)
+                trade = old_trade.copy()
+                old_status = old_trade.get("status")
+                if fields:
+                    trade.update(fields)
+                trade["pnl"] = float(pnl)
+                trade["status"] = status
+                # recent_trades only holds ids, so only the trade key and status index change
+                pipe.multi()
+                pipe.setex(trade_id, ttl_seconds, encode_trade(trade))
+                # The dedupe claim lives as long as the trade it points at
+                queue_trade_claim(pipe, trade, ttl_seconds)
+                if old_status != status:
+                    if old_status:
+                        pipe.zrem(trade_index_key("status", old_status), trade_id)
+                    pipe.zadd(trade_index_key("status", status), {trade_id: trade_score(trade)})
+                if queue_extra is not None:
+                    queue_extra(pipe, old_trade, trade)
+                await pipe.execute()
                 break
-        logger_main.info(f"Trade {trade_id} updated in recent_trades buffer")
+            except WatchError:
+                logger_main.debug(f"Trade {trade_id} changed during PNL update, retrying")
+    logger_trade_pool.info(f"Trade updated in Redis: {trade_id} - PNL={pnl}, status={status}")
     duration = asyncio.get_event_loop().time() - start_time
     logger_main.info(f"Trade {trade_id} updated in Redis in {duration:.2f} seconds")
-    return True
+    return trade
+
+async def query_trade_ids(redis_client, filters, since=None, until=None, limit=None):
+    """Returns trade ids matching all field filters (newest first) by intersecting the secondary indexes.
+    Without field filters the time index is used, i.e. every trade in the time range"""
+    keys = [trade_index_key(field, value) for field, value in filters.items() if value] or [TRADES_BY_TIME_KEY]
+    max_score = until if until is not None else "+inf"
+    min_score = since if since is not None else "-inf"
+    num = limit if limit else None
+    start = 0 if limit else None
+    if len(keys) == 1:
+        return await redis_client.zrevrangebyscore(keys[0], max_score, min_score, start=start, num=num)
+    temp_key = f"trade_query:{uuid.uuid4()}"
+    async with redis_client.pipeline(transaction=True) as pipe:
+        # Keep the smallest score so the intersection is still scored by timestamp
+        pipe.zinterstore(temp_key, keys, aggregate="MIN")
+        pipe.zrevrangebyscore(temp_key, max_score, min_score, start=start, num=num)
+        pipe.delete(temp_key)
+        results = await pipe.execute()
+    return results[1]
+
+async def fetch_trades_by_ids(redis_client, trade_ids, index_keys=()):
+    """MGETs trades by id, dropping ids whose trade keys have expired from the given indexes"""
+    if not trade_ids:
+        return []
+    trade_values = await redis_client.mget(trade_ids)
+    trades = [decode_trade(trade_value) for trade_value in trade_values if trade_value]
+    expired_ids = [trade_id for trade_id, trade_value in zip(trade_ids, trade_values) if not trade_value]
+    if expired_ids and index_keys:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key in index_keys:
+                pipe.zrem(key, *expired_ids)
+            await pipe.execute()
+    return trades
+
+async def query_trades_from_redis(redis_client, user_id=None, symbol=None, source=None, status=None,
+                                  since=None, until=None, limit=None):
+    """Returns trades matching the filters using the secondary indexes, newest first"""
+    filters = {"user_id": user_id, "symbol": symbol, "source": source, "status": status}
+    start_time = asyncio.get_event_loop().time()
+    trade_ids = await query_trade_ids(redis_client, filters, since, until, limit)
+    index_keys = [trade_index_key(field, value) for field, value in filters.items() if value] or [TRADES_BY_TIME_KEY]
+    trades = await fetch_trades_by_ids(redis_client, trade_ids, index_keys)
+    duration = asyncio.get_event_loop().time() - start_time
+    logger_main.info(f"Fetched {len(trades)} trades by index {filters} in {duration:.2f} seconds")
+    return trades
+
+async def get_user_recent_trades_from_redis(redis_client, user_id, limit=100):
+    """Returns a user's most recent trades, newest first, from the per-user index: O(log n + limit)"""
+    index_key = trade_index_key("user_id", user_id)
+    trade_ids = await redis_client.zrevrange(index_key, 0, limit - 1)
+    return await fetch_trades_by_ids(redis_client, trade_ids, [index_key])
+
+def trade_ids_after_cursor(entries, cursor):
+    """Keeps the (trade_id, score) entries strictly after cursor = (score, trade_id) in time index order,
+    which is by score, then by id for equal scores"""
+    if cursor is None:
+        return [trade_id for trade_id, _ in entries]
+    return [trade_id for trade_id, score in entries if (score, trade_id) > cursor]
+
+async def page_trades_from_redis(redis_client, after=None, limit=100):
+    """Cursor pagination over all trades in time order: returns (trades, next_cursor).
+    The cursor is the last trade id of the previous page; trades come in (timestamp, id) order, the order of the
+    time index, so pages neither repeat nor skip trades that share a timestamp"""
+    min_score = "-inf"
+    cursor = None
+    if after:
+        after_score = await redis_client.zscore(TRADES_BY_TIME_KEY, after)
+        if after_score is None:
+            # The cursor trade has left Redis since: resume after the time its id encodes
+            after_score = trade_id_timestamp(after)
+        if after_score is None:
+            logger_main.warning(f"Unknown trade pagination cursor {after}")
+            return [], None
+        cursor = (float(after_score), after)
+        min_score = after_score
+    trade_ids = []
+    offset = 0
+    while len(trade_ids) < limit:
+        batch = await redis_client.zrangebyscore(TRADES_BY_TIME_KEY, min_score, "+inf", start=offset, num=limit,
+                                                 withscores=True)
+        if not batch:
+            break
+        offset += len(batch)
+        # Only the trades sharing the cursor's timestamp and sorting up to it were on earlier pages
+        trade_ids.extend(trade_ids_after_cursor(batch, cursor))
+    trade_ids = trade_ids[:limit]
+    trades = await fetch_trades_by_ids(redis_client, trade_ids, [TRADES_BY_TIME_KEY])
+    return trades, (trade_ids[-1] if len(trade_ids) == limit else None)
+
+async def fetch_aged_trades_from_redis(redis_client, cutoff, batch_size=1000):
+    """Returns (trade_ids, trades) for up to batch_size of the oldest trades with timestamp <= cutoff.
+    trades only holds the ids whose keys still exist"""
+    trade_ids = await redis_client.zrangebyscore(TRADES_BY_TIME_KEY, "-inf", cutoff, start=0, num=batch_size)
+    if not trade_ids:
+        return [], []
+    trade_values = await redis_client.mget(trade_ids)
+    return trade_ids, [decode_trade(trade_value) for trade_value in trade_values if trade_value]
+
+async def prune_trades_from_redis(redis_client, trade_ids, trades):
+    """Deletes trades from Redis together with every index entry pointing at them"""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for trade in trades:
+            trade_id = trade["trade_id"]
+            pipe.delete(trade_id)
+            for field in TRADE_INDEX_FIELDS:
+                if trade.get(field):
+                    pipe.zrem(trade_index_key(field, trade[field]), trade_id)
+        pipe.zrem(RECENT_TRADES_KEY, *trade_ids)
+        pipe.zrem(TRADES_BY_TIME_KEY, *trade_ids)
+        await pipe.execute()
+
+async def rebuild_trade_indexes(redis_client, trade_key_prefix, batch_size=1000):
+    """Backfills the secondary indexes from the trades currently stored in Redis"""
+    logger_main.info("Rebuilding trade pool secondary indexes")
+    indexed = 0
+    cursor = "0"
+    while True:
+        cursor, keys = await redis_client.scan(cursor=cursor, match=f"{trade_key_prefix}*", count=batch_size)
+        if keys:
+            trade_values = await redis_client.mget(keys)
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key, trade_value in zip(keys, trade_values):
+                    if trade_value:
+                        trade = decode_trade(trade_value)
+                        queue_trade_indexes(pipe, trade, key, trade_score(trade))
+                        indexed += 1
+                await pipe.execute()
+        if int(cursor) == 0:
+            break
+    logger_main.info(f"Rebuilt secondary indexes for {indexed} trades")
+    return indexed
+
+async def trade_indexes_ready(redis_client):
+    """Checks whether the indexes of the current layout version have been backfilled"""
+    return await redis_client.get(TRADE_INDEX_VERSION_KEY) == str(TRADE_INDEX_VERSION)
+
+async def ensure_trade_indexes(redis_client, trade_key_prefix, lock_ttl=60 * 60):
+    """Backfills the indexes once per layout version (one process at a time, under a lock).
+    Returns True once they are complete, False while another process is still building them.
+    Trades written meanwhile are indexed by their writers, so the backfill only has to cover older ones"""
+    if await trade_indexes_ready(redis_client):
+        return True
+    if not await redis_client.set(TRADE_INDEX_BUILD_LOCK_KEY, "1", nx=True, ex=lock_ttl):
+        return False
+    try:
+        await rebuild_trade_indexes(redis_client, trade_key_prefix)
+        await redis_client.set(TRADE_INDEX_VERSION_KEY, TRADE_INDEX_VERSION)
+        return True
+    finally:
+        await redis_client.delete(TRADE_INDEX_BUILD_LOCK_KEY)
+
+def matches_trade_filter(trade, trade_filter):
+    """Checks a trade against a predicate or a dict of required field values"""
+    if trade_filter is None:
+        return True
+    if callable(trade_filter):
+        return trade_filter(trade)
+    return all(trade.get(field) == value for field, value in trade_filter.items())
+
+async def iter_trades_from_redis(redis_client, trade_key_prefix, trade_filter=None, batch_size=500):
+    """Yields trades incrementally: SCAN walks the keyspace and each batch of keys is fetched with one MGET.
+    trade_filter is either a predicate or a dict of field values a trade must match"""
+    cursor = 0
+    while True:
+        cursor, keys = await redis_client.scan(cursor=cursor, match=f"{trade_key_prefix}*", count=batch_size)
+        for i in range(0, len(keys), batch_size):
+            trade_values = await redis_client.mget(keys[i:i + batch_size])
+            for trade_value in trade_values:
+                if not trade_value:
+                    continue  # Expired between SCAN and MGET
+                trade = decode_trade(trade_value)
+                if matches_trade_filter(trade, trade_filter):
+                    yield trade
+        if int(cursor) == 0:
+            break
 
 async def get_all_trades_from_redis(redis_client, trade_key_prefix, source=None):
     """Gets all trades from Redis with optional source filtering"""
     logger_main.info(f"Starting to fetch all trades from TradePool (source={source})")
+    if source is not None:
+        try:
+            return await query_trades_from_redis(redis_client, source=source)
+        except Exception as e:
+            logger_main.error(f"Error fetching trades from TradePool: {str(e)}")
+            log_exception(f"Error fetching trades: {str(e)}", e)
+            return []
     try:
         trades = []
-        cursor = "0"
         start_time = asyncio.get_event_loop().time()
-        while True:
-            cursor, keys = await redis_client.scan(cursor=cursor, match=f"{trade_key_prefix}*")
-            for key in keys:
-                trade_data = await redis_client.get(key)
-                if trade_data:
-                    trade = loads(trade_data)
-                    if source is None or trade.get('source') == source:
-                        trades.append(trade)
-            if cursor == "0":
-                break
+        async for trade in iter_trades_from_redis(redis_client, trade_key_prefix):
+            trades.append(trade)
         duration = asyncio.get_event_loop().time() - start_time
         logger_main.info(f"Fetched {len(trades)} trades from TradePool (source={source}) in {duration:.2f} seconds")
         return trades
@@ -77,27 +451,86 @@ async def get_all_trades_from_redis(redis_client, trade_key_prefix, source=None)
         log_exception(f"Error fetching trades: {str(e)}", e)
         return []
 
+async def migrate_legacy_recent_trades(redis_client, max_recent_trades):
+    """Copies the ids of the trades in the former recent_trades list into RECENT_TRADES_KEY, then drops the list.
+    Returns the number of ids copied; a no-op once the list is gone"""
+    trade_values = await redis_client.lrange(LEGACY_RECENT_TRADES_KEY, 0, max_recent_trades - 1)
+    if not trade_values:
+        return 0
+    scores = {}
+    for trade_value in trade_values:
+        try:
+            trade = decode_trade(trade_value)
+        except Exception as e:
+            logger_main.warning(f"Skipping undecodable legacy recent trade: {str(e)}")
+            continue
+        if trade.get("trade_id"):
+            scores[trade["trade_id"]] = trade_score(trade)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        if scores:
+            pipe.zadd(RECENT_TRADES_KEY, scores)
+            pipe.zremrangebyrank(RECENT_TRADES_KEY, 0, -max_recent_trades - 1)
+        pipe.delete(LEGACY_RECENT_TRADES_KEY, LEGACY_RECENT_TRADES_INDEX_KEY)
+        await pipe.execute()
+    logger_main.info(f"Migrated {len(scores)} legacy recent trades into {RECENT_TRADES_KEY}")
+    return len(scores)
+
 async def get_recent_trades_from_redis(redis_client, max_recent_trades, limit=1000):
-    """Returns the most recent trades from Redis (up to the specified limit)"""
+    """Returns the most recent trades from Redis (up to the specified limit), newest first"""
     logger_trade_pool.info(f"Fetching the last {limit} trades from the pool")
     try:
-        recent_trades_key = "recent_trades"
         start_time = asyncio.get_event_loop().time()
-        trade_jsons = await redis_client.lrange(recent_trades_key, 0, limit - 1)
-        trades = [loads(trade_json) for trade_json in trade_jsons]
-        # Sort by timestamp (in case Redis order is not guaranteed)
-        sorted_trades = sorted(trades, key=lambda x: x.get('timestamp', 0), reverse=True)
+        trade_ids = await redis_client.zrevrange(RECENT_TRADES_KEY, 0, limit - 1)
+        if not trade_ids:
+            return []
+        trade_values = await redis_client.mget(trade_ids)
+        trades = [decode_trade(trade_value) for trade_value in trade_values if trade_value]
+        # Drop ids whose trade keys have already expired
+        expired_ids = [trade_id for trade_id, trade_value in zip(trade_ids, trade_values) if not trade_value]
+        if expired_ids:
+            await redis_client.zrem(RECENT_TRADES_KEY, *expired_ids)
         duration = asyncio.get_event_loop().time() - start_time
-        logger_trade_pool.info(f"Fetched {len(sorted_trades)} recent trades from Redis in {duration:.2f} seconds")
-        return sorted_trades
+        logger_trade_pool.info(f"Fetched {len(trades)} recent trades from Redis in {duration:.2f} seconds")
+        return trades
     except Exception as e:
         logger_main.error(f"Error fetching recent trades: {str(e)}")
         log_exception(f"Error fetching recent trades: {str(e)}", e)
         return []
 
 __all__ = [
-    'add_trade_to_redis',
+    'RECENT_TRADES_KEY',
+    'TRADE_INDEX_FIELDS',
+    'TRADES_BY_TIME_KEY',
+    'TRADE_INDEX_VERSION',
+    'TRADE_ID_PREFIX',
+    'TradeIdGenerator',
+    'TRADE_ID_SHARD_LEASE_TTL',
+    'encode_trade_id',
+    'trade_id_timestamp',
+    'trade_timestamp',
+    'trade_score',
+    'trade_content_key',
+    'trade_dedupe_key',
+    'watch_trade_claims',
+    'queue_trade_claim',
+    'trade_index_key',
+    'queue_trade_indexes',
+    'queue_trade_to_redis',
     'update_trade_pnl_in_redis',
+    'query_trade_ids',
+    'fetch_trades_by_ids',
+    'query_trades_from_redis',
+    'get_user_recent_trades_from_redis',
+    'trade_ids_after_cursor',
+    'page_trades_from_redis',
+    'fetch_aged_trades_from_redis',
+    'prune_trades_from_redis',
+    'rebuild_trade_indexes',
+    'trade_indexes_ready',
+    'ensure_trade_indexes',
+    'matches_trade_filter',
+    'iter_trades_from_redis',
     'get_all_trades_from_redis',
+    'migrate_legacy_recent_trades',
     'get_recent_trades_from_redis'
 ]
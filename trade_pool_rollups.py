@@ -0,0 +1,130 @@
+from logging_setup import logger_main
+from utils import log_exception
+from redis_pool import redis_pool
+from trade_pool_redis import trade_timestamp
+
+# Bucket width in seconds per granularity
+ROLLUP_GRANULARITIES = {"hour": 60 * 60, "day": 24 * 60 * 60}
+# Trade fields with their own rollups
+ROLLUP_DIMENSIONS = ("user_id", "symbol")
+
+# HSET max_loss only if the new PnL is lower (no HINCRBY equivalent for a minimum)
+_MIN_FIELD_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if not current or tonumber(ARGV[2]) < tonumber(current) then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+return 0
+"""
+_min_field_script = None
+
+def _queue_min_field(pipe, key, field, value):
+    """Queues _MIN_FIELD_SCRIPT as EVALSHA; the script is registered once and the pipeline loads it into Redis
+    before executing if Redis does not have it cached"""
+    global _min_field_script
+    if _min_field_script is None:
+        _min_field_script = redis_pool.get_client("trade_pool").register_script(_MIN_FIELD_SCRIPT)
+    pipe.scripts.add(_min_field_script)
+    pipe.evalsha(_min_field_script.sha, 1, key, field, value)
+
+def rollup_key(granularity, dimension, value, bucket):
+    """Hash of one bucket: count, wins, profit (total PnL), volume and max_loss (most negative PnL seen)"""
+    return f"pnl_rollup:{granularity}:{dimension}:{value}:{bucket}"
+
+def rollup_bucket(timestamp, granularity):
+    width = ROLLUP_GRANULARITIES[granularity]
+    return int(timestamp // width * width)
+
+def _trade_rollup_keys(trade_data):
+    timestamp = trade_timestamp(trade_data)
+    for dimension in ROLLUP_DIMENSIONS:
+        value = trade_data.get(dimension)
+        if not value:
+            continue
+        for granularity in ROLLUP_GRANULARITIES:
+            yield granularity, rollup_key(granularity, dimension, value, rollup_bucket(timestamp, granularity))
+
+def _float(value):
+    try:
+        return float(value or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def queue_rollup_add(pipe, trade_data, retention):
+    """Queues the rollup updates of a new trade on an open pipeline (retention: seconds per granularity)"""
+    pnl = _float(trade_data.get("pnl"))
+    volume = _float(trade_data.get("amount")) * _float(trade_data.get("price"))
+    for granularity, key in _trade_rollup_keys(trade_data):
+        pipe.hincrby(key, "count", 1)
+        if pnl > 0:
+            pipe.hincrby(key, "wins", 1)
+        pipe.hincrbyfloat(key, "profit", pnl)
+        pipe.hincrbyfloat(key, "volume", volume)
+        _queue_min_field(pipe, key, "max_loss", min(pnl, 0.0))
+        pipe.expire(key, retention[granularity])
+
+def queue_rollup_pnl_change(pipe, old_trade, trade, retention):
+    """Queues the rollup adjustment of a trade whose PnL changed; max_loss only ever moves down"""
+    old_pnl = _float(old_trade.get("pnl"))
+    new_pnl = _float(trade.get("pnl"))
+    if old_pnl == new_pnl:
+        return
+    wins_delta = (new_pnl > 0) - (old_pnl > 0)
+    for granularity, key in _trade_rollup_keys(trade):
+        if wins_delta:
+            pipe.hincrby(key, "wins", wins_delta)
+        pipe.hincrbyfloat(key, "profit", new_pnl - old_pnl)
+        if new_pnl < 0:
+            _queue_min_field(pipe, key, "max_loss", new_pnl)
+        pipe.expire(key, retention[granularity])
+
+async def get_rollups_from_redis(redis_client, dimension, value, granularity, since, until):
+    """Returns the non-empty buckets of [since, until] (epoch seconds) oldest first, one HGETALL per bucket"""
+    width = ROLLUP_GRANULARITIES[granularity]
+    buckets = list(range(rollup_bucket(since, granularity), rollup_bucket(until, granularity) + 1, width))
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for bucket in buckets:
+                pipe.hgetall(rollup_key(granularity, dimension, value, bucket))
+            results = await pipe.execute()
+    except Exception as e:
+        logger_main.error(f"Error fetching {granularity} rollups for {dimension}={value}: {str(e)}")
+        log_exception(f"Error fetching rollups: {str(e)}", e)
+        return []
+    rollups = []
+    for bucket, fields in zip(buckets, results):
+        if not fields:
+            continue
+        rollups.append({
+            "bucket": bucket,
+            "count": int(fields.get("count", 0)),
+            "wins": int(fields.get("wins", 0)),
+            "profit": float(fields.get("profit", 0.0)),
+            "volume": float(fields.get("volume", 0.0)),
+            "max_loss": float(fields.get("max_loss", 0.0)),
+        })
+    return rollups
+
+def summarize_rollups(rollups):
+    """Folds buckets into totals: count, wins, success_rate, profit, volume, max_loss"""
+    count = sum(rollup["count"] for rollup in rollups)
+    wins = sum(rollup["wins"] for rollup in rollups)
+    return {
+        "count": count,
+        "wins": wins,
+        "success_rate": wins / count if count else 0.0,
+        "profit": sum(rollup["profit"] for rollup in rollups),
+        "volume": sum(rollup["volume"] for rollup in rollups),
+        "max_loss": min((rollup["max_loss"] for rollup in rollups), default=0.0),
+    }
+
+__all__ = [
+    'ROLLUP_GRANULARITIES',
+    'ROLLUP_DIMENSIONS',
+    'rollup_key',
+    'rollup_bucket',
+    'queue_rollup_add',
+    'queue_rollup_pnl_change',
+    'get_rollups_from_redis',
+    'summarize_rollups',
+]
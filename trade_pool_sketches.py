@@ -0,0 +1,226 @@
+import math
+import time
+from logging_setup import logger_main
+from utils import log_exception
+from trade_pool_redis import trade_timestamp
+
+# Trades in these statuses have no final PnL yet; every other status counts as closed
+OPEN_TRADE_STATUSES = ("pending", "executed", "filled")
+SKETCH_KINDS = ("pnl", "holding_time", "symbols")
+# Marks the key layout below as migrated from trade_sketch:{kind}:{user_id or "all"}
+SKETCH_LAYOUT_KEY = "trade_sketches:layout"
+SKETCH_LAYOUT_VERSION = 2
+
+def sketch_key(kind, user_id=None):
+    """pnl / holding_time: hash bucket -> count (QuantileSketch); symbols: HyperLogLog of traded symbols.
+    One per user and one over all trades, in separate key shapes so no user id can name the global sketches"""
+    return f"trade_sketch:{kind}:user:{user_id}" if user_id else f"trade_sketch:{kind}:_global"
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative_accuracy error on every quantile (log-bucketed, DDSketch-style).
+
+    Values map to buckets ceil(log_gamma(|v|)) kept separately for positive and negative values, plus a zero
+    bucket for |v| < min_value; the bucket counts are plain counters, so the sketch lives in a Redis hash updated
+    with HINCRBY, several sketches merge by adding counts and a value is removed by decrementing its bucket.
+    Memory is bounded by the number of buckets (a few hundred per decade of magnitude at 1%), not by the count."""
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-6):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}  # "+i" / "-i" / "0" -> count
+
+    def bucket(self, value):
+        if abs(value) < self.min_value:
+            return "0"
+        index = math.ceil(math.log(abs(value)) / self._log_gamma)
+        return f"{'+' if value > 0 else '-'}{index}"
+
+    def bucket_value(self, bucket):
+        """Representative value of a bucket, within relative_accuracy of every value in it"""
+        if bucket == "0":
+            return 0.0
+        value = 2 * self.gamma ** int(bucket[1:]) / (self.gamma + 1)
+        return value if bucket[0] == "+" else -value
+
+    def add(self, value, count=1):
+        bucket = self.bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        if self.buckets[bucket] <= 0:
+            del self.buckets[bucket]
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        return self
+
+    @classmethod
+    def from_fields(cls, fields, **kwargs):
+        """Builds a sketch from a Redis hash (HGETALL result)"""
+        sketch = cls(**kwargs)
+        sketch.buckets = {bucket: int(count) for bucket, count in fields.items() if int(count) > 0}
+        return sketch
+
+    @property
+    def count(self):
+        return sum(self.buckets.values())
+
+    def _sorted(self):
+        """[(value, count)] in ascending order of value"""
+        return sorted(((self.bucket_value(bucket), count) for bucket, count in self.buckets.items()), key=lambda item: item[0])
+
+    def quantile(self, q):
+        """Value at quantile q (0..1), or None for an empty sketch"""
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for value, count in self._sorted():
+            seen += count
+            if seen > rank:
+                return value
+        return self._sorted()[-1][0]
+
+    def tail_mean(self, q):
+        """Mean of the lowest q fraction of values (expected shortfall / CVaR at q), or None for an empty sketch"""
+        total = self.count
+        if not total:
+            return None
+        remaining = max(q * total, 1)
+        weighted = 0.0
+        taken = 0.0
+        for value, count in self._sorted():
+            take = min(count, remaining - taken)
+            weighted += value * take
+            taken += take
+            if taken >= remaining:
+                break
+        return weighted / taken
+
+    def mean(self):
+        total = self.count
+        if not total:
+            return None
+        return sum(value * count for value, count in self._sorted()) / total
+
+def _float(value):
+    try:
+        return float(value or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _is_closed(trade_data):
+    return trade_data.get("status") not in OPEN_TRADE_STATUSES
+
+def _scopes(trade_data):
+    """The global sketches (None) and the trade's user's"""
+    user_id = trade_data.get("user_id")
+    return (None, user_id) if user_id else (None,)
+
+def _queue_bucket(pipe, kind, scopes, bucket, delta, ttl):
+    for scope in scopes:
+        key = sketch_key(kind, scope)
+        pipe.hincrby(key, bucket, delta)
+        pipe.expire(key, ttl)
+
+def queue_sketch_add(pipe, trade_data, settings):
+    """Queues the sketch updates of a new trade on an open pipeline: its symbol into the symbols HyperLogLogs,
+    and its PnL into the PnL sketches if it is already closed"""
+    sketch = QuantileSketch(settings['relative_accuracy'])
+    scopes = _scopes(trade_data)
+    if trade_data.get("symbol"):
+        for scope in scopes:
+            pipe.pfadd(sketch_key("symbols", scope), trade_data["symbol"])
+            pipe.expire(sketch_key("symbols", scope), settings['ttl'])
+    if _is_closed(trade_data):
+        _queue_bucket(pipe, "pnl", scopes, sketch.bucket(_float(trade_data.get("pnl"))), 1, settings['ttl'])
+
+def queue_sketch_update(pipe, old_trade, trade, settings, now=None):
+    """Queues the sketch adjustments of an updated trade: the old PnL leaves the PnL sketches, the new one enters
+    them, and a trade closing now records its holding time (seconds since the trade timestamp)"""
+    sketch = QuantileSketch(settings['relative_accuracy'])
+    scopes = _scopes(trade)
+    was_closed, closed = _is_closed(old_trade), _is_closed(trade)
+    old_bucket = sketch.bucket(_float(old_trade.get("pnl"))) if was_closed else None
+    new_bucket = sketch.bucket(_float(trade.get("pnl"))) if closed else None
+    if old_bucket != new_bucket:
+        if old_bucket is not None:
+            _queue_bucket(pipe, "pnl", scopes, old_bucket, -1, settings['ttl'])
+        if new_bucket is not None:
+            _queue_bucket(pipe, "pnl", scopes, new_bucket, 1, settings['ttl'])
+    if closed and not was_closed:
+        holding_time = max((now if now is not None else time.time()) - trade_timestamp(trade), 0.0)
+        _queue_bucket(pipe, "holding_time", scopes, sketch.bucket(holding_time), 1, settings['ttl'])
+
+async def get_sketch_stats_from_redis(redis_client, settings, user_id=None, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    """Returns PnL and holding time quantiles, the tail loss (mean of the worst tail_fraction of PnLs) and the
+    number of distinct symbols traded, for one user or everyone; three Redis reads, O(buckets) work"""
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(sketch_key("pnl", user_id))
+            pipe.hgetall(sketch_key("holding_time", user_id))
+            pipe.pfcount(sketch_key("symbols", user_id))
+            pnl_fields, holding_fields, distinct_symbols = await pipe.execute()
+    except Exception as e:
+        logger_main.error(f"Error fetching trade sketches for {user_id or 'all trades'}: {str(e)}")
+        log_exception(f"Error fetching trade sketches: {str(e)}", e)
+        return {}
+    pnl = QuantileSketch.from_fields(pnl_fields, relative_accuracy=settings['relative_accuracy'])
+    holding = QuantileSketch.from_fields(holding_fields, relative_accuracy=settings['relative_accuracy'])
+    return {
+        "closed_trades": pnl.count,
+        "pnl_quantiles": {f"p{round(q * 100)}": pnl.quantile(q) for q in quantiles},
+        "tail_loss": pnl.tail_mean(settings['tail_fraction']),
+        "holding_time_quantiles": {f"p{round(q * 100)}": holding.quantile(q) for q in quantiles},
+        "distinct_symbols": distinct_symbols,
+    }
+
+async def migrate_legacy_sketch_keys(redis_client, settings, lock_ttl=10 * 60):
+    """Moves sketches of the former trade_sketch:{kind}:{user_id or "all"} layout to the current keys, merging them
+    into sketches written since (once, one process at a time); returns the number of keys moved"""
+    if await redis_client.get(SKETCH_LAYOUT_KEY) == str(SKETCH_LAYOUT_VERSION):
+        return 0
+    lock_key = f"{SKETCH_LAYOUT_KEY}:lock"
+    if not await redis_client.set(lock_key, "1", nx=True, ex=lock_ttl):
+        return 0
+    moved = 0
+    try:
+        cursor = 0
+        while True:
+            cursor, keys = await redis_client.scan(cursor=cursor, match="trade_sketch:*", count=1000)
+            for key in keys:
+                _, kind, scope = key.split(":", 2)
+                if kind not in SKETCH_KINDS or scope == "_global" or scope.startswith("user:"):
+                    continue
+                new_key = sketch_key(kind, None if scope == "all" else scope)
+                fields = None if kind == "symbols" else await redis_client.hgetall(key)
+                async with redis_client.pipeline(transaction=True) as pipe:
+                    if kind == "symbols":
+                        pipe.pfmerge(new_key, new_key, key)
+                    else:
+                        for bucket, count in fields.items():
+                            pipe.hincrby(new_key, bucket, int(count))
+                    pipe.expire(new_key, settings['ttl'])
+                    pipe.delete(key)
+                    await pipe.execute()
+                moved += 1
+            if int(cursor) == 0:
+                break
+        await redis_client.set(SKETCH_LAYOUT_KEY, SKETCH_LAYOUT_VERSION)
+    finally:
+        await redis_client.delete(lock_key)
+    if moved:
+        logger_main.info(f"Migrated {moved} trade sketches to the current key layout")
+    return moved
+
+__all__ = [
+    'OPEN_TRADE_STATUSES',
+    'QuantileSketch',
+    'sketch_key',
+    'queue_sketch_add',
+    'queue_sketch_update',
+    'get_sketch_stats_from_redis',
+    'migrate_legacy_sketch_keys',
+]
@@ -1,52 +1,72 @@
 import asyncio
-import time
+import json
 from logging_setup import logger_main, logger_exceptions
-from redis_client import redis_client
+from redis_initializer import redis_client
 from global_objects import global_trade_pool
-from bot_user_data import user_data
 
-# Интервал проверки (24 часа)
-TRANSFER_INTERVAL = 24 * 60 * 60  # Можно сделать динамическим через конфигурацию
+# Trades reach the pool directly from bot_trading now; nothing writes trades:{user_id} lists any more. This drains
+# the lists left by older versions into the pool once, together with their transfer bookkeeping
+LEGACY_TRADES_KEY_PREFIX = "trades:"
+# Bookkeeping of the former periodic transfer, deleted by the drain
+LEGACY_TRANSFER_CURSOR_KEY = "trade_transfer:cursor"
+LEGACY_PENDING_TRANSFER_USERS_KEY = "trades_pending_transfer"
+# SCAN COUNT hint while looking for legacy lists
+LEGACY_SCAN_BATCH_SIZE = 100
+
+async def transfer_user_trades(user_id):
+    """Переносит в общий пул все сделки из старого списка trades:{user_id} и удаляет список"""
+    trades_key = f"{LEGACY_TRADES_KEY_PREFIX}{user_id}"
+    trade_jsons = await redis_client.lrange(trades_key, 0, -1)
+    trades = []
+    # Oldest first, so the pool receives them in trading order
+    for trade_json in reversed(trade_jsons):
+        trade_info = json.loads(trade_json)
+        trade = dict(trade_info['trade'])
+        # Добавляем дополнительные данные для переобучения
+        trade['signal'] = trade_info['signal']
+        trade['strategies'] = trade_info['strategies']
+        trades.append(trade)
+    # add_trades is idempotent, so trades already transferred by the former periodic task are skipped
+    if trades and not await global_trade_pool.add_trades(trades):
+        raise Exception(f"Global pool rejected {len(trades)} trades of user {user_id}")
+    await redis_client.delete(trades_key, f"trades_seq:{user_id}")
+    logger_main.debug(f"Transferred {len(trades)} legacy trades to global pool for user {user_id}")
+    return len(trades)
 
 async def transfer_trades_to_pool():
-    """Переносит сделки из кэша пользователей в общий пул раз в 24 часа"""
-    while True:
-        try:
-            logger_main.info("Starting trade transfer to global pool")
-            current_time = int(time.time())
-            # Получаем всех пользователей из user_data
-            users = list(user_data.keys())
-            for user_id in users:
-                # Получаем сделки из кэша
-                trades = await redis_client.get_trades_from_cache(user_id)
-                if not trades:
-                    continue
-                # Фильтруем сделки за последние 24 часа
-                recent_trades = [trade for trade in trades if (current_time - trade['timestamp']) <= TRANSFER_INTERVAL]
-                for trade_info in recent_trades:
-                    trade = trade_info['trade']
-                    # Добавляем дополнительные данные для переобучения
-                    trade['signal'] = trade_info['signal']
-                    trade['strategies'] = trade_info['strategies']
-                    await global_trade_pool.add_trade(trade)
-                    logger_main.debug(f"Transferred trade to global pool for user {user_id}: {trade}")
-                # Обновляем кэш, оставляя только сделки младше 24 часов
-                remaining_trades = [trade for trade in trades if trade not in recent_trades]
-                if remaining_trades:
-                    await redis_client.set_json(f"trades:{user_id}", remaining_trades, expire=72*60*60)
-                else:
-                    await redis_client._client.delete(f"trades:{user_id}")
-            logger_main.info("Trade transfer to global pool completed")
-            # Ждём 24 часа до следующей проверки
-            await asyncio.sleep(TRANSFER_INTERVAL)
-        except Exception as e:
-            logger_main.error(f"Error transferring trades to global pool: {str(e)}")
-            logger_exceptions.error(f"Error transferring trades: {str(e)}", exc_info=True)
-            await asyncio.sleep(TRANSFER_INTERVAL)  # Продолжаем после ошибки
+    """Однократно переносит сделки из всех старых списков trades:{user_id} в общий пул"""
+    transferred = 0
+    users = 0
+    failed = 0
+    try:
+        cursor = 0
+        while True:
+            cursor, keys = await redis_client.scan(cursor=cursor, match=f"{LEGACY_TRADES_KEY_PREFIX}*",
+                                                   count=LEGACY_SCAN_BATCH_SIZE)
+            for key in keys:
+                user_id = key[len(LEGACY_TRADES_KEY_PREFIX):]
+                try:
+                    transferred += await transfer_user_trades(user_id)
+                    users += 1
+                except Exception as e:
+                    # The list is kept, so the next startup retries it
+                    failed += 1
+                    logger_main.error(f"Error transferring trades of user {user_id} to global pool: {str(e)}")
+                    logger_exceptions.error(f"Error transferring user trades: {str(e)}", exc_info=True)
+            if cursor == 0:
+                break
+        if not failed:
+            await redis_client.delete(LEGACY_TRANSFER_CURSOR_KEY, LEGACY_PENDING_TRANSFER_USERS_KEY)
+        if users:
+            logger_main.info(f"Transferred {transferred} legacy trades of {users} users to global pool")
+    except Exception as e:
+        logger_main.error(f"Error transferring trades to global pool: {str(e)}")
+        logger_exceptions.error(f"Error transferring trades: {str(e)}", exc_info=True)
+    return transferred
 
 # Запуск задачи переноса
 def start_trade_transfer():
-    """Запускает задачу переноса сделок в фоновом режиме"""
+    """Запускает однократный перенос старых списков сделок в фоновом режиме"""
     asyncio.create_task(transfer_trades_to_pool())
 
-__all__ = ['start_trade_transfer']
+__all__ = ['start_trade_transfer', 'transfer_trades_to_pool', 'transfer_user_trades']
@@ -0,0 +1,183 @@
+from collections.abc import Mapping, MutableMapping
+
+# Fixed field set of a trade; the order is the row layout of the binary codec (json_handler, schema version 2),
+# so new fields may only be appended together with a codec version bump
+TRADE_FIELDS = (
+    "trade_id",
+    "user_id",
+    "symbol",
+    "side",
+    "amount",
+    "price",
+    "timestamp",
+    "pnl",
+    "status",
+    "source",
+    "order_id",
+    "order_type",
+    "strategy",
+    "signals",
+    "signal_metrics",
+    "market_conditions",
+    "related_trade_id",
+)
+_TRADE_FIELD_SET = frozenset(TRADE_FIELDS)
+_TRADE_FIELD_BITS = tuple((1 << bit, name) for bit, name in enumerate(TRADE_FIELDS))
+_UNSET = object()
+
+def _default_signals():
+    return {
+        "signal_generator": 0,
+        "strategy_signals": {},
+        "combined_signal": 0
+    }
+
+# Defaults filled in for new trades entering the pool (factories, so mutable values are never shared)
+TRADE_DEFAULTS = {
+    "user_id": str,
+    "signals": _default_signals,
+    "signal_metrics": dict,
+    "market_conditions": dict,
+    "pnl": float,
+    "status": lambda: "pending",
+    "related_trade_id": lambda: None,
+    "source": lambda: "real",
+}
+
+class Trade(MutableMapping):
+    """Trade record with a fixed set of slotted fields.
+
+    Behaves like the dict trades used to be (trade["pnl"], trade.get("status"), dict(trade), DataFrame(trades)),
+    at a fraction of the memory of a dict per trade. An unset slot is a missing key; keys outside TRADE_FIELDS
+    are kept in a small side dict so nothing is lost on a round-trip."""
+
+    __slots__ = TRADE_FIELDS + ("extra",)
+
+    def __init__(self, **fields):
+        self.extra = None
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        """Returns data itself if it is already a Trade, otherwise a Trade with its keys"""
+        if isinstance(data, cls):
+            return data
+        trade = cls.__new__(cls)
+        trade.extra = None
+        for key, value in data.items():
+            if key in _TRADE_FIELD_SET:
+                setattr(trade, key, value)
+            else:
+                if trade.extra is None:
+                    trade.extra = {}
+                trade.extra[key] = value
+        return trade
+
+    def to_dict(self):
+        data = {name: value for name in TRADE_FIELDS if (value := getattr(self, name, _UNSET)) is not _UNSET}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def to_row(self):
+        """Positional form for the storage codec: [presence bitmask, extra keys or None, *field values]"""
+        mask = 0
+        row = [0, self.extra or None]
+        for bit, name in _TRADE_FIELD_BITS:
+            value = getattr(self, name, _UNSET)
+            if value is _UNSET:
+                row.append(None)
+            else:
+                mask |= bit
+                row.append(value)
+        row[0] = mask
+        return row
+
+    @classmethod
+    def from_row(cls, row):
+        trade = cls.__new__(cls)
+        mask = row[0]
+        trade.extra = row[1] or None
+        for (bit, name), value in zip(_TRADE_FIELD_BITS, row[2:]):
+            if mask & bit:
+                setattr(trade, name, value)
+        return trade
+
+    def fill_defaults(self):
+        """Sets every unset field that has a default (TRADE_DEFAULTS)"""
+        for name, default in TRADE_DEFAULTS.items():
+            if getattr(self, name, _UNSET) is _UNSET:
+                setattr(self, name, default())
+        return self
+
+    def copy(self):
+        """Shallow copy, like dict.copy()"""
+        trade = Trade.__new__(Trade)
+        for name in TRADE_FIELDS:
+            value = getattr(self, name, _UNSET)
+            if value is not _UNSET:
+                setattr(trade, name, value)
+        trade.extra = dict(self.extra) if self.extra else None
+        return trade
+
+    def __getitem__(self, key):
+        if key in _TRADE_FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in _TRADE_FIELD_SET:
+            return getattr(self, key, default)
+        return self.extra.get(key, default) if self.extra is not None else default
+
+    def __contains__(self, key):
+        if key in _TRADE_FIELD_SET:
+            return hasattr(self, key)
+        return self.extra is not None and key in self.extra
+
+    def __setitem__(self, key, value):
+        if key in _TRADE_FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _TRADE_FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for name in TRADE_FIELDS:
+            if hasattr(self, name):
+                yield name
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for name in TRADE_FIELDS if hasattr(self, name)) + (len(self.extra) if self.extra else 0)
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+__all__ = ['Trade', 'TRADE_FIELDS', 'TRADE_DEFAULTS']
@@ -1,8 +1,9 @@
-import asyncio
+import time
 from logging_setup import logger_main
 from utils import log_exception
 from data_fetcher import fetch_ticker_cached
-from redis_client import redis_client
+from trade_event_bus import TradeEventConsumer
+from trade_pool_redis import trade_timestamp
 
 class TradeResultAnalyzer:
     def __init__(self, trade_pool, retrain_engine):
@@ -11,58 +12,84 @@ class TradeResultAnalyzer:
         self.success_threshold = 0.02  # Success threshold: 2% price increase/decrease
         self.wait_time = 4 * 3600  # Wait 4 hours to determine the result
         self.min_trades_for_retraining = 10  # Minimum trades for retraining
+        self.max_training_samples = 10000  # Labeled samples kept for retraining
+        self.training_data = []
+        # Own consumer group on the trade event stream: only new or not yet labeled trades are looked at
+        self.events = TradeEventConsumer("trade_result_analyzer")
         logger_main.info("Initializing TradeResultAnalyzer")
 
+    async def _label_trade(self, exchange, trade_data):
+        """Labels a filled trade whose wait time has passed and saves the label to the pool.
+        Returns True once the trade needs no more analysis (labeled now or before, or not a filled trade)"""
+        if trade_data['status'] != 'filled' or 'success_label' in trade_data:
+            return True
+        symbol = trade_data['symbol']
+        side = trade_data['side']
+        original_price = trade_data['price']
+        amount = trade_data['amount']
+        trade_id = trade_data['trade_id']
+        # Wait 4 hours after the trade
+        elapsed_time = time.time() - trade_timestamp(trade_data)  # Time in seconds
+        if elapsed_time < self.wait_time:
+            logger_main.debug(f"Trade {trade_id} is not ready for analysis, waiting {self.wait_time - elapsed_time} seconds")
+            return False
+        # Fetch current price
+        ticker = await fetch_ticker_cached(exchange, symbol)
+        if not ticker or 'last' not in ticker:
+            logger_main.error(f"Failed to fetch current price for {symbol}, skipping trade {trade_id}")
+            return False
+        current_price = ticker['last']
+        logger_main.debug(f"Current price for {symbol}: {current_price}, original price: {original_price}")
+        # Determine trade result
+        if side == 'buy':
+            success = current_price > original_price * (1 + self.success_threshold)  # Price increased by 2%
+        else:
+            success = current_price < original_price * (1 - self.success_threshold)  # Price decreased by 2%
+        success_label = 1 if success else 0
+        pnl = (current_price - original_price) * amount if side == 'buy' else (original_price - current_price) * amount
+        # The status stays as it is: the label only records how the price moved after the trade
+        if not await self.trade_pool.update_trade_pnl(trade_id, pnl, trade_data['status'],
+                                                      fields={'success_label': success_label}):
+            logger_main.error(f"Failed to save the result of trade {trade_id}, retrying on the next run")
+            return False
+        logger_main.info(f"Updated trade {trade_id}: success_label={success_label}, pnl={pnl}")
+        # Add to the dataset for retraining
+        sample = {
+            'signals': trade_data['signals'],
+            'signal_metrics': trade_data['signal_metrics'],
+            'market_conditions': trade_data['market_conditions'],
+            'status': 'successful' if success_label == 1 else 'failed',
+            'pnl': pnl
+        }
+        self.training_data.append(sample)
+        return True
+
     async def analyze_trades(self, exchange):
-        """Analyzes trades from the pool, determines their results, and retrains RetrainEngine"""
+        """Analyzes new trades from the trade event stream, determines their results, and retrains RetrainEngine.
+        Events of trades that are not ready yet stay unacknowledged and are looked at again on the next run"""
         try:
             logger_main.info("Starting trade result analysis")
-            trades = await self.trade_pool.get_all_trades()
-            logger_main.debug(f"Retrieved {len(trades)} trades from the pool")
-            # Analyze each trade
-            for trade_data in trades:
-                if trade_data['status'] != 'filled' or 'success_label' in trade_data:
-                    continue
-                symbol = trade_data['symbol']
-                timestamp = trade_data['timestamp']
-                side = trade_data['side']
-                original_price = trade_data['price']
-                amount = trade_data['amount']
-                trade_id = trade_data['trade_id']
-                # Wait 4 hours after the trade
-                elapsed_time = (asyncio.get_event_loop().time() * 1000 - timestamp) / 1000  # Time in seconds
-                if elapsed_time < self.wait_time:
-                    logger_main.debug(f"Trade {trade_id} is not ready for analysis, waiting {self.wait_time - elapsed_time} seconds")
-                    continue
-                # Fetch current price
-                ticker = await fetch_ticker_cached(exchange, symbol)
-                if not ticker or 'last' not in ticker:
-                    logger_main.error(f"Failed to fetch current price for {symbol}, skipping trade {trade_id}")
-                    continue
-                current_price = ticker['last']
-                logger_main.debug(f"Current price for {symbol}: {current_price}, original price: {original_price}")
-                # Determine trade result
-                if side == 'buy':
-                    success = current_price > original_price * (1 + self.success_threshold)  # Price increased by 2%
-                else:
-                    success = current_price < original_price * (1 - self.success_threshold)  # Price decreased by 2%
-                trade_data['success_label'] = 1 if success else 0
-                trade_data['pnl'] = (current_price - original_price) * amount if side == 'buy' else (original_price - current_price) * amount
-                await self.trade_pool.update_trade(trade_id, trade_data)
-                logger_main.info(f"Updated trade {trade_id}: success_label={trade_data['success_label']}, pnl={trade_data['pnl']}")
-            # Prepare dataset for retraining
-            training_data = []
-            for trade_data in trades:
-                if 'success_label' not in trade_data:
-                    continue
-                sample = {
-                    'signals': trade_data['signals'],
-                    'signal_metrics': trade_data['signal_metrics'],
-                    'market_conditions': trade_data['market_conditions'],
-                    'status': 'successful' if trade_data['success_label'] == 1 else 'failed',
-                    'pnl': trade_data['pnl']
-                }
-                training_data.append(sample)
+            redis_client = await self.trade_pool._ensure_redis_client()
+            events = await self.events.read_pending(redis_client) + await self.events.read_new(redis_client, block=False)
+            # Latest state of every trade in the batch, with all of its event ids
+            trades = {}
+            event_ids = {}
+            for event_id, event in events:
+                trades[event["trade_id"]] = event["trade"]
+                event_ids.setdefault(event["trade_id"], []).append(event_id)
+            logger_main.debug(f"Retrieved {len(events)} trade events for {len(trades)} trades")
+            done_ids = []
+            # Analyze each trade; a trade that fails stays unacknowledged and is retried on the next run
+            for trade_id, trade_data in trades.items():
+                try:
+                    if await self._label_trade(exchange, trade_data):
+                        done_ids.extend(event_ids[trade_id])
+                except Exception as e:
+                    logger_main.error(f"Error analyzing trade {trade_id}: {str(e)}")
+                    log_exception(f"Error analyzing trade {trade_id}: {str(e)}", e)
+            await self.events.ack(redis_client, done_ids)
+            self.training_data = self.training_data[-self.max_training_samples:]
+            training_data = self.training_data
             logger_main.debug(f"Prepared training dataset: {len(training_data)} samples")
             # Retrain RetrainEngine
             if len(training_data) >= self.min_trades_for_retraining:
@@ -116,7 +116,7 @@ async def main():
                 logger_main.info(f"Saving {len(trades)} backtest trades to trade_pool")
                 for trade in trades:
                     trade['source'] = 'backtest'
-                    await global_trade_pool.add_trade(trade)
+                await global_trade_pool.add_trades(trades)
             else:
                 logger_main.info("No backtest trades found")
             # Dynamic sleep interval based on market conditions and number of users
@@ -61,6 +61,8 @@ if __name__ == "__main__":
             logger_main.info("Starting main trading cycle")
             loop.run_until_complete(main())
         finally:
+            logger_main.info("Flushing trade pool")
+            loop.run_until_complete(global_objects.global_trade_pool.close())
             logger_main.info("Closing event loop")
             loop.close()
     finally:
@@ -2,92 +2,107 @@ import asyncio
 from redis_initializer import redis_client
 from logging_setup import logger_main
 from utils import log_exception
-from json_handler import dumps, loads
+from trade_pool_redis import get_user_recent_trades_from_redis
+
+SUMMARY_TOTAL_FIELDS = ("deposit", "trade_count", "pnl", "profit", "loss")
+
+def empty_summary():
+    return {
+        "deposit": 0.0,
+        "trade_count": 0,
+        "pnl": 0.0,
+        "profit": 0.0,
+        "loss": 0.0,
+        "signals": {},
+        "pairs": {}
+    }
 
 class UserTradeCache:
     def __init__(self, user_id, max_trades=1000, ttl_seconds=604800):
         self.user_id = user_id
         self.max_trades = max_trades
         self.ttl_seconds = ttl_seconds
-        self.cache_key = f"user_trades:{user_id}"
-        self.summary_key = f"user_summary:{user_id}"
+        # Hash of counters updated server-side (legacy JSON summaries at user_summary:{id} expire on their own)
+        self.summary_key = f"user_summary_hash:{user_id}"
         if redis_client is None:
             logger_main.error("redis_client is not initialized")
             raise ValueError("redis_client is not initialized")
 
+    def queue_add_trade(self, pipe, trade_data):
+        """Queues the user's summary update on an open pipeline.
+        The user's trades themselves are only indexed by id (trades_by_user_id), not copied"""
+        self.queue_update_summary(pipe, trade_data)
+
+    def queue_update_summary(self, pipe, trade_data):
+        """Queues HINCRBY/HINCRBYFLOAT updates of the summary for a new trade"""
+        trade_pnl = float(trade_data.get("pnl", 0.0))
+        pipe.hincrby(self.summary_key, "trade_count", 1)
+        pipe.hincrbyfloat(self.summary_key, "pnl", trade_pnl)
+        if trade_pnl > 0:
+            pipe.hincrbyfloat(self.summary_key, "profit", trade_pnl)
+        else:
+            pipe.hincrbyfloat(self.summary_key, "loss", abs(trade_pnl))
+        signal = trade_data.get("signals", {}).get("combined_signal", "unknown")
+        pair = trade_data.get("symbol", "unknown")
+        pipe.hincrby(self.summary_key, f"signal:{signal}", 1)
+        pipe.hincrby(self.summary_key, f"pair:{pair}", 1)
+        if "deposit" in trade_data:
+            pipe.hset(self.summary_key, "deposit", float(trade_data["deposit"]))
+        pipe.expire(self.summary_key, self.ttl_seconds)
+
+    def queue_pnl_change(self, pipe, old_pnl, new_pnl):
+        """Queues the summary adjustment for a trade whose PNL changed from old_pnl to new_pnl"""
+        old_pnl = float(old_pnl or 0.0)
+        new_pnl = float(new_pnl or 0.0)
+        pipe.hincrbyfloat(self.summary_key, "pnl", new_pnl - old_pnl)
+        pipe.hincrbyfloat(self.summary_key, "profit", max(new_pnl, 0.0) - max(old_pnl, 0.0))
+        pipe.hincrbyfloat(self.summary_key, "loss", max(-new_pnl, 0.0) - max(-old_pnl, 0.0))
+        pipe.expire(self.summary_key, self.ttl_seconds)
+
     async def add_trade(self, trade_data):
         try:
-            trade_json = dumps(trade_data)
-            await redis_client.lpush(self.cache_key, trade_json)
-            await redis_client.ltrim(self.cache_key, 0, self.max_trades - 1)
-            await redis_client.expire(self.cache_key, self.ttl_seconds)
-            await self.update_summary(trade_data)
+            async with redis_client.pipeline(transaction=True) as pipe:
+                self.queue_add_trade(pipe, trade_data)
+                await pipe.execute()
         except Exception as e:
             logger_main.error(f"Error adding trade to cache for user {self.user_id}: {str(e)}")
             log_exception(f"Error adding trade to cache: {str(e)}", e)
 
     async def update_summary(self, trade_data):
         try:
-            summary_data = await redis_client.get(self.summary_key)
-            summary = loads(summary_data) if summary_data else {
-                "deposit": 0.0,
-                "trade_count": 0,
-                "pnl": 0.0,
-                "profit": 0.0,
-                "loss": 0.0,
-                "signals": {},
-                "pairs": {}
-            }
-            summary["trade_count"] += 1
-            trade_pnl = trade_data.get("pnl", 0.0)
-            summary["pnl"] += trade_pnl
-            if trade_pnl > 0:
-                summary["profit"] += trade_pnl
-            else:
-                summary["loss"] += abs(trade_pnl)
-            signal = trade_data.get("signals", {}).get("combined_signal", "unknown")
-            pair = trade_data.get("symbol", "unknown")
-            summary["signals"][signal] = summary["signals"].get(signal, 0) + 1
-            summary["pairs"][pair] = summary["pairs"].get(pair, 0) + 1
-            if "deposit" in trade_data:
-                summary["deposit"] = trade_data["deposit"]
-            await redis_client.setex(self.summary_key, self.ttl_seconds, dumps(summary))
+            async with redis_client.pipeline(transaction=True) as pipe:
+                self.queue_update_summary(pipe, trade_data)
+                await pipe.execute()
         except Exception as e:
             logger_main.error(f"Error updating summary for user {self.user_id}: {str(e)}")
             log_exception(f"Error updating summary: {str(e)}", e)
 
     async def get_summary(self):
         try:
-            summary_data = await redis_client.get(self.summary_key)
-            return loads(summary_data) if summary_data else {
-                "deposit": 0.0,
-                "trade_count": 0,
-                "pnl": 0.0,
-                "profit": 0.0,
-                "loss": 0.0,
-                "signals": {},
-                "pairs": {}
-            }
+            fields = await redis_client.hgetall(self.summary_key)
+            summary = empty_summary()
+            for field, value in fields.items():
+                if field == "trade_count":
+                    summary["trade_count"] = int(value)
+                elif field in SUMMARY_TOTAL_FIELDS:
+                    summary[field] = float(value)
+                elif field.startswith("signal:"):
+                    summary["signals"][field[len("signal:"):]] = int(value)
+                elif field.startswith("pair:"):
+                    summary["pairs"][field[len("pair:"):]] = int(value)
+            return summary
         except Exception as e:
             logger_main.error(f"Error fetching summary for user {self.user_id}: {str(e)}")
             log_exception(f"Error fetching summary: {str(e)}", e)
-            return {
-                "deposit": 0.0,
-                "trade_count": 0,
-                "pnl": 0.0,
-                "profit": 0.0,
-                "loss": 0.0,
-                "signals": {},
-                "pairs": {}
-            }
+            return empty_summary()
 
-    async def get_trades(self, limit=1000):
+    async def get_trades(self, limit=None):
+        """Returns the user's most recent trades (newest first) from the per-user trade index"""
         try:
-            trade_jsons = await redis_client.lrange(self.cache_key, 0, limit - 1)
-            return [loads(trade_json) for trade_json in trade_jsons]
+            return await get_user_recent_trades_from_redis(redis_client, self.user_id, limit or self.max_trades)
         except Exception as e:
             logger_main.error(f"Error fetching trades for user {self.user_id}: {str(e)}")
             log_exception(f"Error fetching trades: {str(e)}", e)
             return []
 
-__all__ = ['UserTradeCache']
+__all__ = ['UserTradeCache', 'empty_summary']